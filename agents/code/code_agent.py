@@ -3,6 +3,7 @@ from typing import List, Dict, Any
 from qwen_agent.agents import FnCallAgent
 
 from agents.core.base.agent import QwenBaseAgent
+from agents.core.base.tool_executor import ParallelFnCallAgent
 from agents.core.context.builder import AgentContext
 from agents.core.tools.selector import convert_tool_names_to_instances
 from server import config
@@ -64,7 +65,7 @@ class CodeAgent(QwenBaseAgent):
         Returns:
             FnCallAgent: 配置好的代码助手实例
         """
-        return FnCallAgent(
+        return ParallelFnCallAgent(
             system_message=self.SYSTEM_PROMPT,
             llm=self.get_llm_config(),
             function_list=convert_tool_names_to_instances(self.get_tools(), self.context),
@@ -5,6 +5,7 @@ from typing import Dict, Any, List
 
 from qwen_agent.agents import FnCallAgent
 
+from agents.core.base.tool_executor import ParallelFnCallAgent
 from agents.core.context.builder import AgentContext
 from agents.core.tools.selector import convert_tool_names_to_instances
 
@@ -85,7 +86,7 @@ class QwenBaseAgent(ABC):
         # 使用动态系统提示词
         system_prompt = self.get_system_prompt()
 
-        agent = FnCallAgent(
+        agent = ParallelFnCallAgent(
             system_message=system_prompt,
             llm=llm_config,
             function_list=convert_tool_names_to_instances(self.tools, self.context),
@@ -0,0 +1,299 @@
+"""Asyncio execution path for qwen-agent agents.
+
+qwen-agent only exposes a synchronous ``Agent.run`` generator, so streaming it
+pins one worker thread per conversation for the whole LLM + tool loop. This
+module re-implements the same loop on the event loop:
+
+- LLM calls go through a shared ``openai.AsyncOpenAI`` client: native tool
+  calling when the LLM is configured with ``use_raw_api``, otherwise the same
+  prompt-based function calling (and output parsing) as qwen-agent;
+- message pre-processing reuses the agent's own qwen-agent LLM object;
+- synchronous tools run on a bounded executor only while they execute.
+"""
+
+import asyncio
+import contextvars
+import copy
+import functools
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import openai
+from qwen_agent import Agent
+from qwen_agent.llm import BaseChatModel, ModelServiceError
+from qwen_agent.llm.base import _format_as_text_messages, _truncate_input_messages_roughly
+from qwen_agent.llm.schema import (ASSISTANT, CONTENT, DEFAULT_SYSTEM_MESSAGE, ROLE, SYSTEM, ContentItem,
+                                   FunctionCall, Message)
+from qwen_agent.settings import DEFAULT_MAX_INPUT_TOKENS, MAX_LLM_CALL_PER_RUN
+from qwen_agent.utils.utils import format_as_text_message, has_chinese_messages, merge_generate_cfgs
+
+from agents.core.base.cancellation import current_token
+from agents.core.base.tool_executor import (ToolCall, detect_tool_calls, function_message, is_side_effect_free,
+                                            plan_batches, timeout_result)
+from agents.core.messaging.message_view import with_content
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# qwen-agent 内部使用、不能透传给 OpenAI 接口的生成参数
+_INTERNAL_GENERATE_KEYS = (
+    'lang',
+    'max_input_tokens',
+    'parallel_function_calls',
+    'function_choice',
+    'thought_in_content',
+    'skip_stopword_postproc',
+    'incremental_output',
+    'fncall_prompt_type',
+)
+# OpenAI v1 SDK 不接受、需要通过 extra_body 传递的参数
+_EXTRA_BODY_KEYS = ('top_k', 'repetition_penalty')
+
+_clients: Dict[Tuple[str, str], openai.AsyncOpenAI] = {}
+_tool_executor = ThreadPoolExecutor(max_workers=config.ASYNC_TOOL_WORKERS, thread_name_prefix='async-tool')
+
+
+def get_async_client(base_url: str, api_key: str) -> openai.AsyncOpenAI:
+    """按 (base_url, api_key) 复用进程级 AsyncOpenAI 客户端（共享连接池）"""
+    key = (base_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        client = openai.AsyncOpenAI(base_url=base_url or None, api_key=api_key or 'EMPTY')
+        _clients[key] = client
+    return client
+
+
+def _prepare_request(llm: BaseChatModel,
+                     messages: List[Message],
+                     functions: Optional[List[Dict]],
+                     extra_generate_cfg: Optional[Dict]) -> Tuple[List[Dict], Dict[str, Any], Optional[Dict]]:
+    """
+    复用 qwen-agent 的预处理逻辑（系统消息、截断、多模态格式化），
+    生成 OpenAI chat.completions 的 messages 与参数。
+
+    与 ``llm.chat`` 一致遵循 ``llm.use_raw_api``：为 True 时通过 ``tools`` 字段走原生工具调用；
+    为 False 时由 fncall prompt 把工具写进消息，不发送 ``tools``，此时第三个返回值是
+    ``_postprocess_messages`` 所需的生成参数（原生模式下为 None）。
+    """
+    generate_cfg = merge_generate_cfgs(base_generate_cfg=llm.generate_cfg, new_generate_cfg=extra_generate_cfg)
+    if 'seed' not in generate_cfg:
+        generate_cfg['seed'] = random.randint(a=0, b=2**30)
+    lang = generate_cfg.pop('lang', None) or ('zh' if has_chinese_messages(messages) else 'en')
+
+    if DEFAULT_SYSTEM_MESSAGE and messages[0].role != SYSTEM:
+        messages = [Message(role=SYSTEM, content=DEFAULT_SYSTEM_MESSAGE)] + messages
+
+    max_input_tokens = generate_cfg.pop('max_input_tokens', DEFAULT_MAX_INPUT_TOKENS)
+    if max_input_tokens > 0:
+        messages = _truncate_input_messages_roughly(messages=messages, max_tokens=max_input_tokens)
+
+    use_raw_api = llm.use_raw_api
+    messages = llm._preprocess_messages(messages,
+                                        lang=lang,
+                                        generate_cfg=generate_cfg,
+                                        functions=functions,
+                                        use_raw_api=use_raw_api)
+    if not llm.support_multimodal_input:
+        messages = [format_as_text_message(msg, add_upload_info=False) for msg in messages]
+    oai_messages = llm.convert_messages_to_dicts(messages)
+    for msg in oai_messages:
+        # qwen-agent 只写了 id，OpenAI 协议要求 tool 消息携带 tool_call_id
+        if msg.get('role') == 'tool' and 'tool_call_id' not in msg:
+            msg['tool_call_id'] = msg.get('id')
+
+    postprocess_cfg = None if use_raw_api else copy.deepcopy(generate_cfg)
+    for key in _INTERNAL_GENERATE_KEYS:
+        generate_cfg.pop(key, None)
+    extra_body = {k: generate_cfg.pop(k) for k in _EXTRA_BODY_KEYS if k in generate_cfg}
+    if extra_body:
+        generate_cfg['extra_body'] = extra_body
+    if 'request_timeout' in generate_cfg:
+        generate_cfg['timeout'] = generate_cfg.pop('request_timeout')
+    if functions and use_raw_api:
+        generate_cfg['tools'] = [{'type': 'function', 'function': f} for f in functions]
+    return oai_messages, generate_cfg, postprocess_cfg
+
+
+async def achat(llm: BaseChatModel,
+                messages: List[Message],
+                functions: Optional[List[Dict]] = None,
+                extra_generate_cfg: Optional[Dict] = None) -> AsyncIterator[List[Message]]:
+    """
+    异步流式调用 LLM，语义与 qwen-agent ``llm.chat(stream=True, delta_stream=False)`` 一致：
+    每次 yield 当前累计的完整回复。
+    """
+    oai_messages, generate_cfg, postprocess_cfg = await asyncio.to_thread(
+        _prepare_request, llm, copy.deepcopy(messages), functions, extra_generate_cfg)
+    fncall_mode = bool(functions) and (postprocess_cfg or {}).get('function_choice', 'auto') != 'none'
+    # qwen-agent 的 OAI 模型对象不保留原始地址；所有 Agent 都指向 server.config 中的统一网关
+    client = get_async_client(config.LLM_BASE_URL, config.LLM_API_KEY)
+
+    token = current_token()
+    if token is not None and token.cancelled:
+        metrics.inc("cancel.llm_calls_skipped")
+        token.raise_if_cancelled()
+    try:
+        stream = await client.chat.completions.create(model=llm.model,
+                                                      messages=oai_messages,
+                                                      stream=True,
+                                                      **generate_cfg)
+    except openai.OpenAIError as ex:
+        raise ModelServiceError(exception=ex)
+    if token is not None:
+        token.register_stream(stream, asyncio.get_running_loop())
+
+    full_response = ''
+    full_reasoning_content = ''
+    full_tool_calls: List[Message] = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if getattr(delta, 'reasoning_content', None):
+                full_reasoning_content += delta.reasoning_content
+            if getattr(delta, 'content', None):
+                full_response += delta.content
+            for tc in getattr(delta, 'tool_calls', None) or []:
+                if full_tool_calls and (not tc.id or tc.id == full_tool_calls[-1].extra['function_id']):
+                    if tc.function.name:
+                        full_tool_calls[-1].function_call.name += tc.function.name
+                    if tc.function.arguments:
+                        full_tool_calls[-1].function_call.arguments += tc.function.arguments
+                else:
+                    full_tool_calls.append(
+                        Message(role=ASSISTANT,
+                                content='',
+                                function_call=FunctionCall(name=tc.function.name or '',
+                                                           arguments=tc.function.arguments or ''),
+                                extra={'function_id': tc.id}))
+
+            res: List[Message] = []
+            if full_reasoning_content:
+                res.append(Message(role=ASSISTANT, content='', reasoning_content=full_reasoning_content))
+            if full_response:
+                res.append(Message(role=ASSISTANT, content=full_response))
+            res.extend(copy.deepcopy(full_tool_calls))
+            if res and postprocess_cfg is not None:
+                # prompt 模式：由 fncall prompt 把文本中的工具调用解析为 function_call 消息，并处理停止词
+                res = llm._postprocess_messages(res, fncall_mode=fncall_mode, generate_cfg=postprocess_cfg)
+                if not llm.support_multimodal_output:
+                    res = _format_as_text_messages(messages=res)
+            if res:
+                yield res
+    except openai.OpenAIError as ex:
+        raise ModelServiceError(exception=ex)
+    finally:
+        await stream.close()
+
+
+async def acall_tool(agent: Agent, tool_name: str, tool_args: Union[str, dict], **kwargs) -> Any:
+    """在有界线程池中执行同步工具，事件循环只在工具运行期间让出一个线程"""
+    loop = asyncio.get_running_loop()
+    # 复制上下文，使工具线程能看到当前请求的取消令牌
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_tool_executor,
+                                      functools.partial(ctx.run, agent._call_tool, tool_name, tool_args, **kwargs))
+
+
+async def _acall_with_timeout(agent: Agent, tool_name: str, tool_args: Union[str, dict], **kwargs) -> Any:
+    try:
+        return await asyncio.wait_for(acall_tool(agent, tool_name, tool_args, **kwargs),
+                                      config.TOOL_CALL_TIMEOUT or None)
+    except asyncio.TimeoutError:
+        return timeout_result(tool_name)
+
+
+async def arun_tool_calls(agent: Agent, calls: Sequence[ToolCall], **kwargs) -> AsyncIterator[Tuple[int, Any]]:
+    """``tool_executor.run_tool_calls`` 的异步版本：同一批的无副作用调用并发执行，按调用顺序产出结果"""
+    token = current_token()
+    if token is not None and token.speculative:
+        # 推测执行：先等路由确认再把调用交给工具线程池，等待不计入超时
+        await token.await_confirmed()
+    for batch in plan_batches(agent, calls):
+        if len(batch) == 1 and not is_side_effect_free(agent, calls[batch[0]][0]):
+            tool_name, tool_args = calls[batch[0]]
+            metrics.inc('tools.calls', mode='serial')
+            yield batch[0], await acall_tool(agent, tool_name, tool_args, **kwargs)
+            continue
+        tasks = [asyncio.ensure_future(_acall_with_timeout(agent, *calls[idx], **kwargs)) for idx in batch]
+        metrics.inc('tools.calls', len(batch), mode='parallel')
+        try:
+            for idx, task in zip(batch, tasks):
+                yield idx, await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def arun_fncall(agent: Agent, messages: List[Message], lang: str = 'en',
+                      **kwargs) -> AsyncIterator[List[Message]]:
+    """FnCallAgent._run 的异步版本：LLM -> 工具 -> LLM 循环"""
+    messages = list(messages)
+    num_llm_calls_available = MAX_LLM_CALL_PER_RUN
+    response: List[Message] = []
+    functions = [func.function for func in agent.function_map.values()]
+    while num_llm_calls_available > 0:
+        num_llm_calls_available -= 1
+
+        extra_generate_cfg = merge_generate_cfgs(base_generate_cfg=agent.extra_generate_cfg,
+                                                 new_generate_cfg={'lang': lang})
+        if kwargs.get('seed') is not None:
+            extra_generate_cfg['seed'] = kwargs['seed']
+        output: List[Message] = []
+        async for output in achat(agent.llm, messages, functions=functions, extra_generate_cfg=extra_generate_cfg):
+            if output:
+                yield response + output
+        if not output:
+            break
+        response.extend(output)
+        messages.extend(output)
+        calls, function_ids = detect_tool_calls(agent, output)
+        if not calls:
+            break
+        token = current_token()
+        if token is not None and token.cancelled:
+            metrics.inc("cancel.tools_skipped", tool=calls[0][0])
+            token.raise_if_cancelled()
+        async for idx, tool_result in arun_tool_calls(agent, calls, messages=list(messages), **kwargs):
+            fn_msg = function_message(calls[idx][0], tool_result, function_ids[idx])
+            messages.append(fn_msg)
+            response.append(fn_msg)
+            yield response
+    yield response
+
+
+async def arun(agent: Agent, messages: List[Union[Dict, Message]], **kwargs) -> AsyncIterator[List[Any]]:
+    """
+    Agent.run 的异步版本：统一消息类型、补系统消息，并为回复补上 agent 名称。
+    定义了 ``_arun`` 的 Agent（如路由器）使用自身实现，其余按 FnCallAgent 处理。
+    """
+    # 不整体深拷贝历史：下游只追加消息，唯一会改写的首条 system 消息按需复制
+    return_dict = bool(messages) and all(isinstance(m, dict) for m in messages)
+    new_messages = [Message(**m) if isinstance(m, dict) else m for m in messages]
+
+    if 'lang' not in kwargs:
+        kwargs['lang'] = 'zh' if has_chinese_messages(new_messages) else 'en'
+
+    if agent.system_message:
+        if not new_messages or new_messages[0][ROLE] != SYSTEM:
+            new_messages.insert(0, Message(role=SYSTEM, content=agent.system_message))
+        elif isinstance(new_messages[0][CONTENT], str):
+            new_messages[0] = with_content(new_messages[0], agent.system_message + '\n\n' + new_messages[0][CONTENT])
+        else:
+            new_messages[0] = with_content(new_messages[0],
+                                           [ContentItem(text=agent.system_message + '\n\n')] + new_messages[0][CONTENT])
+
+    impl = getattr(agent, '_arun', None)
+    stream = impl(new_messages, **kwargs) if impl else arun_fncall(agent, new_messages, **kwargs)
+    async for rsp in stream:
+        for msg in rsp:
+            if not msg.name and agent.name:
+                msg.name = agent.name
+        if return_dict:
+            yield [m.model_dump() if not isinstance(m, dict) else m for m in rsp]
+        else:
+            yield [Message(**m) if isinstance(m, dict) else m for m in rsp]
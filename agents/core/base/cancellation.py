@@ -0,0 +1,213 @@
+"""Per-request cancellation that reaches into running LLM streams and tool loops.
+
+客户端断开后，StreamingResponse 不再消费事件，但 qwen-agent 的同步生成器仍会把
+当前 LLM 请求读完、继续执行后续工具。``CancellationToken`` 通过 contextvar 绑定到
+正在执行 Agent 的线程/任务上：
+
+- 取消时关闭已登记的 LLM HTTP 流（上游随即停止生成）；
+- 之后的 LLM 调用与工具调用在开始前直接跳过。
+
+推测执行（speculative）使用子令牌：父令牌取消时级联取消；在 ``confirm()`` 之前
+工具调用会在 ``wait_confirmed()``（协程中为 ``await_confirmed()``）处等待，
+避免未确认的推测执行产生副作用。
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from typing import Any, List, Optional, Tuple
+
+from qwen_agent import Agent
+
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_current_token: contextvars.ContextVar[Optional["CancellationToken"]] = contextvars.ContextVar(
+    "cancellation_token", default=None)
+
+
+class RequestCancelled(Exception):
+    """请求已被取消（客户端断开等），用于中止 Agent 执行"""
+
+
+class CancellationToken:
+    """单个请求的取消信号，线程安全"""
+
+    def __init__(self, task_id: str = "", parent: Optional["CancellationToken"] = None, speculative: bool = False):
+        self.task_id = task_id
+        self.parent = parent
+        self.speculative = speculative
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._confirmed = threading.Event()
+        if not speculative:
+            self._confirmed.set()
+        self._lock = threading.Lock()
+        self._streams: List[Tuple[Any, Optional[asyncio.AbstractEventLoop]]] = []
+        self._children: List["CancellationToken"] = []
+        # 在事件循环上等待确认的 future
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+
+    def child(self, speculative: bool = True) -> "CancellationToken":
+        """派生子令牌：父令牌取消时子令牌随之取消，子令牌取消不影响父令牌"""
+        token = CancellationToken(self.task_id, parent=self, speculative=speculative)
+        with self._lock:
+            if not self._event.is_set():
+                self._children.append(token)
+                return token
+        token.cancel(self.reason or "cancelled")
+        return token
+
+    def confirm(self) -> None:
+        """确认推测执行有效，放行等待中的工具调用"""
+        with self._lock:
+            self._confirmed.set()
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+
+    def wait_confirmed(self) -> None:
+        """推测执行的工具调用在此等待确认；期间被取消则抛出 RequestCancelled"""
+        self._confirmed.wait()
+        self.raise_if_cancelled()
+
+    async def await_confirmed(self) -> None:
+        """``wait_confirmed`` 的协程版本：等待期间不占用线程"""
+        if not self._confirmed.is_set():
+            loop = asyncio.get_running_loop()
+            future: "asyncio.Future[None]" = loop.create_future()
+            with self._lock:
+                if self._confirmed.is_set():
+                    future.set_result(None)
+                else:
+                    self._waiters.append((loop, future))
+            await future
+        self.raise_if_cancelled()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "client_disconnect") -> None:
+        """标记取消并关闭所有已登记的 LLM 流（幂等）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            self._confirmed.set()
+            streams, self._streams = self._streams, []
+            children, self._children = self._children, []
+            waiters, self._waiters = self._waiters, []
+        if self.parent is None and not self.speculative:
+            metrics.inc("cancel.requests", reason=reason)
+        logger.info("Request cancelled, task_id: %s, reason: %s", self.task_id, reason)
+        for stream, loop in streams:
+            self._close(stream, loop)
+        for child in children:
+            child.cancel(reason)
+        self._wake(waiters)
+
+    def register_stream(self, stream: Any, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        登记一个可 close() 的 LLM 流；已取消时立即关闭。
+        异步流（AsyncStream）需同时传入其所属事件循环，关闭操作会被调度到该循环上。
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._streams.append((stream, loop))
+                return
+        self._close(stream, loop)
+
+    @staticmethod
+    def _wake(waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]]) -> None:
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _close(self, stream: Any, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        response = getattr(stream, "response", None)
+        if getattr(response, "is_closed", False):
+            # 已经读完的流（如路由器的那次调用）无需中止
+            return
+        try:
+            if loop is not None:
+                asyncio.run_coroutine_threadsafe(stream.close(), loop)
+            else:
+                stream.close()
+            metrics.inc("cancel.llm_streams_aborted")
+        except Exception as e:
+            logger.debug("Failed to close LLM stream, task_id: %s, error: %s", self.task_id, e)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise RequestCancelled(self.reason or "cancelled")
+
+
+def current_token() -> Optional[CancellationToken]:
+    """当前线程/任务绑定的取消令牌"""
+    return _current_token.get()
+
+
+def bind_token(token: Optional[CancellationToken]) -> None:
+    """把取消令牌绑定到当前上下文（生成器每一步执行前调用）"""
+    _current_token.set(token)
+
+
+def _guard_llm(llm: Any) -> None:
+    create = getattr(llm, "_chat_complete_create", None)
+    if create is None or getattr(create, "_cancellable", False):
+        return
+
+    def _chat_complete_create(*args, **kwargs):
+        token = current_token()
+        if token is not None and token.cancelled:
+            metrics.inc("cancel.llm_calls_skipped")
+            token.raise_if_cancelled()
+        response = create(*args, **kwargs)
+        if token is not None and kwargs.get("stream") and hasattr(response, "close"):
+            token.register_stream(response)
+        return response
+
+    _chat_complete_create._cancellable = True
+    llm._chat_complete_create = _chat_complete_create
+
+
+def _agents_in(obj: Any) -> List[Agent]:
+    found: List[Agent] = []
+    for value in getattr(obj, "__dict__", {}).values():
+        if isinstance(value, dict):
+            value = list(value.values())
+        if isinstance(value, list):
+            found.extend(v for v in value if isinstance(v, Agent))
+        elif isinstance(value, Agent):
+            found.append(value)
+    return found
+
+
+def graph_llms(root: Agent) -> List[Any]:
+    """遍历 Agent 图（路由器、子 Agent、持有子 Agent 的工具如 AgentCallTool），返回其中的模型对象"""
+    llms: List[Any] = []
+    seen = set()
+    pending: List[Agent] = [root]
+    while pending:
+        agent = pending.pop()
+        if id(agent) in seen:
+            continue
+        seen.add(id(agent))
+        if agent.llm is not None:
+            llms.append(agent.llm)
+        pending.extend(_agents_in(agent))
+        for tool in getattr(agent, "function_map", {}).values():
+            pending.extend(_agents_in(tool))
+    return llms
+
+
+def install_cancellation_hooks(root: Agent) -> None:
+    """为 Agent 图中每个 qwen-agent OAI 模型对象挂上取消检查与流登记"""
+    for llm in graph_llms(root):
+        _guard_llm(llm)
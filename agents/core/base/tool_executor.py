@@ -0,0 +1,152 @@
+"""Concurrent execution of the tool calls emitted in one agent step.
+
+LLM 在一轮中可能同时发出多个函数调用（如三个城市的天气 + 加密货币价格），
+FnCallAgent 会逐个串行执行，整轮耗时是各调用之和。这里按工具声明分批执行：
+
+- 声明了 ``side_effect_free = True`` 的工具（见 ``QwenAgentBaseTool``）可以并行，
+  相邻的可并行调用在有界线程池中同时执行，整轮耗时接近最慢的那一个；
+- 其余工具（如 send_email、调用子 Agent 的工具、未声明的内置工具）串行执行，
+  并作为屏障：之前的调用全部完成后才开始，完成后才继续后面的调用；
+- 结果按调用顺序产出；一批并行调用提交 ``TOOL_CALL_TIMEOUT`` 秒后仍未完成的以超时错误作为结果
+  （线程中的工具无法被中断，会在后台运行结束）。串行工具在调用线程中执行、不设超时，
+  有副作用的操作不会在中途被放弃。
+"""
+
+import contextvars
+import json
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+from qwen_agent import Agent
+from qwen_agent.agents import FnCallAgent
+from qwen_agent.llm.schema import FUNCTION, Message
+from qwen_agent.settings import MAX_LLM_CALL_PER_RUN
+
+from agents.core.base.cancellation import CancellationToken, current_token
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ToolCall = Tuple[str, Union[str, dict]]
+
+_executor = ThreadPoolExecutor(max_workers=config.TOOL_PARALLEL_WORKERS, thread_name_prefix='tool')
+
+
+def is_side_effect_free(agent: Agent, tool_name: str) -> bool:
+    """工具是否声明为无副作用（可与同一轮的其他调用并行）"""
+    return bool(getattr(agent.function_map.get(tool_name), 'side_effect_free', False))
+
+
+def plan_batches(agent: Agent, calls: Sequence[ToolCall]) -> List[List[int]]:
+    """把调用按顺序切分为批次：相邻的无副作用调用合为一批，其余调用各自单独一批"""
+    batches: List[List[int]] = []
+    parallel = False
+    for idx, (tool_name, _) in enumerate(calls):
+        safe = config.TOOL_PARALLEL_WORKERS > 1 and is_side_effect_free(agent, tool_name)
+        if safe and parallel:
+            batches[-1].append(idx)
+        else:
+            batches.append([idx])
+        parallel = safe
+    return batches
+
+
+def timeout_result(tool_name: str) -> str:
+    """并行调用超时时作为结果返回给模型的错误"""
+    metrics.inc('tools.timeouts', tool=tool_name)
+    logger.warning('Tool %s timed out after %ss', tool_name, config.TOOL_CALL_TIMEOUT)
+    return json.dumps({'error': f'tool {tool_name} timed out after {config.TOOL_CALL_TIMEOUT}s'},
+                      ensure_ascii=False)
+
+
+def _wait_for_route(token: Optional[CancellationToken]) -> None:
+    """
+    推测执行的调用先在当前线程等路由确认（或取消），再提交到线程池：
+    等待期间不占用共享的工具线程，也不计入批次的超时
+    """
+    if token is not None and token.speculative:
+        token.wait_confirmed()
+
+
+def run_tool_calls(agent: Agent, calls: Sequence[ToolCall], **kwargs) -> Iterator[Tuple[int, Any]]:
+    """执行一轮中的全部工具调用，按调用顺序产出 (序号, 结果)"""
+    _wait_for_route(current_token())
+    timeout = config.TOOL_CALL_TIMEOUT or None
+    for batch in plan_batches(agent, calls):
+        if len(batch) == 1 and not is_side_effect_free(agent, calls[batch[0]][0]):
+            tool_name, tool_args = calls[batch[0]]
+            metrics.inc('tools.calls', mode='serial')
+            yield batch[0], agent._call_tool(tool_name, tool_args, **kwargs)
+            continue
+        # 每个调用一份上下文副本，工具线程能看到当前请求的取消令牌
+        futures: List[Future] = [
+            _executor.submit(contextvars.copy_context().run, agent._call_tool, *calls[idx], **kwargs)
+            for idx in batch
+        ]
+        metrics.inc('tools.calls', len(batch), mode='parallel')
+        # 超时从整批提交时算起：按顺序等待时，后面的调用不能再各自获得一个完整的超时
+        deadline = time.monotonic() + timeout if timeout else None
+        for idx, future in zip(batch, futures):
+            try:
+                remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+                result = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                result = timeout_result(calls[idx][0])
+            yield idx, result
+
+
+def detect_tool_calls(agent: Agent, output: Sequence[Message]) -> Tuple[List[ToolCall], List[str]]:
+    """提取一次 LLM 输出中的全部工具调用及其 function_id"""
+    calls: List[ToolCall] = []
+    function_ids: List[str] = []
+    for out in output:
+        use_tool, tool_name, tool_args, _ = agent._detect_tool(out)
+        if use_tool:
+            calls.append((tool_name, tool_args))
+            function_ids.append(out.extra.get('function_id', '1') if out.extra else '1')
+    return calls, function_ids
+
+
+def function_message(tool_name: str, tool_result: Any, function_id: str) -> Message:
+    """工具结果消息"""
+    return Message(role=FUNCTION, name=tool_name, content=tool_result, extra={'function_id': function_id})
+
+
+class ParallelFnCallAgent(FnCallAgent):
+    """FnCallAgent 的 LLM -> 工具 -> LLM 循环，同一轮的多个工具调用按 ``run_tool_calls`` 分批并行"""
+
+    def _run(self, messages: List[Message], lang: str = 'en', **kwargs) -> Iterator[List[Message]]:
+        messages = list(messages)
+        num_llm_calls_available = MAX_LLM_CALL_PER_RUN
+        response: List[Message] = []
+        while num_llm_calls_available > 0:
+            num_llm_calls_available -= 1
+
+            extra_generate_cfg = {'lang': lang}
+            if kwargs.get('seed') is not None:
+                extra_generate_cfg['seed'] = kwargs['seed']
+            output_stream = self._call_llm(messages=messages,
+                                           functions=[func.function for func in self.function_map.values()],
+                                           extra_generate_cfg=extra_generate_cfg)
+            output: List[Message] = []
+            for output in output_stream:
+                if output:
+                    yield response + output
+            if not output:
+                break
+            response.extend(output)
+            messages.extend(output)
+            calls, function_ids = detect_tool_calls(self, output)
+            if not calls:
+                break
+            # 工具看到的是本轮调用前的历史快照，并行执行期间追加的结果不影响它们
+            for idx, tool_result in run_tool_calls(self, calls, messages=list(messages), **kwargs):
+                fn_msg = function_message(calls[idx][0], tool_result, function_ids[idx])
+                messages.append(fn_msg)
+                response.append(fn_msg)
+                yield response
+        yield response
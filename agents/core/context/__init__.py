@@ -1,5 +1,22 @@
 """Context helpers for agents."""
 
 from agents.core.context.builder import AgentContext, QwenAgentContextBuilder
+from agents.core.context.compaction import (ContextSummarizer, agent_budget, context_summarizer, fit_to_budget,
+                                            with_summary)
+from agents.core.context.tokens import (cached_count_tokens, compact_content, content_text, history_tokens,
+                                        message_tokens)
 
-__all__ = ["AgentContext", "QwenAgentContextBuilder"]
+__all__ = [
+    "AgentContext",
+    "QwenAgentContextBuilder",
+    "ContextSummarizer",
+    "agent_budget",
+    "context_summarizer",
+    "fit_to_budget",
+    "with_summary",
+    "cached_count_tokens",
+    "compact_content",
+    "content_text",
+    "history_tokens",
+    "message_tokens",
+]
@@ -3,7 +3,8 @@ from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, field_validator
 
 from agents.core.messaging.chat_request import ChatRequest
-from agents.core.messaging.request_helper import extract_files_from_request, extract_images_from_request
+from agents.core.messaging.request_helper import RequestAnalysis
+from agents.core.messaging.session_store import Session
 
 
 class AgentContext(BaseModel):
@@ -31,14 +32,22 @@ class QwenAgentContextBuilder:
     """Qwen智能体上下文构建器"""
 
     @staticmethod
-    def buildContext(request: ChatRequest, qa_messages: List[Dict[str, Any]]) -> AgentContext:
+    def buildContext(request: ChatRequest, qa_messages: List[Dict[str, Any]],
+                     session: Optional[Session] = None,
+                     analysis: Optional[RequestAnalysis] = None) -> AgentContext:
         """构建智能体上下文
+
+        带会话时使用会话中累计的文件/图片（追加请求只携带本轮新增的附件），
+        否则使用请求解析结果中的文件/图片（未传入时重新解析请求）
         """
         # 从 file_list 中提取 URL 列表
 
         # 2) 组装服务端上下文
-        file_list = extract_files_from_request(request)
-        image_list = extract_images_from_request(request)
+        if session is not None:
+            file_list, image_list = list(session.files), list(session.images)
+        else:
+            analysis = analysis or RequestAnalysis(request)
+            file_list, image_list = analysis.files, analysis.images
 
         extracted_file_urls = []
         if file_list and isinstance(file_list, list) and len(file_list) > 0 and isinstance(file_list[0], dict):
@@ -0,0 +1,222 @@
+"""Per-agent input budgets and rolling summaries for long conversations.
+
+长会话的每次请求都会把完整历史交给子 Agent，再由 qwen-agent 按 ``max_input_tokens``
+对整段历史重新分词、截断，prefill 随会话长度线性增长。这里在消息转换与 Agent 执行之间
+加一层上下文管理：
+
+- 每条消息的 token 数按内容哈希缓存（见 ``tokens.cached_count_tokens``），历史消息只分词一次；
+- 子 Agent 执行前按各自的预算从头部按整轮丢弃历史（Router 的预算见 ``router_context``）；
+- 会话中未摘要的历史超过阈值时，在回复完成后由后台线程把较早的轮次折叠进滚动摘要，
+  后续请求用“摘要 + 最近几轮原文”代替完整历史。
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from qwen_agent.llm import get_chat_model
+from qwen_agent.llm.schema import ASSISTANT, SYSTEM, USER, Message
+
+from agents.core.context.tokens import (cached_count_tokens, compact_content, content_text, history_tokens,
+                                        message_tokens)
+from agents.core.messaging.message_view import message_field, prefix_text
+from agents.core.messaging.session_store import SessionStore, session_store
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = '''
+你负责压缩多轮对话的早期历史。根据“已有摘要”和“新增对话”输出一份更新后的摘要：
+保留用户的目标、偏好、已确认的事实与结论、未完成的事项，以及涉及的文件/图片；
+省略寒暄与重复内容，不编造信息；直接输出摘要正文。
+'''
+# 摘要注入到首条保留消息前的格式
+SUMMARY_PREFIX = "【此前对话摘要】\n{summary}\n\n"
+# 携带摘要前缀的消息在 extra 中记录摘要原文，按预算裁剪历史时据此把摘要移到首条保留的消息上
+SUMMARY_EXTRA_KEY = "context_summary"
+# 送入摘要模型时单条消息保留的最大字符数
+_MAX_MESSAGE_CHARS = 2000
+
+
+def parse_budgets(spec: str) -> Dict[str, int]:
+    """解析 "多模态助手=8000,规划助手=16000" 形式的按 Agent 预算配置"""
+    budgets: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        key, sep, value = item.strip().partition("=")
+        if sep and key.strip() and value.strip().isdigit():
+            budgets[key.strip()] = int(value)
+    return budgets
+
+
+_agent_budgets = parse_budgets(config.CONTEXT_AGENT_TOKENS)
+
+
+def agent_budget(agent_name: Optional[str]) -> int:
+    """子 Agent 的输入 token 预算（0 表示不限制）"""
+    return _agent_budgets.get(agent_name or "", config.CONTEXT_MAX_TOKENS)
+
+
+def fit_to_budget(messages: Sequence[Any], max_tokens: int) -> List[Any]:
+    """
+    从头部按整轮丢弃历史，使消息总 token 数不超过预算；开头的 system 消息与最后一轮始终保留，
+    保留部分从 user 消息开始。滚动摘要（见 ``with_summary``）始终保留：其 token 数预先计入，
+    首条消息被丢弃时摘要移到首条保留的消息上。返回新列表，不修改原消息。
+    """
+    if max_tokens <= 0:
+        return list(messages)
+    head = 0
+    while head < len(messages) and message_field(messages[head], "role") == SYSTEM:
+        head += 1
+    used = history_tokens(messages[:head])
+    body = messages[head:]
+    summary = _summary_of(body[0]) if body else None
+    summary_tokens = cached_count_tokens(SUMMARY_PREFIX.format(summary=summary)) if summary else 0
+    used += summary_tokens
+
+    cut = len(body)
+    for idx in range(len(body) - 1, -1, -1):
+        tokens = message_tokens(body[idx])
+        # 首条消息的 token 数包含摘要前缀，摘要已单独计入
+        used += max(0, tokens - summary_tokens) if idx == 0 else tokens
+        if message_field(body[idx], "role") != USER:
+            continue
+        if used > max_tokens and cut < len(body):
+            break
+        cut = idx
+    if cut == len(body):
+        cut = 0
+    kept_body = list(body[cut:])
+    if cut:
+        metrics.inc("context.dropped_messages", cut)
+        if summary:
+            kept_body[0] = _attach_summary(kept_body[0], summary)
+    kept = list(messages[:head]) + kept_body
+    metrics.observe("context.input_tokens", history_tokens(kept))
+    return kept
+
+
+def with_summary(messages: Sequence[Any], summary: Optional[str]) -> List[Any]:
+    """把滚动摘要作为前缀加到首条消息的文本上（叠加视图，不修改原消息）"""
+    if not summary or not messages:
+        return list(messages)
+    return [_attach_summary(messages[0], summary)] + list(messages[1:])
+
+
+def _attach_summary(message: Any, summary: str) -> Any:
+    prefixed = prefix_text(message, SUMMARY_PREFIX.format(summary=summary))
+    if prefixed is message:
+        # 没有文本可加前缀（如纯图片消息）
+        return message
+    extra = {**(message_field(message, "extra") or {}), SUMMARY_EXTRA_KEY: summary}
+    if isinstance(prefixed, dict):
+        return {**prefixed, "extra": extra}
+    return prefixed.model_copy(update={"extra": extra})
+
+
+def _summary_of(message: Any) -> Optional[str]:
+    return (message_field(message, "extra") or {}).get(SUMMARY_EXTRA_KEY)
+
+
+def _render(summary: Optional[str], messages: Sequence[Any]) -> str:
+    lines = [f"已有摘要：\n{summary or '（无）'}", "新增对话："]
+    for message in messages:
+        role = message_field(message, "role")
+        speaker = "用户" if role == USER else (message_field(message, "name") or "助手") if role == ASSISTANT else role
+        text = content_text(compact_content(message_field(message, "content")))
+        if len(text) > _MAX_MESSAGE_CHARS:
+            text = text[:_MAX_MESSAGE_CHARS] + "…"
+        lines.append(f"{speaker}：{text}")
+    return "\n".join(lines)
+
+
+class ContextSummarizer:
+    """
+    会话滚动摘要：回复完成后检查未摘要的历史，超过 ``trigger_tokens`` 时在后台线程把
+    除最近 ``keep_turns`` 轮之外的消息与已有摘要合并成新摘要，写回会话存储。
+    同一会话同时只有一个摘要任务，失败时保持原状（下一轮完成后重试）。
+    """
+
+    def __init__(self,
+                 store: SessionStore,
+                 trigger_tokens: int,
+                 keep_turns: int,
+                 workers: int,
+                 llm_cfg: Dict[str, Any]):
+        self.store = store
+        self.trigger_tokens = trigger_tokens
+        self.keep_turns = max(1, keep_turns)
+        self._llm_cfg = llm_cfg
+        self._llm = None
+        self._lock = threading.Lock()
+        self._pending: set = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = max(1, workers)
+
+    @property
+    def enabled(self) -> bool:
+        return self.trigger_tokens > 0 and self.store.enabled
+
+    def schedule(self, session_id: str) -> None:
+        """回复完成后调用：未摘要的历史超过阈值时提交后台摘要任务"""
+        if not self.enabled or not session_id:
+            return
+        snapshot = self.store.unsummarized(session_id)
+        if snapshot is None:
+            return
+        summary, start_seq, messages = snapshot
+        users = [i for i, m in enumerate(messages) if message_field(m, "role") == USER]
+        if len(users) <= self.keep_turns or history_tokens(messages) < self.trigger_tokens:
+            return
+        cut = users[-self.keep_turns]
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="context-summary")
+        self._executor.submit(self._summarize, session_id, summary, start_seq + cut, messages[:cut])
+
+    def _summarize(self, session_id: str, summary: Optional[str], upto_seq: int, messages: List[Any]) -> None:
+        start = time.perf_counter()
+        try:
+            updated = self._complete(_render(summary, messages))
+            if updated and self.store.set_summary(session_id, updated, upto_seq):
+                metrics.inc("context.summaries", outcome="ok")
+                metrics.inc("context.summarized_messages", len(messages))
+            else:
+                metrics.inc("context.summaries", outcome="skipped")
+        except Exception as e:
+            metrics.inc("context.summaries", outcome="error")
+            logger.warning("Context summary failed for session %s: %s", session_id, e)
+        finally:
+            metrics.observe("context.summary_seconds", time.perf_counter() - start)
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def _complete(self, text: str) -> str:
+        if self._llm is None:
+            self._llm = get_chat_model(self._llm_cfg)
+        responses: List[Message] = []
+        for responses in self._llm.chat(messages=[Message(role=SYSTEM, content=SUMMARY_PROMPT),
+                                                  Message(role=USER, content=text)],
+                                        stream=True):
+            pass
+        return content_text(responses[-1].content).strip() if responses else ""
+
+
+context_summarizer = ContextSummarizer(
+    store=session_store,
+    trigger_tokens=config.CONTEXT_SUMMARY_TRIGGER_TOKENS,
+    keep_turns=config.CONTEXT_SUMMARY_KEEP_TURNS,
+    workers=config.CONTEXT_SUMMARY_WORKERS,
+    llm_cfg={
+        "model": config.CONTEXT_SUMMARY_MODEL,
+        "model_type": config.LLM_PROVIDER,
+        "model_server": config.LLM_BASE_URL,
+        "api_key": config.LLM_API_KEY,
+        "generate_cfg": {"max_tokens": config.CONTEXT_SUMMARY_MAX_TOKENS},
+    },
+)
@@ -0,0 +1,88 @@
+"""Cached token counting for conversation text."""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Sequence
+
+from qwen_agent.utils.tokenization_qwen import count_tokens, tokenizer
+
+from agents.core.messaging.message_view import message_field
+from server import config
+
+_PLACEHOLDERS = {"image": "[图片]", "audio": "[音频]", "video": "[视频]"}
+
+# 文本的 16 字节 blake2b 摘要 -> token 数；只保存摘要与整数，不让缓存长期持有消息正文
+_token_counts: "OrderedDict[bytes, int]" = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def cached_count_tokens(text: str) -> int:
+    """按文本内容哈希缓存 token 数：历史消息在多轮请求中反复出现，只需分词一次"""
+    if not text:
+        return 0
+    if config.TOKEN_COUNT_CACHE_SIZE <= 0:
+        return count_tokens(text)
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = count_tokens(text)
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > config.TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """按 token 截断文本（分词后取前 ``max_tokens`` 个再还原），未超出时原样返回"""
+    if max_tokens <= 0:
+        return ""
+    if cached_count_tokens(text) <= max_tokens:
+        return text
+    return tokenizer.truncate(text, max_tokens)
+
+
+def content_text(content: Any) -> str:
+    """提取 content 中的文本部分（str 或富文本列表中的 text 项）"""
+    if isinstance(content, str):
+        return content
+    texts = []
+    for item in content or []:
+        text = item.get("text") if isinstance(item, dict) else getattr(item, "text", None)
+        if text:
+            texts.append(text)
+    return "\n".join(texts)
+
+
+def compact_content(content: Any) -> Any:
+    """富文本内容压缩为纯文本：保留 text 项，其余内容项替换为占位符"""
+    if not isinstance(content, list):
+        return content
+    parts = []
+    for item in content:
+        for kind in ("text", "image", "file", "audio", "video"):
+            value = message_field(item, kind)
+            if value is None:
+                continue
+            if kind == "text":
+                parts.append(value)
+            elif kind == "file":
+                parts.append(f"[文件: {os.path.basename(str(value).split('?', 1)[0])}]")
+            else:
+                parts.append(_PLACEHOLDERS[kind])
+            break
+    return "\n".join(parts)
+
+
+def message_tokens(message: Any) -> int:
+    """压缩后消息文本的 token 数（带缓存）"""
+    return cached_count_tokens(content_text(compact_content(message_field(message, "content"))))
+
+
+def history_tokens(messages: Sequence[Any]) -> int:
+    return sum(message_tokens(m) for m in messages)
@@ -1,18 +1,42 @@
 """Messaging schemas and helpers."""
 
+from agents.core.messaging.blob_store import BlobStore, blob_store, is_blob_ref, resolve_blob_refs
 from agents.core.messaging.chat_request import ChatRequest, Message
-from agents.core.messaging.chat_response import ChatResponse
+from agents.core.messaging.chat_response import ChatCompletion, ChatResponse
+from agents.core.messaging.image_preprocess import ImagePreprocessor, image_preprocessor, preprocess_image
+from agents.core.messaging.message_view import prefix_text, with_content, without_leading_system
 from agents.core.messaging.request_helper import (
+    RequestAnalysis,
+    append_normalized,
     convert_chat_request_to_messages,
+    convert_messages,
     extract_files_from_request,
     extract_images_from_request,
 )
+from agents.core.messaging.session_store import SessionNotFound, SessionStore, session_store
 
 __all__ = [
+    "BlobStore",
+    "ChatCompletion",
     "ChatRequest",
     "ChatResponse",
+    "ImagePreprocessor",
     "Message",
+    "RequestAnalysis",
+    "SessionNotFound",
+    "SessionStore",
+    "append_normalized",
+    "blob_store",
     "convert_chat_request_to_messages",
+    "convert_messages",
     "extract_files_from_request",
     "extract_images_from_request",
+    "image_preprocessor",
+    "is_blob_ref",
+    "prefix_text",
+    "preprocess_image",
+    "resolve_blob_refs",
+    "session_store",
+    "with_content",
+    "without_leading_system",
 ]
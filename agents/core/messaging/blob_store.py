@@ -0,0 +1,307 @@
+"""Content-addressed storage for inline images and files.
+
+多模态请求把 base64 图片直接放在 ``messages[i].content`` 里，这段数据会随请求解析、日志、
+会话历史与后续每一轮请求反复出现。这里把它们按 sha256 存到本地磁盘，消息中只保留
+``blob://<sha256>`` 引用：
+
+- 客户端可以先 ``POST /v1/blobs`` 上传，消息中直接发送引用；仍发送 inline ``data:`` URI 的请求
+  在解析时由 request_helper 换成引用；
+- 引用只在构建多模态模型调用时（``convert_messages_to_dicts``）才解析回 data URI；
+- 磁盘占用超过上限时按最近使用时间淘汰；
+- 只接受白名单内的 MIME 类型（位图图片、常见文档与音视频），SVG/HTML 等可执行脚本的类型一律拒绝。
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agents.core.messaging.message_view import message_field, with_content
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BLOB_SCHEME = "blob://"
+# 构建模型调用时需要解析为 data URI 的内容项
+_MEDIA_KEYS = ("image", "video", "audio")
+_MIME_PATTERN = re.compile(r"[a-z0-9][a-z0-9.+-]{0,62}/[a-z0-9][a-z0-9.+-]{0,126}")
+# 可以按原类型内联展示的位图图片
+RASTER_IMAGE_TYPES = frozenset({
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/bmp", "image/tiff", "image/heic", "image/heif",
+})
+ALLOWED_MIME_TYPES = RASTER_IMAGE_TYPES | frozenset({
+    "application/octet-stream",
+    "application/pdf",
+    "application/json",
+    "application/zip",
+    "application/msword",
+    "application/vnd.ms-excel",
+    "application/vnd.ms-powerpoint",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "text/plain",
+    "text/markdown",
+    "text/csv",
+    "audio/mpeg",
+    "audio/wav",
+    "audio/mp4",
+    "audio/ogg",
+    "video/mp4",
+    "video/webm",
+    "video/quicktime",
+})
+
+
+class UnsupportedMediaType(ValueError):
+    """MIME 类型不合法或不在白名单内"""
+
+
+def normalize_mime_type(mime_type: Optional[str]) -> str:
+    """去掉参数并转小写；不是严格的 ``type/subtype`` 或不在白名单内时抛出 UnsupportedMediaType"""
+    value = (mime_type or "application/octet-stream").split(";", 1)[0].strip().lower()
+    if not _MIME_PATTERN.fullmatch(value) or value not in ALLOWED_MIME_TYPES:
+        raise UnsupportedMediaType(value[:100])
+    return value
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(BLOB_SCHEME)
+
+
+def blob_id(ref: str) -> str:
+    return ref[len(BLOB_SCHEME):]
+
+
+class BlobStore:
+    """
+    按内容寻址的 blob 存储：文件名为 ``<sha256>.<mime>``（mime 中的 ``/`` 替换为 ``_``），
+    进程内维护按最近使用排序的索引，总字节数超过 ``max_bytes`` 时淘汰最久未用的 blob。
+    读取时通过 mmap 直接编码，不额外复制一份原始字节。
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # sha256 -> (size, mime)
+        self._index: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._bytes = 0
+        if self.enabled:
+            self._scan()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def put(self, data: bytes, mime_type: str = "application/octet-stream") -> str:
+        """保存内容并返回 ``blob://<sha256>``；相同内容只保存一份，MIME 类型不受支持时抛出 UnsupportedMediaType"""
+        mime_type = normalize_mime_type(mime_type)
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._index:
+                self._index.move_to_end(digest)
+                metrics.inc("blob.dedup_hits")
+                return BLOB_SCHEME + digest
+        path = self._path(digest, mime_type)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if digest not in self._index:
+                self._index[digest] = (len(data), mime_type)
+                self._bytes += len(data)
+                metrics.inc("blob.puts")
+                metrics.inc("blob.put_bytes", len(data))
+                self._evict()
+            metrics.set_gauge("blob.bytes", self._bytes)
+        return BLOB_SCHEME + digest
+
+    def put_data_uri(self, uri: str) -> Optional[str]:
+        """保存 ``data:<mime>;base64,...`` 的内容；无法解析或类型不受支持时返回 None（调用方保留原值）"""
+        header, sep, payload = uri.partition(",")
+        if not sep or not header.startswith("data:") or not header.endswith(";base64"):
+            return None
+        try:
+            mime_type = normalize_mime_type(header[len("data:"):-len(";base64")])
+        except UnsupportedMediaType:
+            return None
+        try:
+            data = base64.b64decode(payload, validate=False)
+        except (binascii.Error, ValueError):
+            return None
+        return self.put(data, mime_type)
+
+    def info(self, ref_or_id: str) -> Optional[Tuple[int, str]]:
+        """返回 (size, mime)，不存在时返回 None"""
+        digest = blob_id(ref_or_id) if is_blob_ref(ref_or_id) else ref_or_id
+        with self._lock:
+            return self._index.get(digest)
+
+    def path(self, ref_or_id: str) -> Optional[str]:
+        """blob 在磁盘上的路径（并标记为最近使用），不存在时返回 None"""
+        located = self._locate(ref_or_id)
+        return located[0] if located else None
+
+    def data_uri(self, ref: str) -> Optional[str]:
+        """把引用解析为 data URI，blob 不存在（已淘汰）时返回 None"""
+        located = self._locate(ref)
+        if located is None:
+            return None
+        path, mime_type = located
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return f"data:{mime_type};base64,"
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    encoded = base64.b64encode(mapped).decode("ascii")
+        except OSError as e:
+            logger.warning("Blob store: failed to read %s: %s", path, e)
+            return None
+        return f"data:{mime_type};base64,{encoded}"
+
+    def externalize(self, value: Any) -> Any:
+        """inline ``data:`` URI 换成引用，其余值原样返回"""
+        if not self.enabled or not isinstance(value, str) or not value.startswith("data:"):
+            return value
+        try:
+            ref = self.put_data_uri(value)
+        except OSError as e:
+            logger.warning("Blob store: write failed, keeping inline data: %s", e)
+            return value
+        if ref is not None:
+            metrics.inc("blob.externalized")
+        return ref or value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"blobs": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    # ----------------- 内部方法 -----------------
+
+    def _locate(self, ref_or_id: str) -> Optional[Tuple[str, str]]:
+        digest = blob_id(ref_or_id) if is_blob_ref(ref_or_id) else ref_or_id
+        with self._lock:
+            entry = self._index.get(digest)
+            if entry is None:
+                return None
+            self._index.move_to_end(digest)
+        return self._path(digest, entry[1]), entry[1]
+
+    def _path(self, digest: str, mime_type: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.{mime_type.replace('/', '_')}")
+
+    def _evict(self) -> None:
+        # 调用方持有 _lock；最近写入的 blob 即使超出上限也保留
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            digest, (size, mime_type) = self._index.popitem(last=False)
+            self._bytes -= size
+            metrics.inc("blob.evictions")
+            try:
+                os.remove(self._path(digest, mime_type))
+            except OSError:
+                pass
+
+    def _scan(self) -> None:
+        """启动时按修改时间重建索引（较早的 blob 先被淘汰）"""
+        entries = []
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            for shard in os.listdir(self.root):
+                shard_dir = os.path.join(self.root, shard)
+                if not os.path.isdir(shard_dir):
+                    continue
+                for name in os.listdir(shard_dir):
+                    digest, dot, mime = name.partition(".")
+                    if not dot or name.endswith(".tmp") or len(digest) != 64:
+                        continue
+                    mime = mime.replace("_", "/", 1)
+                    if mime not in ALLOWED_MIME_TYPES:
+                        continue
+                    stat = os.stat(os.path.join(shard_dir, name))
+                    entries.append((stat.st_mtime, digest, stat.st_size, mime))
+        except OSError as e:
+            logger.warning("Blob store: failed to scan %s: %s", self.root, e)
+        for _, digest, size, mime_type in sorted(entries):
+            self._index[digest] = (size, mime_type)
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+
+def resolve_blob_refs(messages: Sequence[Any], store: Optional[BlobStore] = None) -> List[Any]:
+    """
+    把消息中图片/音视频项的 ``blob://`` 引用解析为 data URI（只替换含引用的消息，其余共享）。
+    blob 已被淘汰时该项替换为文本说明。
+    """
+    store = store or blob_store
+    resolved: List[Any] = []
+    start = time.perf_counter()
+    count = 0
+    for message in messages:
+        content = message_field(message, "content")
+        if not isinstance(content, list) or not any(
+                is_blob_ref(message_field(item, key)) for item in content for key in _MEDIA_KEYS):
+            resolved.append(message)
+            continue
+        items = []
+        for item in content:
+            key = next((k for k in _MEDIA_KEYS if is_blob_ref(message_field(item, k))), None)
+            if key is None:
+                items.append(item)
+                continue
+            uri = store.data_uri(message_field(item, key))
+            if uri is None:
+                metrics.inc("blob.missing")
+                items.append(_replace_item(item, {"text": "[图片已过期]" if key == "image" else "[媒体已过期]"}))
+            else:
+                count += 1
+                items.append(_replace_item(item, {key: uri}))
+        resolved.append(with_content(message, items))
+    if count:
+        metrics.observe("blob.resolve_seconds", time.perf_counter() - start)
+    return resolved
+
+
+def _replace_item(item: Any, fields: Dict[str, str]) -> Any:
+    if isinstance(item, dict):
+        return fields
+    return type(item)(**fields)
+
+
+def install_blob_resolvers(llms: Sequence[Any], preprocess: Optional[Callable[[List[Any]], List[Any]]] = None) -> None:
+    """
+    为支持多模态输入的模型挂上引用解析：在 convert_messages_to_dicts（构建模型请求）时才读取 blob；
+    ``preprocess`` 在解析前替换引用（如换成缩放后的图片）。
+    """
+    for llm in llms:
+        convert = getattr(llm, "convert_messages_to_dicts", None)
+        if convert is None or getattr(convert, "_resolves_blobs", False):
+            continue
+        if not getattr(llm, "support_multimodal_input", False):
+            continue
+
+        def convert_messages_to_dicts(messages, _convert=convert):
+            if preprocess is not None:
+                messages = preprocess(messages)
+            return _convert(resolve_blob_refs(messages))
+
+        convert_messages_to_dicts._resolves_blobs = True
+        llm.convert_messages_to_dicts = convert_messages_to_dicts
+
+
+blob_store = BlobStore(
+    root=config.BLOB_STORE_DIR or os.path.join(tempfile.gettempdir(), "alfred-blobs"),
+    max_bytes=config.BLOB_STORE_MAX_MB * 1024 * 1024,
+)
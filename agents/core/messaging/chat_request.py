@@ -20,5 +20,9 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = None
     user_id: Optional[str] = None
     parameters: Optional[Dict[str, Any]] = None
+    # true 时 messages 只包含本轮新增的消息，历史由服务端会话存储（按 session_id）补全
+    append: Optional[bool] = False
+    # SSE 编码方式："full"（默认）或 "delta"，未指定时使用 STREAM_MODE 配置
+    stream_mode: Optional[str] = None
 
     model_config = ConfigDict(extra="ignore")
@@ -169,6 +169,85 @@ class ChatResponse(BaseModel):
         )
 
 
+class ChatCompletionMessage(BaseModel):
+    role: str = "assistant"
+    content: str = ""
+    name: Optional[str] = None
+    reasoning_content: Optional[str] = None
+
+    @classmethod
+    def from_agent_messages(cls, messages: List[Dict[str, Any]]) -> "ChatCompletionMessage":
+        """取最后一次工具调用之后的 assistant 回复，中间的工具调用与工具结果不包含在内"""
+        last_tool_idx = -1
+        for idx, msg in enumerate(messages):
+            if msg.get("role") == "function" or msg.get("function_call"):
+                last_tool_idx = idx
+
+        texts: List[str] = []
+        reasoning: List[str] = []
+        name = None
+        for msg in messages[last_tool_idx + 1:]:
+            if msg.get("role") != "assistant":
+                continue
+            name = msg.get("name") or name
+            if msg.get("reasoning_content"):
+                reasoning.append(msg["reasoning_content"])
+            content = msg.get("content")
+            if isinstance(content, str):
+                texts.append(content)
+            elif isinstance(content, list):
+                texts.extend(item.get("text", "") for item in content if isinstance(item, dict) and item.get("text"))
+        return cls(content="".join(texts), name=name, reasoning_content="".join(reasoning) or None)
+
+
+class ChatCompletionChoice(BaseModel):
+    index: int = 0
+    message: ChatCompletionMessage
+    finish_reason: str = "stop"
+
+
+class ChatCompletion(BaseModel):
+    """OpenAI ``chat.completion`` 形态的非流式响应（stream=false）"""
+    id: str
+    object: str = "chat.completion"
+    created: int
+    model: str
+    choices: List[ChatCompletionChoice]
+    usage: Usage
+
+    @classmethod
+    def from_agent_messages(cls, messages: List[Dict[str, Any]],
+                            model_name: str,
+                            task_id: str,
+                            created: int,
+                            usage: Optional[Dict[str, Any]] = None) -> "ChatCompletion":
+        """从 Agent 最终的累计输出构建响应
+
+        只保留最后一次工具调用之后的 assistant 回复作为 message，
+        中间的工具调用与工具结果不返回给调用方。
+
+        Args:
+            messages: Agent 最后一步 yield 的消息列表（dict）
+            model_name: 模型名称
+            task_id: 任务ID
+            created: 创建时间戳
+            usage: token 使用情况，格式: {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        """
+        usage_obj = Usage(model_name=model_name)
+        if usage:
+            usage_obj.prompt_tokens = usage_obj.input_tokens = usage.get("input_tokens", 0)
+            usage_obj.completion_tokens = usage_obj.output_tokens = usage.get("output_tokens", 0)
+            usage_obj.total_tokens = usage.get("total_tokens", 0)
+
+        return cls(
+            id=task_id,
+            created=created,
+            model=model_name,
+            choices=[ChatCompletionChoice(message=ChatCompletionMessage.from_agent_messages(messages))],
+            usage=usage_obj,
+        )
+
+
 if __name__ == "__main__":
     # 测试成功响应
     success_messages = [
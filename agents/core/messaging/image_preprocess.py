@@ -0,0 +1,196 @@
+"""Downscale and re-encode images before they reach the VL model.
+
+本地 VL 模型的 prefill 随图片像素数增长，而客户端发送的往往是原始分辨率的照片。
+这里在构建多模态模型请求前对 ``blob://`` 图片做预处理：
+
+- 按 ``IMAGE_MAX_SIDE`` 等比缩小（长边），按 EXIF 方向转正后丢弃 EXIF 等元数据；
+- 重新编码为 JPEG/WebP（``IMAGE_FORMAT`` / ``IMAGE_QUALITY``），结果作为新的 blob 保存；
+- 结果按源图哈希缓存；请求解析后即在线程池中并行预处理，与路由决策重叠，
+  构建模型请求时通常只需取回已完成的结果。
+"""
+
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from PIL import Image, ImageOps
+
+from agents.core.messaging.blob_store import BlobStore, blob_id, blob_store, is_blob_ref
+from agents.core.messaging.message_view import message_field, with_content
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+def preprocess_image(data: bytes, max_side: int, fmt: str = "jpeg", quality: int = 85) -> Optional[bytes]:
+    """
+    缩放并重新编码一张图片（丢弃 EXIF 等元数据）；无需缩放且重新编码后更大、原图也不含 EXIF 时返回 None，
+    表示直接使用原图。无法识别的图片抛出 PIL 的异常。
+    """
+    pil_format, _ = _FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as source:
+        has_exif = bool(source.info.get("exif")) or bool(source.getexif())
+        resized = max_side > 0 and max(source.size) > max_side
+        if resized and source.format == "JPEG":
+            # JPEG 解码时直接按 2 的幂缩小，大图的解码开销随之下降
+            source.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(source)  # 多帧图片只取第一帧
+        if resized:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "L") and not (pil_format == "WEBP" and image.mode == "RGBA"):
+            if image.mode in ("RGBA", "LA", "P") and pil_format == "JPEG":
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                image = image.convert("RGBA" if pil_format == "WEBP" and "A" in image.getbands() else "RGB")
+        out = io.BytesIO()
+        image.save(out, format=pil_format, quality=quality, optimize=pil_format == "JPEG")
+    encoded = out.getvalue()
+    if not resized and not has_exif and len(encoded) >= len(data):
+        return None
+    return encoded
+
+
+class ImagePreprocessor:
+    """
+    blob 图片的预处理与结果缓存（源图 sha256 -> 处理后的 blob 引用）。
+
+    ``prefetch`` 在请求解析后提交后台任务，``apply`` 在构建模型请求时替换消息中的图片引用，
+    同一图片的并发请求共享一个任务；预处理失败时使用原图。
+    """
+
+    def __init__(self, store: BlobStore, max_side: int, fmt: str, quality: int, workers: int, cache_size: int):
+        self.store = store
+        self.max_side = max_side
+        self.fmt = fmt if fmt in _FORMATS else "jpeg"
+        self.quality = quality
+        self.cache_size = cache_size
+        self._workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_side > 0 and self.store.enabled
+
+    def prefetch(self, refs: Iterable[Any]) -> None:
+        """在后台预处理这些图片（非 blob 引用与已缓存的图片跳过）"""
+        if not self.enabled:
+            return
+        for ref in refs:
+            if is_blob_ref(ref):
+                self._submit(ref)
+
+    def processed(self, ref: str) -> str:
+        """返回预处理后的图片引用（等待进行中的任务）；失败时返回原引用"""
+        if not self.enabled or not is_blob_ref(ref):
+            return ref
+        result = self._submit(ref)
+        if isinstance(result, str):
+            return result
+        start = time.perf_counter()
+        try:
+            return result.result()
+        finally:
+            metrics.observe("image.preprocess_wait_seconds", time.perf_counter() - start)
+
+    def apply(self, messages: Sequence[Any]) -> List[Any]:
+        """把消息中的图片引用替换为预处理后的引用（只替换含图片的消息，其余共享）"""
+        if not self.enabled:
+            return list(messages)
+        # 先全部提交，多图消息的图片并行处理
+        refs = [message_field(item, "image")
+                for message in messages if isinstance(message_field(message, "content"), list)
+                for item in message_field(message, "content") if is_blob_ref(message_field(item, "image"))]
+        if not refs:
+            return list(messages)
+        self.prefetch(refs)
+        updated: List[Any] = []
+        for message in messages:
+            content = message_field(message, "content")
+            if not isinstance(content, list) or not any(is_blob_ref(message_field(i, "image")) for i in content):
+                updated.append(message)
+                continue
+            items = []
+            for item in content:
+                ref = message_field(item, "image")
+                if not is_blob_ref(ref):
+                    items.append(item)
+                    continue
+                new_ref = self.processed(ref)
+                items.append(item if new_ref == ref else
+                             ({"image": new_ref} if isinstance(item, dict) else type(item)(image=new_ref)))
+            updated.append(with_content(message, items))
+        return updated
+
+    # ----------------- 内部方法 -----------------
+
+    def _submit(self, ref: str):
+        """返回已缓存的结果（str）或进行中的 Future"""
+        digest = blob_id(ref)
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None and cached != ref and self.store.info(cached) is None:
+                # 处理结果已被 blob 存储淘汰，重新处理
+                del self._cache[digest]
+                cached = None
+            if cached is not None:
+                self._cache.move_to_end(digest)
+                metrics.inc("image.preprocess_cache", outcome="hit")
+                return cached
+            future = self._inflight.get(digest)
+            if future is not None:
+                return future
+            metrics.inc("image.preprocess_cache", outcome="miss")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="image-preprocess")
+            future = self._executor.submit(self._process, ref)
+            self._inflight[digest] = future
+            return future
+
+    def _process(self, ref: str) -> str:
+        digest = blob_id(ref)
+        start = time.perf_counter()
+        result = ref
+        try:
+            path = self.store.path(ref)
+            if path is not None:
+                with open(path, "rb") as f:
+                    data = f.read()
+                encoded = preprocess_image(data, self.max_side, self.fmt, self.quality)
+                if encoded is not None:
+                    result = self.store.put(encoded, _FORMATS[self.fmt][1])
+                    metrics.inc("image.preprocess_bytes_saved", len(data) - len(encoded))
+        except Exception as e:
+            metrics.inc("image.preprocess_errors")
+            logger.warning("Image preprocessing failed for %s, using the original: %s", digest, e)
+        finally:
+            metrics.observe("image.preprocess_seconds", time.perf_counter() - start)
+        with self._lock:
+            self._inflight.pop(digest, None)
+            self._cache[digest] = result
+            # 处理后的图片再次出现（如客户端回传）时无需重复处理
+            self._cache[blob_id(result)] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+
+image_preprocessor = ImagePreprocessor(
+    store=blob_store,
+    max_side=config.IMAGE_MAX_SIDE,
+    fmt=config.IMAGE_FORMAT.lower(),
+    quality=config.IMAGE_QUALITY,
+    workers=config.IMAGE_PREPROCESS_WORKERS,
+    cache_size=config.IMAGE_PREPROCESS_CACHE_SIZE,
+)
@@ -0,0 +1,62 @@
+"""Copy-on-write helpers for conversation messages.
+
+会话历史在一次请求中会被路由器、子 Agent 与 LLM 预处理多次读取，其中可能含有
+内联 base64 图片。这里的函数只复制需要改动的那一层（消息外壳或单个内容项），
+其余内容（包括图片/文件等内容项）与原消息共享引用：
+
+- ``with_content``：替换 content 后的浅拷贝；
+- ``prefix_text``：给首个文本内容加前缀的叠加视图（如 ``Call: name``）；
+- ``without_leading_system``：去掉开头 system 消息后的新列表，不修改原列表。
+
+调用方约定：视图与原消息共享内容项，二者都只读使用；需要修改时先通过这些函数得到新对象。
+"""
+
+from typing import Any, List, Sequence
+
+from qwen_agent.llm.schema import SYSTEM
+
+
+def message_field(message: Any, key: str, default: Any = None) -> Any:
+    """兼容 dict / Message 两种形式读取字段"""
+    if isinstance(message, dict):
+        return message.get(key, default)
+    return getattr(message, key, default)
+
+
+def with_content(message: Any, content: Any) -> Any:
+    """返回替换 content 后的新消息，其余字段共享引用"""
+    if isinstance(message, dict):
+        return {**message, "content": content}
+    return message.model_copy(update={"content": content})
+
+
+def _prefixed_item(item: Any, prefix: str) -> Any:
+    if isinstance(item, dict):
+        return {**item, "text": prefix + item["text"]}
+    return item.model_copy(update={"text": prefix + item.text})
+
+
+def prefix_text(message: Any, prefix: str) -> Any:
+    """
+    给消息的首个文本内容加上前缀，返回叠加视图：
+    字符串 content 生成新字符串；富文本 content 只替换首个 text 项，图片等其余项共享引用。
+    没有文本可加前缀时原样返回。
+    """
+    content = message_field(message, "content")
+    if isinstance(content, str):
+        return with_content(message, prefix + content)
+    if isinstance(content, list):
+        for i, item in enumerate(content):
+            text = message_field(item, "text")
+            if text is not None:
+                new_content = list(content)
+                new_content[i] = _prefixed_item(item, prefix)
+                return with_content(message, new_content)
+    return message
+
+
+def without_leading_system(messages: Sequence[Any]) -> List[Any]:
+    """去掉开头的 system 消息，返回新列表（只复制列表本身）"""
+    if messages and message_field(messages[0], "role") == SYSTEM:
+        return list(messages[1:])
+    return list(messages)
@@ -1,130 +1,125 @@
 import logging
-from typing import Dict, List, Any
+from typing import Any, Dict, List, Optional, Sequence
 
-from agents.core.messaging.chat_request import ChatRequest
+from agents.core.messaging.blob_store import blob_store
+from agents.core.messaging.chat_request import ChatRequest, Message
 
 logger = logging.getLogger(__name__)
 
 
+class InvalidMessages(ValueError):
+    """请求（或与会话历史合并后）的消息无法对话：没有消息，或没有以 user 消息结尾"""
+
+
 def convert_chat_request_to_messages(request: ChatRequest) -> List[Dict[str, Any]]:
     """
     将 ChatRequest 转换为 Qwen-Agent 所需的消息列表（保留结构化内容）
     """
+    return RequestAnalysis(request).normalized()
+
+
+def convert_messages(messages: Sequence[Message]) -> List[Dict[str, Any]]:
+    """
+    逐条转换请求消息（不做角色归一化），会话存储的追加请求只转换新增的消息
+    """
     qa_messages: List[Dict[str, Any]] = []
+    for m in messages or []:
+        message_dict = _convert_message(m)
+        if message_dict is not None:
+            qa_messages.append(message_dict)
+    return qa_messages
+
+
+def _convert_message(m: Message) -> Optional[Dict[str, Any]]:
+    """转换单条请求消息；需要跳过的消息（system、工具调用与工具结果）返回 None"""
+    role = m.role
+    content = m.content if m.content is not None else ""
+    if role == 'system':
+        return None
+
+    # 将 plugin role 转换为 function，因为 qwen_agent 不支持 plugin role
+    if role == 'plugin':
+        role = 'function'
+    if role == 'tool':
+        role = 'function'
+
+    # 跳过工具相关的消息：
+    # 1. 跳过 content 为空的 assistant 消息（工具调用消息）
+    # 2. 跳过 function/tool 消息（工具返回结果），因为前置的工具调用消息已被跳过
+    # 这样可以避免 "tool must be a response to a preceeding message with tool_calls" 错误
+    if role == 'assistant' and content == '':
+        return None
+    if role == 'function':
+        return None
+
+    # 获取 name 字段（如果存在）
+    name = getattr(m, 'name', None)
+    # 2) 如果没有 name，再从 metadata.agent_name 里还原
+    metadata = getattr(m, 'metadata', None)
+    if not name and metadata and isinstance(metadata, dict):
+        name = metadata.get("agent_name")
+
+    # 检查是否为富文本消息（包含图像等）
+    if isinstance(content, list):
+        # 富文本内容，可能包含图片、文本等
+        structured_content = []
+        for item in content:
+            if isinstance(item, dict):
+                if 'image' in item:
+                    # 图片内容（inline 数据换成 blob 引用）
+                    structured_content.append({
+                        "image": _externalize(item, 'image')
+                    })
+                elif 'text' in item:
+                    # 文本内容
+                    structured_content.append({
+                        "text": item['text']
+                    })
+                elif 'file' in item:
+                    # 文件内容 - 只保留 file 字段，移除 file_id 字段避免 Qwen-Agent 框架错误
+                    structured_content.append({
+                        "file": _externalize(item, 'file'),
+                    })
+                else:
+                    # 其他类型的内容，直接添加
+                    structured_content.append(item)
+            else:
+                # 纯文本内容
+                structured_content.append(str(item))
+        content = structured_content
 
-    messages = request.messages or []
+    # 普通文本与其他类型的内容原样保留（确保添加了 content 键）
+    message_dict = {"role": role, "content": content}
+    if name:
+        message_dict["name"] = name
+    return message_dict
 
-    if messages:
-        for m in messages:
-            role = m.role
-            content = m.content if m.content is not None else ""
-            if role == 'system':
-                continue
 
-            # 将 plugin role 转换为 function，因为 qwen_agent 不支持 plugin role
-            if role == 'plugin':
-                role = 'function'
-            if role == 'tool':
-                role = 'function'
-
-            # 获取 name 字段（如果存在）
-            name = getattr(m, 'name', None)
-            # 2) 如果没有 name，再从 metadata.agent_name 里还原
-            metadata = getattr(m, 'metadata', None)
-            if not name and metadata and isinstance(metadata, dict):
-                name = metadata.get("agent_name")
-
-            # 跳过工具相关的消息：
-            # 1. 跳过 content 为空的 assistant 消息（工具调用消息）
-            # 2. 跳过 function/tool 消息（工具返回结果），因为前置的工具调用消息已被跳过
-            # 这样可以避免 "tool must be a response to a preceeding message with tool_calls" 错误
-            if role == 'assistant' and content == '':
-                continue
-            if role == 'function':
-                continue
+def _externalize(item: Dict[str, Any], key: str) -> Any:
+    """
+    把内容项中的 inline data URI 换成 blob 引用，并原地写回请求消息，
+    之后的提取、日志与会话历史都只看到引用。
+    """
+    value = item[key]
+    ref = blob_store.externalize(value)
+    if ref is not value:
+        item[key] = ref
+    return ref
 
-            # 检查是否为富文本消息（包含图像等）
-            if isinstance(content, str):
-                # 普通文本内容
-                message_dict = {"role": role, "content": content}
-                if name:
-                    message_dict["name"] = name
-                qa_messages.append(message_dict)
-            elif isinstance(content, list):
-                # 富文本内容，可能包含图片、文本等
-                structured_content = []
-                for item in content:
-                    if isinstance(item, dict):
-                        if 'image' in item:
-                            # 图片内容
-                            structured_content.append({
-                                "image": item['image']
-                            })
-                        elif 'text' in item:
-                            # 文本内容
-                            structured_content.append({
-                                "text": item['text']
-                            })
-                        elif 'file' in item:
-                            # 文件内容 - 只保留 file 字段，移除 file_id 字段避免 Qwen-Agent 框架错误
-                            structured_content.append({
-                                "file": item['file'],
-                            })
-                        else:
-                            # 其他类型的内容，直接添加
-                            structured_content.append(item)
-                    else:
-                        # 纯文本内容
-                        structured_content.append(str(item))
-
-                message_dict = {"role": role, "content": structured_content}
-                if name:
-                    message_dict["name"] = name
-                qa_messages.append(message_dict)
-            else:
-                # 其他类型的内容 - 确保添加了content键
-                message_dict = {"role": role, "content": content}
-                if name:
-                    message_dict["name"] = name
-                qa_messages.append(message_dict)
-    else:
-        raise ValueError("chat requires messages")
-    normalized = _normalize_message_roles(qa_messages)
-    if not normalized:
-        raise ValueError("chat requires at least one user message")
-    return normalized
-
-
-def _normalize_message_roles(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+
+def append_normalized(history: Sequence[Dict[str, Any]],
+                      messages: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Ensure roles alternate user/assistant/... by merging consecutive same-role messages
-    and dropping any leading non-user entries.
+    Append messages to an already normalized history, merging with the last entry when the
+    roles match and dropping leading non-user entries while the history is empty.
+    Copy-on-write: untouched messages are shared with the inputs, only merged ones are new dicts.
     """
-    if not messages:
-        return []
-
-    # Drop leading non-user messages to satisfy strict alternation requirements.
-    start_idx = 0
-    found_user = False
-    for idx, msg in enumerate(messages):
-        if msg.get("role") == "user":
-            start_idx = idx
-            found_user = True
-            break
-    if not found_user:
-        return []
-    messages = messages[start_idx:]
-
-    merged: List[Dict[str, Any]] = []
+    merged: List[Dict[str, Any]] = list(history)
     for msg in messages:
-        if not merged:
-            merged.append(dict(msg))
-            continue
-        last = merged[-1]
-        if msg.get("role") == last.get("role"):
-            merged[-1] = _merge_same_role_message(last, msg)
-        else:
-            merged.append(dict(msg))
+        if merged and msg.get("role") == merged[-1].get("role"):
+            merged[-1] = _merge_same_role_message(merged[-1], msg)
+        elif merged or msg.get("role") == "user":
+            merged.append(msg)
     return merged
 
 
@@ -159,18 +154,16 @@ def _merge_message_content(left: Any, right: Any) -> Any:
     return _to_list(left) + _to_list(right)
 
 
-def _add_file_to_list(files_list: List[Dict[str, str]], file_url: str, file_id: str = "") -> None:
+def _add_file(files: Dict[Any, Dict[str, str]], file_url: Any, file_id: str = "") -> None:
     """
-    将文件添加到列表中，如果文件已存在则更新其 file_id
+    按 URL 建索引登记文件，如果文件已存在则更新其 file_id（O(1)，不再线性查找已有列表）
     """
-    for existing_file in files_list:
-        if isinstance(existing_file, dict) and existing_file.get("file") == file_url:
-            # 如果文件已在列表中，但file_id为空而当前有file_id，则更新file_id
-            if not existing_file.get("file_id") and file_id:
-                existing_file["file_id"] = file_id
-            return
-    # 如果文件不存在，则添加到列表
-    files_list.append({"file": file_url, "file_id": file_id})
+    existing_file = files.get(file_url)
+    if existing_file is None:
+        files[file_url] = {"file": file_url, "file_id": file_id}
+    elif not existing_file.get("file_id") and file_id:
+        # 如果文件已在列表中，但file_id为空而当前有file_id，则更新file_id
+        existing_file["file_id"] = file_id
 
 
 def _extract_files_from_param_list(files_param: List) -> List[Dict[str, str]]:
@@ -189,23 +182,99 @@ def _extract_files_from_param_list(files_param: List) -> List[Dict[str, str]]:
     return files_list
 
 
-def _extract_files_from_messages_content(messages) -> List[Dict[str, str]]:
+def _content_text(content: Any) -> str:
+    """消息内容中的文本部分（富文本只取 text 项）"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(str(item["text"]) for item in content
+                         if isinstance(item, dict) and item.get("text") is not None)
+    return ""
+
+
+class RequestAnalysis:
     """
-    从消息内容中提取文件
+    一次遍历请求消息得到的解析结果，日志、消息转换、会话存储与上下文构建共用，
+    不再各自重复扫描整段历史：
+
+    - ``converted``：逐条转换后的消息（未做角色归一化，追加请求直接使用）；
+    - ``messages``：角色归一化后的消息；
+    - ``files``：请求参数与消息内容中的文件，按 URL 去重（消息中的 file_id 补全参数中缺失的）；
+    - ``images``：消息内容中的图片，去重并保持顺序；
+    - ``latest_user_text`` / ``last_agent``：最近一条 user 消息的文本与最近一次回复的 Agent。
+
+    inline 图片/文件在遍历时换成 blob 引用并写回请求消息。
     """
-    files_list = []
-    if messages:
+
+    __slots__ = ("message_count", "converted", "messages", "files", "images", "latest_user_text", "last_agent")
+
+    def __init__(self, request: ChatRequest):
+        messages = request.messages or []
+        self.message_count = len(messages)
+        self.converted: List[Dict[str, Any]] = []
+        self.messages: List[Dict[str, Any]] = []
+        self.images: List[str] = []
+        self.last_agent: Optional[str] = None
+
+        files: Dict[Any, Dict[str, str]] = {}
+        params = request.parameters
+        files_param = params.get("files") if isinstance(params, dict) else None
+        for f in _extract_files_from_param_list(files_param) if files_param else []:
+            _add_file(files, f["file"], f["file_id"])
+        seen_images = set()
+
+        normalized = self.messages
         for m in messages:
-            content = m.content if hasattr(m, 'content') else m.get('content') if isinstance(m, dict) else None
-            # 从富文本消息结构中提取 {"file": "...", "file_id": "..."} 项
-            if isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict) and "file" in item:
-                        file_url = item.get("file")
-                        file_id = item.get("file_id", "")  # 提取file_id，如果不存在则为空字符串
-                        if isinstance(file_url, str) and file_url:
-                            files_list.append({"file": file_url, "file_id": file_id})
-    return files_list
+            message = _convert_message(m)
+            # 附件从所有消息中提取（包括被跳过的 system/工具消息），与转换共用一次遍历
+            if isinstance(m.content, list):
+                self._collect_attachments(m.content, files, seen_images)
+            if message is None:
+                continue
+            self.converted.append(message)
+            role = message["role"]
+            if normalized and role == normalized[-1]["role"]:
+                normalized[-1] = _merge_same_role_message(normalized[-1], message)
+            elif normalized or role == "user":
+                normalized.append(message)
+            if role == "assistant" and message.get("name"):
+                self.last_agent = message["name"]
+        self.files = list(files.values())
+
+        self.latest_user_text = ""
+        for message in reversed(normalized):
+            if message["role"] == "user":
+                self.latest_user_text = _content_text(message["content"])
+                break
+
+    def _collect_attachments(self, content: List[Any], files: Dict[Any, Dict[str, str]], seen_images: set) -> None:
+        for item in content:
+            if not isinstance(item, dict):
+                continue
+            for key in ("image", "image_url"):
+                if key in item:
+                    image_url = _externalize(item, key)
+                    if isinstance(image_url, str) and image_url and image_url not in seen_images:
+                        seen_images.add(image_url)
+                        self.images.append(image_url)
+            if "file" in item:
+                file_url = _externalize(item, "file")
+                if isinstance(file_url, str) and file_url:
+                    # 提取file_id，如果不存在则为空字符串
+                    _add_file(files, file_url, item.get("file_id", ""))
+
+    def normalized(self) -> List[Dict[str, Any]]:
+        """角色归一化后的消息；请求没有消息或没有 user 消息时抛出 InvalidMessages"""
+        if not self.message_count:
+            raise InvalidMessages("chat requires messages")
+        if not self.messages:
+            raise InvalidMessages("chat requires at least one user message")
+        return self.messages
+
+    @property
+    def preview(self) -> str:
+        """日志用的最近一条 user 文本预览"""
+        return self.latest_user_text[:200]
 
 
 def extract_files_from_request(request: ChatRequest) -> List[Dict[str, str]]:
@@ -213,25 +282,7 @@ def extract_files_from_request(request: ChatRequest) -> List[Dict[str, str]]:
     处理文件列表，将其转换为统一格式
     从请求参数和消息内容中提取文件
     """
-    # 从参数中提取文件列表（如果 parameters 是对象，尝试获取 extra 字段）
-    files_param = None
-    if request.parameters:
-        if isinstance(request.parameters, dict):
-            files_param = request.parameters.get("files")
-
-    files_list = _extract_files_from_param_list(files_param) if files_param else []
-
-    # 从消息内容中提取文件（保留从消息结构中提取文件的功能，但仅用于获取file_id信息）
-    message_files = _extract_files_from_messages_content(
-        request.messages or [])
-
-    # 合并两个列表，如果有重复的文件URL，用消息中的file_id更新参数中的file_id
-    for file_item in message_files:
-        file_url = file_item.get("file", "")
-        file_id = file_item.get("file_id", "")
-        _add_file_to_list(files_list, file_url, file_id)
-
-    return files_list
+    return RequestAnalysis(request).files
 
 
 def extract_images_from_request(request: ChatRequest) -> List[str]:
@@ -244,32 +295,4 @@ def extract_images_from_request(request: ChatRequest) -> List[str]:
     Returns:
         图片URL列表
     """
-    images: List[str] = []
-
-    messages = request.messages or []
-
-    if messages:
-        for message in messages:
-            content = message.content if hasattr(message, 'content') else None
-
-            # 从富文本消息结构中提取图片
-            if isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict):
-                        image_url = item.get("image")
-                        if isinstance(image_url, str) and image_url:
-                            images.append(image_url)
-                        # 也考虑 image_url 字段
-                        image_url = item.get("image_url")
-                        if isinstance(image_url, str) and image_url:
-                            images.append(image_url)
-
-    # 去重并保持顺序
-    seen = set()
-    dedup: List[str] = []
-    for x in images:
-        if x not in seen:
-            dedup.append(x)
-            seen.add(x)
-
-    return dedup
+    return RequestAnalysis(request).images
@@ -0,0 +1,367 @@
+"""Server-side conversation history keyed by (user_id, session_id).
+
+会话以 ``session_key(user_id, session_id)`` 为键：不同用户使用相同（或猜到的）session_id
+时各自拥有独立的历史，不能读取或改写他人的会话。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from agents.core.messaging.request_helper import append_normalized
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def session_key(user_id: Optional[str], session_id: Optional[str]) -> str:
+    """会话存储的键：按 (user_id, session_id) 区分，没有 session_id 时返回空串（不使用会话）"""
+    if not session_id:
+        return ""
+    return json.dumps([user_id or "", session_id], ensure_ascii=False)
+
+
+class SessionNotFound(KeyError):
+    """append 请求对应的会话不存在（从未建立、已过期或被淘汰），客户端需重发完整历史"""
+
+
+class Session:
+    """一个会话：已归一化的 qwen-agent 消息（dict）、累计的文件/图片、上一次路由到的 Agent 与早期对话的滚动摘要"""
+
+    __slots__ = ("session_id", "messages", "files", "images", "last_agent", "summary", "summary_seq",
+                 "summary_from", "summary_digest", "expires", "_offset")
+
+    def __init__(self, session_id: str, expires: float):
+        self.session_id = session_id
+        self.messages: List[Dict[str, Any]] = []
+        self.files: List[Dict[str, str]] = []
+        self.images: List[str] = []
+        self.last_agent: Optional[str] = None
+        # 滚动摘要覆盖 seq < summary_seq 的消息
+        self.summary: Optional[str] = None
+        self.summary_seq = 0
+        # 生成摘要时仍在内存中的已摘要消息（seq 位于 [summary_from, summary_seq)）的摘要值，
+        # 用于判断重发的完整历史是否就是摘要所依据的那段对话
+        self.summary_from = 0
+        self.summary_digest: Optional[str] = None
+        self.expires = expires
+        # 持久化序号偏移：裁剪历史后 messages[i] 对应 seq = _offset + i
+        self._offset = 0
+
+    @property
+    def end_seq(self) -> int:
+        """下一条消息的 seq"""
+        return self._offset + len(self.messages)
+
+    def unsummarized(self) -> List[Dict[str, Any]]:
+        """摘要尚未覆盖的消息"""
+        return self.messages[max(0, self.summary_seq - self._offset):]
+
+
+class SessionStore:
+    """
+    会话历史存储：进程内 LRU + 空闲 TTL，可选 SQLite 持久化。
+
+    - 客户端以 ``append=true`` 只发送新增消息，服务端在已归一化的历史末尾追加（同角色相邻时合并）；
+    - 超过 ``max_messages`` 时从头部按整轮裁剪，超过 ``maxsize`` 个会话时淘汰最久未用的会话；
+    - 持久化采用追加写：新增消息只插入新行，只有边界合并/裁剪会改动已有行。
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_messages: int, persist_path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if persist_path:
+            self._open(persist_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._get(session_id) is not None
+
+    def history(self, session_id: str) -> Optional[Session]:
+        """返回会话（调用方只读使用）；不存在或已过期时返回 None"""
+        with self._lock:
+            return self._get(session_id)
+
+    def append(self,
+               session_id: str,
+               messages: Sequence[Dict[str, Any]],
+               files: Sequence[Dict[str, str]] = (),
+               images: Sequence[str] = ()) -> Session:
+        """在会话末尾追加已转换的消息；会话不存在时抛出 SessionNotFound"""
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                metrics.inc("session.misses")
+                raise SessionNotFound(session_id)
+            metrics.inc("session.appends")
+            self._extend(session, messages)
+            self._merge_attachments(session, files, images)
+            self._touch(session)
+            self._commit()
+            return session
+
+    def replace(self,
+                session_id: str,
+                messages: Sequence[Dict[str, Any]],
+                files: Sequence[Dict[str, str]] = (),
+                images: Sequence[str] = ()) -> Session:
+        """用客户端发送的完整历史重建会话（旧客户端或 append 失败后的回退）"""
+        with self._lock:
+            metrics.inc("session.replaces")
+            session = Session(session_id, 0.0)
+            old = self._sessions.pop(session_id, None)
+            if old is not None:
+                session.last_agent = old.last_agent
+            self._sessions[session_id] = session
+            if self._db is not None:
+                self._execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+            messages = append_normalized([], messages)
+            if old is not None and old.summary and _summary_matches(old, messages):
+                # 同一会话重发完整历史时 seq 编号不变，已摘要的前缀未变时摘要继续有效
+                session.summary, session.summary_seq = old.summary, old.summary_seq
+                session.summary_from, session.summary_digest = old.summary_from, old.summary_digest
+            elif old is not None and old.summary:
+                # 历史被编辑、分叉或换成了另一段对话：旧摘要不再对应，丢弃
+                metrics.inc("session.summary_dropped")
+            self._extend(session, messages)
+            self._merge_attachments(session, files, images)
+            self._touch(session)
+            self._evict()
+            self._commit()
+            return session
+
+    def record_reply(self, session_id: str, message: Dict[str, Any], agent_name: Optional[str]) -> None:
+        """追加本轮 Agent 的最终回复，并记录路由到的 Agent"""
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                return
+            if agent_name:
+                session.last_agent = agent_name
+            if message.get("content"):
+                self._extend(session, [message])
+            self._touch(session)
+            self._commit()
+
+    def unsummarized(self, session_id: str) -> Optional[Tuple[Optional[str], int, List[Dict[str, Any]]]]:
+        """返回 (当前摘要, 未摘要部分起始 seq, 未摘要的消息) 的一致快照；会话不存在时返回 None"""
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                return None
+            start = max(session.summary_seq, session._offset)
+            return session.summary, start, session.messages[start - session._offset:]
+
+    def set_summary(self, session_id: str, summary: str, upto_seq: int) -> bool:
+        """记录覆盖 seq < upto_seq 的滚动摘要；会话已不存在或已有更新的摘要时忽略"""
+        with self._lock:
+            session = self._get(session_id)
+            if session is None or upto_seq <= session.summary_seq:
+                return False
+            start = min(session._offset, upto_seq)
+            session.summary, session.summary_seq = summary, upto_seq
+            session.summary_from = start
+            session.summary_digest = _digest(session.messages[:upto_seq - start])
+            if self._db is not None:
+                self._execute("UPDATE sessions SET summary = ?, summary_seq = ?, summary_from = ?, summary_digest = ? "
+                              "WHERE session_id = ?",
+                              (summary, upto_seq, start, session.summary_digest, session_id))
+                self._commit()
+            return True
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+                self._execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "maxsize": self.maxsize,
+                "messages": sum(len(s.messages) for s in self._sessions.values()),
+            }
+
+    # ----------------- 内部方法（调用方持有 _lock） -----------------
+
+    def _get(self, session_id: str) -> Optional[Session]:
+        if not self.enabled or not session_id:
+            return None
+        session = self._sessions.get(session_id)
+        if session is None and self._db is not None:
+            session = self._load(session_id)
+            if session is not None:
+                self._sessions[session_id] = session
+                self._evict()
+        if session is None:
+            return None
+        if session.expires <= time.time():
+            self._sessions.pop(session_id, None)
+            metrics.inc("session.expired")
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _extend(self, session: Session, messages: Sequence[Dict[str, Any]]) -> None:
+        """追加并维持 user/assistant 交替：与末尾同角色的消息合并，空会话丢弃开头的非 user 消息"""
+        before = len(session.messages)
+        last = session.messages[-1] if session.messages else None
+        session.messages = append_normalized(session.messages, messages)
+        if self._db is not None:
+            if before and session.messages[before - 1] is not last:
+                self._persist_message(session, before - 1)
+            for idx in range(before, len(session.messages)):
+                self._persist_message(session, idx)
+        self._trim(session)
+
+    def _trim(self, session: Session) -> None:
+        if self.max_messages <= 0 or len(session.messages) <= self.max_messages:
+            return
+        cut = len(session.messages) - self.max_messages
+        # 按整轮裁剪：保留部分从 user 消息开始
+        while cut < len(session.messages) - 1 and session.messages[cut].get("role") != "user":
+            cut += 1
+        session.messages = session.messages[cut:]
+        session._offset += cut
+        metrics.inc("session.trimmed_messages", cut)
+        if self._db is not None:
+            self._execute("DELETE FROM session_messages WHERE session_id = ? AND seq < ?",
+                          (session.session_id, session._offset))
+
+    @staticmethod
+    def _merge_attachments(session: Session, files: Sequence[Dict[str, str]], images: Sequence[str]) -> None:
+        known = {f.get("file"): f for f in session.files}
+        for item in files:
+            current = known.get(item.get("file"))
+            if current is None:
+                session.files.append(dict(item))
+                known[item.get("file")] = session.files[-1]
+            elif item.get("file_id") and not current.get("file_id"):
+                current["file_id"] = item["file_id"]
+        for image in images:
+            if image not in session.images:
+                session.images.append(image)
+
+    def _touch(self, session: Session) -> None:
+        session.expires = time.time() + self.ttl
+        self._sessions.move_to_end(session.session_id)
+        if self._db is not None:
+            self._execute(
+                "INSERT OR REPLACE INTO sessions (session_id, last_agent, files, images, msg_offset, summary, "
+                "summary_seq, summary_from, summary_digest, expires) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session.session_id, session.last_agent, json.dumps(session.files, ensure_ascii=False),
+                 json.dumps(session.images, ensure_ascii=False), session._offset, session.summary,
+                 session.summary_seq, session.summary_from, session.summary_digest, session.expires))
+
+    def _evict(self) -> None:
+        while len(self._sessions) > self.maxsize:
+            self._sessions.popitem(last=False)
+            metrics.inc("session.evictions")
+
+    def _open(self, path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_agent TEXT, "
+                             "files TEXT, images TEXT, msg_offset INTEGER, summary TEXT, summary_seq INTEGER, "
+                             "summary_from INTEGER, summary_digest TEXT, expires REAL)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+            for column, kind in (("summary", "TEXT"), ("summary_seq", "INTEGER"), ("summary_from", "INTEGER"),
+                                 ("summary_digest", "TEXT")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE sessions ADD COLUMN {column} {kind}")
+            self._db.execute("CREATE TABLE IF NOT EXISTS session_messages (session_id TEXT, seq INTEGER, "
+                             "message TEXT, PRIMARY KEY (session_id, seq))")
+            expired = time.time()
+            self._db.execute("DELETE FROM session_messages WHERE session_id IN "
+                             "(SELECT session_id FROM sessions WHERE expires <= ?)", (expired,))
+            self._db.execute("DELETE FROM sessions WHERE expires <= ?", (expired,))
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Session store: failed to open %s, persistence disabled: %s", path, e)
+            self._db = None
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        try:
+            row = self._db.execute("SELECT last_agent, files, images, msg_offset, summary, summary_seq, expires, "
+                                   "summary_from, summary_digest FROM sessions WHERE session_id = ?",
+                                   (session_id,)).fetchone()
+            if row is None:
+                return None
+            rows = self._db.execute("SELECT message FROM session_messages WHERE session_id = ? ORDER BY seq",
+                                    (session_id,)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Session store: read failed: %s", e)
+            return None
+        session = Session(session_id, row[6])
+        session.last_agent = row[0]
+        session.files = json.loads(row[1] or "[]")
+        session.images = json.loads(row[2] or "[]")
+        session._offset = row[3] or 0
+        session.summary = row[4]
+        session.summary_seq = row[5] or 0
+        session.summary_from = row[7] or 0
+        session.summary_digest = row[8]
+        session.messages = [json.loads(r[0]) for r in rows]
+        return session
+
+    def _persist_message(self, session: Session, idx: int) -> None:
+        self._execute("INSERT OR REPLACE INTO session_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                      (session.session_id, session._offset + idx,
+                       json.dumps(session.messages[idx], ensure_ascii=False)))
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        try:
+            self._db.execute(sql, params)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning("Session store: write failed: %s", e)
+
+    def _commit(self) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Session store: commit failed: %s", e)
+
+
+def _digest(messages: Sequence[Dict[str, Any]]) -> str:
+    """一段消息的摘要值：只看角色与内容（回写的 name 等元信息不影响匹配）"""
+    h = hashlib.blake2b(digest_size=16)
+    for msg in messages:
+        h.update(json.dumps([msg.get("role"), msg.get("content")], ensure_ascii=False, sort_keys=True).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _summary_matches(old: Session, messages: Sequence[Dict[str, Any]]) -> bool:
+    """重发的完整历史在摘要覆盖的位置上与生成摘要时的消息一致"""
+    if old.summary_digest is None or old.summary_seq > len(messages):
+        return False
+    return _digest(messages[old.summary_from:old.summary_seq]) == old.summary_digest
+
+
+session_store = SessionStore(
+    maxsize=config.SESSION_STORE_SIZE,
+    ttl=config.SESSION_TTL,
+    max_messages=config.SESSION_MAX_MESSAGES,
+    persist_path=config.SESSION_STORE_PATH or None,
+)
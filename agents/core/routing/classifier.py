@@ -0,0 +1,270 @@
+"""Local pre-router: rule table + character n-gram TF-IDF logistic regression.
+
+在调用 Router LLM 之前，先用进程内的轻量分类器尝试路由：
+
+- ``RuleTableClassifier``：按 Agent 配置的关键词/正则规则，命中即返回；
+- ``NgramClassifier``：字符 n-gram TF-IDF + 多分类逻辑回归（纯 Python 实现，
+  无需 numpy/sklearn），由路由决策日志离线训练，单次预测为微秒级；
+
+置信度低于阈值时返回 None，由 Router LLM 兜底。
+"""
+
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from agents.core.routing.route_cache import RouteTurn
+from server import config
+
+logger = logging.getLogger(__name__)
+
+Prediction = Tuple[str, float]
+
+
+def turn_features(turn: RouteTurn, ngram_range: Tuple[int, int] = (1, 3)) -> Counter:
+    """字符 n-gram 词频 + 上一轮 Agent / 附件类型等上下文特征"""
+    text = f"^{turn.text}$"
+    features: Counter = Counter()
+    low, high = ngram_range
+    for n in range(low, high + 1):
+        for i in range(len(text) - n + 1):
+            features[text[i:i + n]] += 1
+    features[f"\x00prev={turn.previous_agent}"] += 1
+    for kind in turn.attachments:
+        features[f"\x00att={kind}"] += 1
+    return features
+
+
+class RuleTableClassifier:
+    """
+    关键词/正则规则表，JSON 格式::
+
+        {"rules": [{"agent": "多模态助手", "patterns": ["画.*图", "图片"], "confidence": 0.95}]}
+
+    规则按顺序匹配，首个命中的规则给出结果。
+    """
+
+    def __init__(self, rules: Sequence[Dict]):
+        self.rules = [
+            (rule["agent"],
+             re.compile("|".join(f"(?:{p})" for p in rule["patterns"])),
+             float(rule.get("confidence", 1.0)),
+             set(rule.get("attachments", [])))
+            for rule in rules if rule.get("patterns")
+        ]
+
+    @classmethod
+    def load(cls, path: str) -> "RuleTableClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f).get("rules", []))
+
+    def predict(self, turn: RouteTurn) -> Optional[Prediction]:
+        for agent, pattern, confidence, attachments in self.rules:
+            if attachments and not attachments.intersection(turn.attachments):
+                continue
+            if pattern.search(turn.text):
+                return agent, confidence
+        return None
+
+
+class NgramClassifier:
+    """字符 n-gram TF-IDF + softmax 逻辑回归"""
+
+    def __init__(self,
+                 classes: List[str],
+                 idf: Dict[str, float],
+                 weights: Dict[str, List[float]],
+                 bias: List[float],
+                 ngram_range: Tuple[int, int] = (1, 3)):
+        self.classes = classes
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.ngram_range = ngram_range
+
+    # ----------------- 推理 -----------------
+
+    def vectorize(self, turn: RouteTurn) -> Dict[str, float]:
+        """子线性 TF × IDF 并做 L2 归一化，未见过的特征直接丢弃"""
+        vector = {}
+        for feature, count in turn_features(turn, self.ngram_range).items():
+            idf = self.idf.get(feature)
+            if idf is not None:
+                vector[feature] = (1.0 + math.log(count)) * idf
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {k: v / norm for k, v in vector.items()}
+
+    def predict_proba(self, turn: RouteTurn) -> List[float]:
+        scores = list(self.bias)
+        for feature, value in self.vectorize(turn).items():
+            row = self.weights.get(feature)
+            if row is None:
+                continue
+            for c, w in enumerate(row):
+                scores[c] += w * value
+        return _softmax(scores)
+
+    def predict(self, turn: RouteTurn) -> Optional[Prediction]:
+        proba = self.predict_proba(turn)
+        best = max(range(len(proba)), key=proba.__getitem__)
+        return self.classes[best], proba[best]
+
+    # ----------------- 训练 -----------------
+
+    @classmethod
+    def train(cls,
+              samples: Sequence[Tuple[RouteTurn, str]],
+              epochs: int = 30,
+              learning_rate: float = 0.5,
+              l2: float = 1e-4,
+              min_df: int = 1,
+              ngram_range: Tuple[int, int] = (1, 3),
+              seed: int = 0) -> "NgramClassifier":
+        """用 (RouteTurn, agent) 样本做 SGD 训练"""
+        classes = sorted({label for _, label in samples})
+        index = {c: i for i, c in enumerate(classes)}
+
+        df: Counter = Counter()
+        for turn, _ in samples:
+            df.update(turn_features(turn, ngram_range).keys())
+        n_docs = len(samples)
+        idf = {f: math.log((1 + n_docs) / (1 + d)) + 1.0 for f, d in df.items() if d >= min_df}
+
+        model = cls(classes, idf, {}, [0.0] * len(classes), ngram_range)
+        data = [(model.vectorize(turn), index[label]) for turn, label in samples]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            lr = learning_rate / (1.0 + epoch * 0.1)
+            for vector, target in data:
+                scores = list(model.bias)
+                for feature, value in vector.items():
+                    row = model.weights.get(feature)
+                    if row is not None:
+                        for c, w in enumerate(row):
+                            scores[c] += w * value
+                proba = _softmax(scores)
+                grads = [p - (1.0 if c == target else 0.0) for c, p in enumerate(proba)]
+                for c, g in enumerate(grads):
+                    model.bias[c] -= lr * g
+                for feature, value in vector.items():
+                    row = model.weights.setdefault(feature, [0.0] * len(classes))
+                    for c, g in enumerate(grads):
+                        row[c] -= lr * (g * value + l2 * row[c])
+        return model
+
+    # ----------------- 持久化 -----------------
+
+    def save(self, path: str) -> None:
+        payload = {
+            "classes": self.classes,
+            "ngram_range": list(self.ngram_range),
+            "bias": [round(b, 6) for b in self.bias],
+            "idf": {f: round(v, 6) for f, v in self.idf.items()},
+            "weights": {f: [round(w, 6) for w in row] for f, row in self.weights.items()
+                        if any(abs(w) > 1e-6 for w in row)},
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "NgramClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(payload["classes"], payload["idf"], payload["weights"], payload["bias"],
+                   tuple(payload.get("ngram_range", (1, 3))))
+
+
+def _softmax(scores: List[float]) -> List[float]:
+    top = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class PreRouter:
+    """按顺序尝试各分类器，置信度达到阈值且 Agent 存在时给出结果"""
+
+    def __init__(self, classifiers: Iterable, threshold: float):
+        self.classifiers = list(classifiers)
+        self.threshold = threshold
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.classifiers)
+
+    def predict(self, turn: Optional[RouteTurn], agent_names: Sequence[str],
+                threshold: Optional[float] = None) -> Optional[Prediction]:
+        """threshold 为空时使用配置的阈值；推测执行传入 0 取最优猜测"""
+        if turn is None:
+            return None
+        threshold = self.threshold if threshold is None else threshold
+        for classifier in self.classifiers:
+            prediction = classifier.predict(turn)
+            if prediction and prediction[1] >= threshold and prediction[0] in agent_names:
+                return prediction
+        return None
+
+
+def load_pre_router() -> PreRouter:
+    """按配置加载规则表与 n-gram 模型；文件缺失或损坏时跳过对应阶段"""
+    classifiers = []
+    for path, loader in ((config.PRE_ROUTER_RULES, RuleTableClassifier.load),
+                         (config.PRE_ROUTER_MODEL, NgramClassifier.load)):
+        if not path:
+            continue
+        try:
+            classifiers.append(loader(path))
+        except (OSError, ValueError, KeyError, re.error) as e:
+            logger.warning("Failed to load pre-router stage %s: %s", path, e)
+    return PreRouter(classifiers, config.PRE_ROUTER_THRESHOLD)
+
+
+pre_router = load_pre_router()
+
+
+class RouteDecisionLog:
+    """把 Router LLM 的决策追加写入 JSONL，作为分类器的训练数据"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, turn: Optional[RouteTurn], agent: str) -> None:
+        if not self.path or turn is None:
+            return
+        line = json.dumps({
+            "ts": int(time.time()),
+            "text": turn.text,
+            "attachments": list(turn.attachments),
+            "previous_agent": turn.previous_agent,
+            "agent": agent,
+        }, ensure_ascii=False)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("Failed to write route decision log: %s", e)
+
+
+decision_log = RouteDecisionLog(config.ROUTE_DECISION_LOG)
+
+
+def load_decisions(path: str) -> List[Tuple[RouteTurn, str]]:
+    """读取路由决策日志为 (RouteTurn, agent) 样本"""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            turn = RouteTurn(row["text"], tuple(row.get("attachments") or ()), row.get("previous_agent") or "")
+            samples.append((turn, row["agent"]))
+    return samples
@@ -0,0 +1,95 @@
+"""Routing decision cache keyed by normalized conversation state."""
+
+import hashlib
+import re
+import unicodedata
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from qwen_agent.llm.schema import ASSISTANT, USER
+
+from server import config
+from server.cache import TTLCache
+
+_TRAILING_PUNCT = "?？!！。.,，~～…;；:：、"
+_WHITESPACE = re.compile(r"\s+")
+# 中文字符两侧的空白没有语义，直接去掉
+_CJK_SPACE = re.compile(r"(?<=[\u3400-\u9fff])\s+|\s+(?=[\u3400-\u9fff])")
+
+route_cache = TTLCache(
+    name="route",
+    maxsize=config.ROUTE_CACHE_SIZE,
+    ttl=config.ROUTE_CACHE_TTL,
+    persist_path=config.ROUTE_CACHE_PATH or None,
+)
+
+
+def _field(msg: Any, key: str) -> Any:
+    if isinstance(msg, dict):
+        return msg.get(key)
+    return getattr(msg, key, None)
+
+
+def normalize_text(text: str) -> str:
+    """NFKC + 小写 + 折叠空白 + 去掉结尾标点，"今天天气怎么样？" 与 "今天天气怎么样" 视为同一问题"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _CJK_SPACE.sub("", _WHITESPACE.sub(" ", text)).strip()
+    return text.rstrip(_TRAILING_PUNCT).strip()
+
+
+def agents_fingerprint(agents: List[Any]) -> str:
+    """子 Agent 集合（名称 + 描述）的指纹，Agent 配置变化后旧的路由结果自然失效"""
+    raw = "\n".join(f"{getattr(a, 'name', '')}\t{getattr(a, 'description', '')}" for a in agents)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class RouteTurn(NamedTuple):
+    """路由决策所依赖的会话状态"""
+    text: str                 # 归一化后的最后一条 user 文本
+    attachments: Tuple[str, ...]  # 该消息携带的附件类型（image/file/...）
+    previous_agent: str       # 上一轮回复的 Agent 名称
+
+
+def extract_route_turn(messages: List[Any]) -> Optional[RouteTurn]:
+    """提取最后一条 user 消息及上一轮 Agent；没有可用文本时返回 None"""
+    user_idx = None
+    for idx in range(len(messages) - 1, -1, -1):
+        if _field(messages[idx], "role") == USER:
+            user_idx = idx
+            break
+    if user_idx is None:
+        return None
+
+    content = _field(messages[user_idx], "content")
+    attachments = set()
+    if isinstance(content, str):
+        text = content
+    else:
+        texts = []
+        for item in content or []:
+            for kind in ("text", "image", "file", "audio", "video"):
+                value = _field(item, kind)
+                if value is None:
+                    continue
+                if kind == "text":
+                    texts.append(str(value))
+                else:
+                    attachments.add(kind)
+        text = "\n".join(texts)
+    text = normalize_text(text)
+    if not text:
+        return None
+
+    previous_agent = ""
+    for msg in reversed(messages[:user_idx]):
+        if _field(msg, "role") == ASSISTANT and _field(msg, "name"):
+            previous_agent = _field(msg, "name")
+            break
+    return RouteTurn(text, tuple(sorted(attachments)), previous_agent)
+
+
+def route_cache_key(turn: Optional[RouteTurn], fingerprint: str) -> Optional[str]:
+    """由归一化文本、附件类型、上一轮 Agent 与 Agent 集合指纹构成缓存键"""
+    if turn is None:
+        return None
+    raw = "\x1f".join([fingerprint, turn.previous_agent, ",".join(turn.attachments), turn.text])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
@@ -1,14 +1,25 @@
-import copy
 import logging
-from typing import Dict, Iterator, List, Optional, Union
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 
 from qwen_agent import Agent, MultiAgentHub
 from qwen_agent.agents import FnCallAgent
 from qwen_agent.llm import BaseChatModel
-from qwen_agent.llm.schema import ASSISTANT, ROLE, SYSTEM, Message
+from qwen_agent.llm.schema import ASSISTANT, ROLE, Message
 from qwen_agent.tools import BaseTool
 from qwen_agent.utils.utils import merge_generate_cfgs
 
+from agents.core.base.async_runner import arun, arun_fncall
+from agents.core.context.compaction import agent_budget, fit_to_budget
+from agents.core.context.tokens import history_tokens
+from agents.core.messaging.message_view import message_field, prefix_text, without_leading_system
+from agents.core.routing.classifier import decision_log, pre_router
+from agents.core.routing.router_context import RouterContextPolicy, default_policy, window_messages
+from agents.core.routing.route_cache import (RouteTurn, agents_fingerprint, extract_route_turn, route_cache,
+                                             route_cache_key)
+from agents.core.routing.speculation import AsyncSpeculativeRun, SpeculativeRun
+from server import config
+from server.metrics import metrics
+
 logger = logging.getLogger(__name__)
 
 ROUTER_PROMPT = '''
@@ -48,6 +59,7 @@ class QwenAgentRouter(FnCallAgent, MultiAgentHub):
                  rag_cfg: Optional[Dict] = None):
         # MultiAgentHub 相关
         self._agents = agents or []
+        self._agents_fingerprint = agents_fingerprint(self._agents)
 
         agent_descs = '\n'.join([f'- {x.name}: {x.description}' for x in self._agents])
         agent_names_str = ', '.join(self.agent_names)
@@ -94,67 +106,41 @@ class QwenAgentRouter(FnCallAgent, MultiAgentHub):
         4. 对外只 streaming 选中 agent 的输出，不暴露 Router 的中间结果。
         """
 
-        # 1) 先做一层启发式判断：是否直接沿用上一次的 Agent
-        heuristic_agent = self._pick_agent_by_heuristic(messages)
-        if heuristic_agent and heuristic_agent in self.agent_names:
-            selected_agent_name = heuristic_agent
-            logger.info(f'[Router] Heuristic choose agent: {selected_agent_name}')
-        else:
-            # 2) 否则，调用 Router 自己的 LLM 做路由
-            messages_for_router: List[Message] = []
-            for msg in messages:
-                # 把历史中的 assistant 消息补上 `Call: name` 标记，
-                # 让 Router 在 prompt 里能看到“上一轮是哪位帮手”。
-                try:
-                    role = msg[ROLE] if isinstance(msg, dict) else msg.role
-                except Exception:
-                    role = getattr(msg, 'role', None) or (msg.get('role') if isinstance(msg, dict) else None)
-
-                if role == ASSISTANT:
-                    msg = self.supplement_name_special_token(msg)
-                messages_for_router.append(msg)
-
-            router_outputs: List[List[Message]] = []
-            # OneLog.debug(f"[Router] messages_for_router: {messages_for_router}")
-
-            # 调用父类 FnCallAgent._run，但不对外 yield，只收集最后结果
-            for resp in super()._run(messages=messages_for_router, lang=lang, **kwargs):
-                router_outputs.append(resp)
-
-            if not router_outputs or not router_outputs[-1]:
-                # LLM 异常情况，兜底用第一个 agent
-                selected_agent_name = self.agent_names[0]
-            else:
-                last_msg = router_outputs[-1][-1]
-                content = last_msg.content if isinstance(getattr(last_msg, 'content', None), str) else ''
-                selected_agent_name = self._parse_call_from_content(content) or self.agent_names[0]
-
-            # logger.info(f'[Router] LLM choose agent: {selected_agent_name}')
-            llm_cfg = self.agents[self.agent_names.index(selected_agent_name)].llm
-            llm_cfg_info = self._serialize_llm_config(llm_cfg)
-            # logger.info(f"[Router] LLM choose agent: {selected_agent_name}, llm_cfg详细信息: {llm_cfg_info}")
-
-        # 3) 找到对应的子 Agent
-        if selected_agent_name not in self.agent_names:
-            # 模型生成了一个不存在的 agent 名称，兜底第一个
-            logger.warning(
-                f'[Router] Unknown agent name from model: {selected_agent_name}, '
-                f'use default: {self.agent_names[0]}'
-            )
-            selected_agent_name = self.agent_names[0]
-
-        selected_agent = self.agents[self.agent_names.index(selected_agent_name)]
+        # 1) 先做一层启发式判断：是否直接沿用上一次的 Agent；再查路由缓存与本地分类器
+        selected_agent_name, turn = self._pick_agent_without_llm(messages)
+        speculation: Optional[SpeculativeRun] = None
+        try:
+            if not selected_agent_name:
+                # 路由决策期间推测执行预测的 Agent，输出先缓存
+                guess = self._speculation_guess(turn)
+                if guess:
+                    speculation = SpeculativeRun.start(self._agent_by_name(guess),
+                                                       self._agent_messages(messages, guess), lang, kwargs)
+
+                # 2) 否则，调用 Router 自己的 LLM 做路由
+                router_outputs: List[List[Message]] = []
+                # OneLog.debug(f"[Router] messages_for_router: {messages_for_router}")
+
+                # 调用父类 FnCallAgent._run，但不对外 yield，只收集最后结果
+                for resp in super()._run(messages=self._build_router_messages(messages), lang=lang, **kwargs):
+                    router_outputs.append(resp)
+                selected_agent_name = self._select_from_router_outputs(router_outputs, turn)
+
+            # 3) 找到对应的子 Agent
+            selected_agent_name = self._resolve_agent_name(selected_agent_name)
+            if speculation is not None:
+                if speculation.agent_name == selected_agent_name:
+                    yield from speculation.commit()
+                    return
+                speculation.abort(selected_agent_name)
+        finally:
+            if speculation is not None:
+                speculation.abort()
 
         # 4) 转发消息给子 Agent
-        new_messages = copy.deepcopy(messages)
-        if new_messages:
-            first = new_messages[0]
-            first_role = first[ROLE] if isinstance(first, dict) else getattr(first, 'role', None)
-            if first_role == SYSTEM:
-                # 子 Agent 通常都会有自己的 system_message，这里可以去掉 Router 这一层的 system
-                new_messages.pop(0)
-
-        for response in selected_agent.run(messages=new_messages, lang=lang, **kwargs):
+        selected_agent = self._agent_by_name(selected_agent_name)
+        agent_messages = self._agent_messages(messages, selected_agent_name)
+        for response in selected_agent.run(messages=agent_messages, lang=lang, **kwargs):
             # 给所有 assistant 响应加上 name 字段，方便后续多轮记忆
             for i in range(len(response)):
                 if response[i].role == ASSISTANT:
@@ -162,6 +148,144 @@ class QwenAgentRouter(FnCallAgent, MultiAgentHub):
             # 这才是对外真正 streaming 的内容
             yield response
 
+    async def _arun(self, messages: List[Message], lang: str = 'en', **kwargs) -> AsyncIterator[List[Message]]:
+        """
+        _run 的异步版本（由 agents.core.base.async_runner.arun 调用），
+        路由 LLM 与子 Agent 的执行都在事件循环上完成，不占用线程。
+        """
+        selected_agent_name, turn = self._pick_agent_without_llm(messages)
+        speculation: Optional[AsyncSpeculativeRun] = None
+        try:
+            if not selected_agent_name:
+                guess = self._speculation_guess(turn)
+                if guess:
+                    speculation = AsyncSpeculativeRun(self._agent_by_name(guess),
+                                                      self._agent_messages(messages, guess), lang, kwargs)
+                router_outputs: List[List[Message]] = []
+                async for resp in arun_fncall(self, self._build_router_messages(messages), lang=lang, **kwargs):
+                    router_outputs.append(resp)
+                selected_agent_name = self._select_from_router_outputs(router_outputs, turn)
+
+            selected_agent_name = self._resolve_agent_name(selected_agent_name)
+            if speculation is not None:
+                if speculation.agent_name == selected_agent_name:
+                    async for response in speculation.commit():
+                        yield response
+                    return
+                speculation.abort(selected_agent_name)
+        finally:
+            if speculation is not None:
+                speculation.abort()
+
+        selected_agent = self._agent_by_name(selected_agent_name)
+        agent_messages = self._agent_messages(messages, selected_agent_name)
+        async for response in arun(selected_agent, agent_messages, lang=lang, **kwargs):
+            for msg in response:
+                if msg.role == ASSISTANT:
+                    msg.name = selected_agent_name
+            yield response
+
+    def _agent_by_name(self, name: str) -> Agent:
+        return self.agents[self.agent_names.index(name)]
+
+    @staticmethod
+    def _agent_messages(messages: List[Message], agent_name: str) -> List[Message]:
+        # 子 Agent 通常都会有自己的 system_message，这里去掉 Router 这一层的 system；
+        # 再按该 Agent 的输入预算从头部按整轮裁剪历史（子 Agent 的 run 会自行复制消息，这里只需新建列表）
+        return fit_to_budget(without_leading_system(messages), agent_budget(agent_name))
+
+    def _speculation_guess(self, turn: Optional[RouteTurn]) -> Optional[str]:
+        """推测执行的候选 Agent：预路由分类器的最优猜测（不看阈值），否则为默认的第一个 Agent"""
+        if not config.ROUTER_SPECULATION or not self.agents:
+            return None
+        if pre_router.enabled:
+            prediction = pre_router.predict(turn, self.agent_names, threshold=0.0)
+            if prediction:
+                return prediction[0]
+        return self.agent_names[0]
+
+    def _build_router_messages(self, messages: List[Message],
+                               policy: Optional[RouterContextPolicy] = None) -> List[Message]:
+        """
+        按路由上下文策略截取最近的历史（图片/文件替换为占位符），
+        并给其中的 assistant 消息补上 `Call: name` 标记，让 Router 能看到“上一轮是哪位帮手”
+        """
+        windowed = window_messages(messages, policy or default_policy())
+        metrics.observe("router.history_tokens", history_tokens(messages))
+        metrics.observe("router.prefill_tokens", history_tokens(windowed))
+        messages_for_router: List[Message] = []
+        for msg in windowed:
+            try:
+                role = msg[ROLE] if isinstance(msg, dict) else msg.role
+            except Exception:
+                role = getattr(msg, 'role', None) or (msg.get('role') if isinstance(msg, dict) else None)
+
+            if role == ASSISTANT:
+                msg = self.supplement_name_special_token(msg)
+            messages_for_router.append(msg)
+        return messages_for_router
+
+    def _pick_agent_without_llm(self, messages: List[Message]) -> Tuple[Optional[str], Optional[RouteTurn]]:
+        """
+        不调用 Router LLM 的选择：启发式 -> 路由缓存 -> 本地分类器。
+
+        Returns:
+            (选中的 Agent 名称或 None, 本轮的路由会话状态)
+        """
+        # 启发式、路由缓存与分类器共用一次从尾部开始的扫描
+        turn = extract_route_turn(messages)
+        selected_agent_name = self._pick_agent_by_heuristic(turn)
+        if selected_agent_name and selected_agent_name in self.agent_names:
+            logger.info(f'[Router] Heuristic choose agent: {selected_agent_name}')
+            metrics.inc("router.decisions", source="heuristic")
+            return selected_agent_name, None
+
+        if route_cache.enabled:
+            cache_key = route_cache_key(turn, self._agents_fingerprint)
+            cached = route_cache.get(cache_key) if cache_key else None
+            if cached in self.agent_names:
+                logger.info(f'[Router] Cached choose agent: {cached}')
+                metrics.inc("router.decisions", source="cache")
+                return cached, turn
+
+        if pre_router.enabled:
+            prediction = pre_router.predict(turn, self.agent_names)
+            if prediction:
+                logger.info(f'[Router] Classifier choose agent: {prediction[0]} ({prediction[1]:.2f})')
+                metrics.inc("router.decisions", source="classifier")
+                return prediction[0], turn
+        return None, turn
+
+    def _select_from_router_outputs(self, router_outputs: List[List[Message]],
+                                    turn: Optional[RouteTurn] = None) -> str:
+        """
+        从 Router LLM 的输出中解析选中的 Agent 名称，异常时兜底第一个 agent；
+        有效结果写入路由缓存与决策日志（分类器训练数据）。
+        """
+        metrics.inc("router.decisions", source="llm")
+        if not router_outputs or not router_outputs[-1]:
+            # LLM 异常情况，兜底用第一个 agent
+            return self.agent_names[0]
+        last_msg = router_outputs[-1][-1]
+        content = last_msg.content if isinstance(getattr(last_msg, 'content', None), str) else ''
+        selected_agent_name = self._parse_call_from_content(content)
+        if selected_agent_name in self.agent_names:
+            cache_key = route_cache_key(turn, self._agents_fingerprint)
+            if cache_key:
+                route_cache.set(cache_key, selected_agent_name)
+            decision_log.record(turn, selected_agent_name)
+        return selected_agent_name or self.agent_names[0]
+
+    def _resolve_agent_name(self, selected_agent_name: Optional[str]) -> str:
+        if selected_agent_name not in self.agent_names:
+            # 模型生成了一个不存在的 agent 名称，兜底第一个
+            logger.warning(
+                f'[Router] Unknown agent name from model: {selected_agent_name}, '
+                f'use default: {self.agent_names[0]}'
+            )
+            return self.agent_names[0]
+        return selected_agent_name
+
     # ----------------- 工具方法 -----------------
 
     @staticmethod
@@ -170,58 +294,12 @@ class QwenAgentRouter(FnCallAgent, MultiAgentHub):
         将历史里的 assistant 消息内容前面补上：
         "Call: {name}\n{原始内容}"
 
-        只在 Router 内部使用，不会对用户可见。
+        只在 Router 内部使用，不会对用户可见；返回叠加视图，不复制消息正文与图片等内容项。
         """
-        message = copy.deepcopy(message)
-
-        # 兼容 dict / Message 两种形式
-        if isinstance(message, dict):
-            name = message.get('name')
-            content = message.get('content')
-        else:
-            name = getattr(message, 'name', None)
-            content = getattr(message, 'content', None)
-
+        name = message_field(message, 'name')
         if not name:
             return message
-
-        # content 是 str
-        if isinstance(content, str):
-            new_content = f'Call: {name}\n{content}'
-            if isinstance(message, dict):
-                message['content'] = new_content
-            else:
-                message.content = new_content
-            return message
-
-        # content 是 list（富文本）时，找到第一个 text 项进行注入
-        if isinstance(content, list):
-            for i, item in enumerate(content):
-                # item 也可能是 pydantic 模型
-                if hasattr(item, 'model_dump'):
-                    item_dict = item.model_dump()
-                elif isinstance(item, dict):
-                    item_dict = item
-                else:
-                    continue
-
-                if 'text' in item_dict:
-                    prefix = f'Call: {name}\n'
-                    new_text = prefix + item_dict['text']
-
-                    if hasattr(item, 'text'):
-                        item.text = new_text
-                    elif isinstance(item, dict):
-                        item['text'] = new_text
-                    content[i] = item
-                    break
-
-            if isinstance(message, dict):
-                message['content'] = content
-            else:
-                message.content = content
-
-        return message
+        return prefix_text(message, f'Call: {name}\n')
 
     @staticmethod
     def _serialize_llm_config(llm_cfg) -> str:
@@ -262,55 +340,17 @@ class QwenAgentRouter(FnCallAgent, MultiAgentHub):
         agent_name = first_line[len('Call:'):].strip()
         return agent_name or None
 
-    def _pick_agent_by_heuristic(self, messages: List[Message]) -> Optional[str]:
+    @staticmethod
+    def _pick_agent_by_heuristic(turn: Optional[RouteTurn]) -> Optional[str]:
         """
         一个简单的启发式策略：
-        - 找到最近一次 assistant 消息上的 name（上一轮的 agent）；
-        - 找到最近一条 user 消息，看看是不是“继续 / 再来一个 / 这张图 / 这个文档”等；
+        - 取最近一条 user 消息之前最后一次 assistant 消息上的 name（上一轮的 agent）；
+        - 看最近一条 user 消息是不是“继续 / 再来一个 / 这张图 / 这个文档”等；
         - 如果是，就直接沿用上一轮 agent，不再调用 Router LLM。
         """
-        last_agent_name: Optional[str] = None
-        last_user_text: str = ''
-
-        # 从后往前扫描消息
-        for msg in reversed(messages):
-            # 兼容 dict / Message
-            if isinstance(msg, dict):
-                role = msg.get('role') or msg.get(ROLE)
-                content = msg.get('content')
-                name = msg.get('name')
-            else:
-                role = getattr(msg, 'role', None)
-                content = getattr(msg, 'content', None)
-                name = getattr(msg, 'name', None)
-
-            if role == ASSISTANT and last_agent_name is None and name:
-                last_agent_name = name
-
-            if role == 'user' and not last_user_text:
-                if isinstance(content, str):
-                    last_user_text = content
-                elif isinstance(content, list):
-                    texts: List[str] = []
-                    for item in content:
-                        # dict 富文本
-                        if isinstance(item, dict) and 'text' in item:
-                            t = item.get('text')
-                            if t is not None:
-                                texts.append(str(t))
-                        # pydantic / 其他对象，带 text 属性
-                        elif hasattr(item, 'text'):
-                            t = getattr(item, 'text', None)
-                            if t is not None:
-                                texts.append(str(t))
-                    if texts:
-                        last_user_text = '\n'.join(texts)
-
-                if last_user_text:
-                    break
-
-        if not last_agent_name or not last_user_text:
+        if turn is None or not turn.previous_agent:
             return None
+        last_agent_name, last_user_text = turn.previous_agent, turn.text
 
         # 一些常见的“延续”关键词，可以按需要扩展
         continuation_keywords = [
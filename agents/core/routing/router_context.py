@@ -0,0 +1,83 @@
+"""Token-budgeted history window for the routing prompt.
+
+Router LLM 只需输出一行 ``Call: name``，却要为整段会话做 prefill。这里按策略裁剪
+发给 Router 的历史：
+
+- 只保留最近 ``max_turns`` 轮（一轮从一条 user 消息开始）；
+- 从最新消息往前累计 token，超过 ``max_tokens`` 即停止；最后一条 user 消息始终保留，
+  紧邻的上一轮回答超出预算时截断保留（Router 依赖其中的 ``Call: name`` 判断延续）；
+- 窗口从回答开始时补上对应问题的截断版本（qwen-agent 要求首条非 system 消息为 user）；
+- 图片/文件等内容项替换为 ``[图片]``、``[文件: name]`` 这样的占位符。
+
+token 数使用按文本缓存的分词结果，长会话中的历史消息只需分词一次。
+"""
+
+from typing import Any, List, NamedTuple, Sequence
+
+from qwen_agent.llm.schema import ASSISTANT, SYSTEM, USER
+
+from agents.core.context.tokens import cached_count_tokens, compact_content, content_text, truncate_tokens
+from agents.core.messaging.message_view import message_field, with_content
+from server import config
+
+# 超出预算时上一轮回答（以及补上的问题）至少保留的 token 数
+_MIN_KEEP_TOKENS = 16
+
+
+class RouterContextPolicy(NamedTuple):
+    max_turns: int = 0   # 0 表示不限轮数
+    max_tokens: int = 0  # 0 表示不限 token
+
+
+def default_policy() -> RouterContextPolicy:
+    return RouterContextPolicy(config.ROUTER_HISTORY_TURNS, config.ROUTER_HISTORY_TOKENS)
+
+
+def window_messages(messages: Sequence[Any], policy: RouterContextPolicy) -> List[Any]:
+    """
+    按策略截取发给 Router 的历史；开头的 system 消息原样保留，
+    返回的消息为替换了 content 的浅拷贝，不修改原消息。
+    """
+    head = 0
+    while head < len(messages) and message_field(messages[head], "role") == SYSTEM:
+        head += 1
+    system, body = list(messages[:head]), messages[head:]
+
+    user_positions = [i for i, m in enumerate(body) if message_field(m, "role") == USER]
+    start = 0
+    if policy.max_turns > 0 and len(user_positions) > policy.max_turns:
+        start = user_positions[-policy.max_turns]
+    last_user = user_positions[-1] if user_positions else len(body) - 1
+
+    window: List[Any] = []
+    used = 0
+    idx_first = len(body)
+    for idx in range(len(body) - 1, start - 1, -1):
+        message = body[idx]
+        compacted = compact_content(message_field(message, "content"))
+        tokens = cached_count_tokens(content_text(compacted))
+        if policy.max_tokens > 0 and idx < last_user and used + tokens > policy.max_tokens:
+            if idx == last_user - 1 and message_field(message, "role") == ASSISTANT:
+                # 上一轮回答带着“上一次是哪位帮手”的信息，超出预算时截断保留；
+                # 预算中预留下面补上的问题与两处省略号
+                text = content_text(compacted)
+                keep = max(policy.max_tokens - used - _MIN_KEEP_TOKENS - 2, _MIN_KEEP_TOKENS)
+                window.append(with_content(message, truncate_tokens(text, keep) + "…"))
+                idx_first = idx
+            break
+        used += tokens
+        window.append(message if compacted is message_field(message, "content")
+                      else with_content(message, compacted))
+        idx_first = idx
+    window.reverse()
+
+    # qwen-agent 要求（system 之外）第一条是 user 消息：窗口从回答开始时补上其对应问题的截断版本
+    if window and message_field(window[0], "role") != USER:
+        previous = [i for i in user_positions if i < idx_first]
+        if previous:
+            question = content_text(compact_content(message_field(body[previous[-1]], "content")))
+            window.insert(0, with_content(body[previous[-1]], truncate_tokens(question, _MIN_KEEP_TOKENS) + "…"))
+        else:
+            while window and message_field(window[0], "role") != USER:
+                window.pop(0)
+    return system + window
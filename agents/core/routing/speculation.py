@@ -0,0 +1,231 @@
+"""Speculative execution of the predicted agent while the Router LLM decides.
+
+Router LLM 的一次决策会让首 token 时间（TTFT）整体后移。推测执行在路由决策的
+同时就启动预测的子 Agent（本地分类器的最优猜测，否则为默认 Agent）：
+
+- 输出先缓存在队列里，不对外发送；
+- 路由结果与猜测一致时确认令牌，放出缓存并继续流式输出；
+- 不一致时取消推测令牌（关闭其 LLM 流），改走路由选中的 Agent；
+- 推测令牌确认前，工具调用会在 ``QwenAgentBaseTool.call`` 处等待，不会产生副作用；
+- 同步路径的推测线程池有界：工作线程都被占用时不做推测（``speculation.runs{outcome="skipped"}``），
+  请求直接在调用方线程中等待路由结果，不在线程池队列里排队。
+
+指标：``speculation.runs{outcome}``、``speculation.ttft_gain_seconds``、
+``speculation.generated_tokens`` 与 ``speculation.wasted_tokens``。
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from qwen_agent import Agent
+from qwen_agent.llm.schema import ASSISTANT, Message
+from qwen_agent.utils.tokenization_qwen import count_tokens
+
+from agents.core.base.async_runner import arun
+from agents.core.base.cancellation import CancellationToken, bind_token, current_token
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+_executor = ThreadPoolExecutor(max_workers=config.ROUTER_SPECULATION_WORKERS, thread_name_prefix='speculation')
+# 空闲工作线程的名额：只在有空闲线程时推测，提交的任务永远不会排队
+_slots = threading.BoundedSemaphore(config.ROUTER_SPECULATION_WORKERS)
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _assistant_tokens(response: Optional[List[Message]]) -> int:
+    """统计一次累计输出中 assistant 消息的 token 数"""
+    total = 0
+    for msg in response or []:
+        if msg.role != ASSISTANT:
+            continue
+        content = msg.content
+        if isinstance(content, list):
+            content = "".join(item.text or "" for item in content if getattr(item, "text", None))
+        text = (content or "") + (msg.reasoning_content or "")
+        if msg.function_call:
+            text += msg.function_call.arguments or ""
+        total += count_tokens(text) if text else 0
+    return total
+
+
+class _Speculation:
+    """同步/异步推测执行的公共部分：令牌、计时与指标"""
+
+    def __init__(self, agent_name: str):
+        self.agent_name = agent_name
+        parent = current_token()
+        self.token = parent.child() if parent is not None else CancellationToken(speculative=True)
+        self.started = time.monotonic()
+        self.decided: Optional[float] = None
+        self.latest: Optional[List[Message]] = None
+        self._first_output: Optional[float] = None
+        self._settled = False
+
+    def _name(self, response: List[Message]) -> List[Message]:
+        for msg in response:
+            if msg.role == ASSISTANT:
+                msg.name = self.agent_name
+        return response
+
+    def _on_hit(self) -> None:
+        self.decided = time.monotonic()
+        self.token.confirm()
+        metrics.inc("speculation.runs", outcome="hit")
+        logger.info("[Router] Speculation hit: %s (router %.0f ms)",
+                    self.agent_name, (self.decided - self.started) * 1000)
+
+    def _settle(self, wasted: bool) -> None:
+        if self._settled:
+            return
+        self._settled = True
+        tokens = _assistant_tokens(self.latest)
+        metrics.inc("speculation.generated_tokens", tokens)
+        if wasted:
+            metrics.inc("speculation.wasted_tokens", tokens)
+
+    def _collapse(self, batch: List[Any]) -> Tuple[Optional[List[Message]], bool]:
+        """队列里都是累计结果，一批中只需要最新的一份；遇到结束标记时返回 finished=True"""
+        latest = None
+        for item in batch:
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            latest = item
+        if latest is not None and self._first_output is None:
+            self._first_output = time.monotonic()
+            # 不做推测时 TTFT = 路由耗时 + 子 Agent 首包耗时，推测后二者重叠，节省其中较短的一段
+            gain = min(self.decided, self._first_output) - self.started
+            metrics.observe("speculation.ttft_gain_seconds", max(0.0, gain))
+        return (self._name(latest) if latest is not None else None), batch[-1] is _DONE
+
+    def _close(self, finished: bool) -> None:
+        if not finished:
+            # 确认后调用方提前结束（如客户端断开），停止推测任务
+            self.token.cancel("client_disconnect")
+        self._settle(wasted=False)
+
+    def abort(self, actual: Optional[str] = None) -> None:
+        """路由结果与猜测不一致（或请求提前结束）时丢弃推测输出"""
+        if self._settled:
+            return
+        self.token.cancel("speculation_miss")
+        if actual is not None:
+            metrics.inc("speculation.runs", outcome="miss")
+            logger.info("[Router] Speculation miss: guessed %s, router chose %s", self.agent_name, actual)
+        self._settle(wasted=True)
+
+
+class SpeculativeRun(_Speculation):
+    """在线程池中执行推测的子 Agent，输出缓存在队列中；请通过 ``start`` 创建"""
+
+    def __init__(self, agent: Agent, messages: List[Message], lang: str, kwargs: Dict[str, Any]):
+        super().__init__(agent.name)
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        _executor.submit(self._worker, agent, messages, lang, kwargs)
+
+    @classmethod
+    def start(cls, agent: Agent, messages: List[Message], lang: str,
+              kwargs: Dict[str, Any]) -> Optional["SpeculativeRun"]:
+        """线程池有空闲线程时启动推测；已饱和时返回 None，由调用方按常规路径执行"""
+        if not _slots.acquire(blocking=False):
+            metrics.inc("speculation.runs", outcome="skipped")
+            return None
+        try:
+            return cls(agent, messages, lang, kwargs)
+        except BaseException:
+            _slots.release()
+            raise
+
+    def _worker(self, agent: Agent, messages: List[Message], lang: str, kwargs: Dict[str, Any]) -> None:
+        bind_token(self.token)
+        try:
+            for response in agent.run(messages=messages, lang=lang, **kwargs):
+                if self.token.cancelled:
+                    break
+                self.latest = response
+                self._queue.put(response)
+        except BaseException as e:
+            if not self.token.cancelled:
+                self._queue.put(_Failure(e))
+        finally:
+            self._queue.put(_DONE)
+            _slots.release()
+
+    def commit(self) -> Iterator[List[Message]]:
+        """确认推测结果：先放出缓存中最新的一份累计输出，再继续流式输出"""
+        self._on_hit()
+        finished = False
+        try:
+            while not finished:
+                batch = [self._queue.get()]
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                latest, finished = self._collapse(batch)
+                if latest is not None:
+                    yield latest
+        finally:
+            self._close(finished)
+
+
+class AsyncSpeculativeRun(_Speculation):
+    """在事件循环上执行推测的子 Agent（ASYNC_PIPELINE），输出缓存在 asyncio.Queue 中"""
+
+    def __init__(self, agent: Agent, messages: List[Message], lang: str, kwargs: Dict[str, Any]):
+        super().__init__(agent.name)
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        bind_token(self.token)
+        try:
+            # create_task 复制当前上下文，任务内 current_token() 即推测令牌
+            self._task = asyncio.create_task(self._worker(agent, messages, lang, kwargs))
+        finally:
+            bind_token(self.token.parent)
+
+    async def _worker(self, agent: Agent, messages: List[Message], lang: str, kwargs: Dict[str, Any]) -> None:
+        try:
+            async for response in arun(agent, messages, lang=lang, **kwargs):
+                if self.token.cancelled:
+                    break
+                self.latest = response
+                self._queue.put_nowait(response)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            if not self.token.cancelled:
+                self._queue.put_nowait(_Failure(e))
+        finally:
+            self._queue.put_nowait(_DONE)
+
+    def abort(self, actual: Optional[str] = None) -> None:
+        super().abort(actual)
+        self._task.cancel()
+
+    async def commit(self) -> AsyncIterator[List[Message]]:
+        self._on_hit()
+        finished = False
+        try:
+            while not finished:
+                batch = [await self._queue.get()]
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                latest, finished = self._collapse(batch)
+                if latest is not None:
+                    yield latest
+        finally:
+            self._close(finished)
+            if not finished:
+                self._task.cancel()
@@ -0,0 +1,126 @@
+"""Offline trainer / evaluator for the local pre-router.
+
+    # 从 Router LLM 决策日志训练，留出 20% 评估
+    python -m agents.core.routing.train_classifier train --data route_decisions.jsonl --out pre_router.json
+
+    # 评估已有模型（可叠加规则表），并给出不同阈值下可节省的 Router LLM 调用
+    python -m agents.core.routing.train_classifier eval --data route_decisions.jsonl \\
+        --model pre_router.json --rules pre_router_rules.json
+"""
+
+import argparse
+import random
+import time
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+from agents.core.routing.classifier import (NgramClassifier, PreRouter, RuleTableClassifier, load_decisions)
+from agents.core.routing.route_cache import RouteTurn
+
+_SWEEP = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+def evaluate(pre_router_stages: Sequence, samples: Sequence[Tuple[RouteTurn, str]], threshold: float) -> dict:
+    """统计覆盖率（= 可节省的 Router LLM 调用比例）与覆盖部分的准确率"""
+    agent_names = sorted({label for _, label in samples})
+    router = PreRouter(pre_router_stages, threshold)
+    covered = correct = 0
+    confusion: Counter = Counter()
+    start = time.perf_counter()
+    for turn, label in samples:
+        prediction = router.predict(turn, agent_names)
+        if prediction is None:
+            continue
+        covered += 1
+        if prediction[0] == label:
+            correct += 1
+        else:
+            confusion[(label, prediction[0])] += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "threshold": threshold,
+        "samples": len(samples),
+        "llm_calls_saved": covered,
+        "coverage": covered / len(samples) if samples else 0.0,
+        "accuracy_on_covered": correct / covered if covered else 0.0,
+        "avg_predict_us": elapsed / len(samples) * 1e6 if samples else 0.0,
+        "top_confusions": confusion.most_common(5),
+    }
+
+
+def _top1_accuracy(model: NgramClassifier, samples: Sequence[Tuple[RouteTurn, str]]) -> float:
+    hits = sum(1 for turn, label in samples if model.predict(turn)[0] == label)
+    return hits / len(samples) if samples else 0.0
+
+
+def _print_report(stages: Sequence, samples: Sequence[Tuple[RouteTurn, str]], threshold: float) -> None:
+    report = evaluate(stages, samples, threshold)
+    print(f"samples={report['samples']} threshold={threshold}")
+    print(f"  LLM router calls saved: {report['llm_calls_saved']} ({report['coverage']:.1%})")
+    print(f"  accuracy on those:      {report['accuracy_on_covered']:.1%}")
+    print(f"  avg predict latency:    {report['avg_predict_us']:.1f} us")
+    for (label, predicted), count in report["top_confusions"]:
+        print(f"  confused {label} -> {predicted}: {count}")
+    print("  threshold sweep (coverage / accuracy):")
+    for t in _SWEEP:
+        r = evaluate(stages, samples, t)
+        print(f"    {t:.2f}: {r['coverage']:.1%} / {r['accuracy_on_covered']:.1%}")
+
+
+def _split(samples: List[Tuple[RouteTurn, str]], holdout: float, seed: int):
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    cut = int(len(samples) * (1 - holdout))
+    return samples[:cut], samples[cut:]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="train an n-gram model from a route decision log")
+    train.add_argument("--data", required=True, help="ROUTE_DECISION_LOG JSONL file")
+    train.add_argument("--out", required=True, help="output model JSON (PRE_ROUTER_MODEL)")
+    train.add_argument("--holdout", type=float, default=0.2, help="fraction held out for evaluation")
+    train.add_argument("--epochs", type=int, default=30)
+    train.add_argument("--min-df", type=int, default=2)
+    train.add_argument("--threshold", type=float, default=0.9)
+    train.add_argument("--seed", type=int, default=0)
+
+    ev = sub.add_parser("eval", help="evaluate a model and/or rule table")
+    ev.add_argument("--data", required=True)
+    ev.add_argument("--model", default="")
+    ev.add_argument("--rules", default="")
+    ev.add_argument("--threshold", type=float, default=0.9)
+
+    args = parser.parse_args()
+    samples = load_decisions(args.data)
+    if not samples:
+        parser.error(f"no samples in {args.data}")
+
+    if args.command == "train":
+        train_set, test_set = _split(samples, args.holdout, args.seed) if args.holdout > 0 else (samples, [])
+        print(f"training on {len(train_set)} samples, classes={dict(Counter(l for _, l in train_set))}")
+        start = time.perf_counter()
+        model = NgramClassifier.train(train_set, epochs=args.epochs, min_df=args.min_df, seed=args.seed)
+        print(f"trained in {time.perf_counter() - start:.1f}s, features={len(model.weights)}")
+        print(f"train top-1 accuracy: {_top1_accuracy(model, train_set):.1%}")
+        if test_set:
+            print(f"holdout top-1 accuracy: {_top1_accuracy(model, test_set):.1%}")
+            _print_report([model], test_set, args.threshold)
+        model.save(args.out)
+        print(f"saved to {args.out}")
+        return
+
+    stages = []
+    if args.rules:
+        stages.append(RuleTableClassifier.load(args.rules))
+    if args.model:
+        stages.append(NgramClassifier.load(args.model))
+    if not stages:
+        parser.error("eval needs --model and/or --rules")
+    _print_report(stages, samples, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Delta encoding of qwen-agent cumulative responses into OpenAI chunk events."""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# (role, content, reasoning_content, function_call.name, function_call.arguments)
+_Snapshot = Tuple[str, Any, str, str, str]
+
+STREAM_MODE_FULL = "full"
+STREAM_MODE_DELTA = "delta"
+STREAM_MODES = (STREAM_MODE_FULL, STREAM_MODE_DELTA)
+
+
+def _field(msg: Any, key: str) -> Any:
+    if isinstance(msg, dict):
+        return msg.get(key)
+    return getattr(msg, key, None)
+
+
+def _snapshot(msg: Any) -> _Snapshot:
+    function_call = _field(msg, "function_call") or {}
+    content = _field(msg, "content")
+    if isinstance(content, list):
+        # 富文本内容可能被原地修改，快照时复制一份
+        content = [dict(item) if isinstance(item, dict) else _jsonable_item(item) for item in content]
+    return (
+        _field(msg, "role") or "",
+        content,
+        _field(msg, "reasoning_content") or "",
+        _field(function_call, "name") or "",
+        _field(function_call, "arguments") or "",
+    )
+
+
+def _jsonable_item(item: Any) -> Any:
+    return item.model_dump(exclude_none=True) if hasattr(item, "model_dump") else item
+
+
+class DeltaEncoder:
+    """
+    把 qwen-agent 每一步 yield 的“累计消息列表”转换为 OpenAI ``chat.completion.chunk`` 增量：
+
+    - 文本 / reasoning_content：只发送新增后缀；
+    - 工具调用：首次出现时发送 id、type 与 name，之后只发送 name / arguments 的新增部分；
+    - 工具结果（role=function）：作为一条 role=tool 的新消息整体发送。
+
+    每条新消息的首个 delta 都带 ``role``，客户端据此判断消息边界。
+    若文本、函数名或参数不是前缀增长（例如停止词后处理截断了已发送的内容），
+    发送带 ``replace: true`` 的完整消息，客户端应整体替换当前消息。
+    """
+
+    def __init__(self, task_id: str, model: str, created: int):
+        self.task_id = task_id
+        self.model = model
+        self.created = created
+        self._prev: List[_Snapshot] = []
+        self._tool_indexes: Dict[int, int] = {}
+
+    def encode(self, messages: List[Any]) -> List[Dict[str, Any]]:
+        """对比上一步的累计结果，返回本步需要发送的 chunk 列表（可能为空）"""
+        chunks: List[Dict[str, Any]] = []
+        current = [_snapshot(m) for m in messages]
+        for idx, (snap, msg) in enumerate(zip(current, messages)):
+            prev = self._prev[idx] if idx < len(self._prev) else None
+            if prev is None or prev[0] != snap[0]:
+                delta = self._new_message_delta(idx, snap, msg)
+            else:
+                delta = self._update_delta(idx, prev, snap, msg)
+            if delta:
+                chunks.append(self._chunk(delta))
+        self._prev = current
+        return chunks
+
+    def finish(self, finish_reason: str = "stop") -> Dict[str, Any]:
+        """流结束时发送的最后一个 chunk"""
+        return self._chunk({}, finish_reason=finish_reason)
+
+    # ----------------- 内部方法 -----------------
+
+    def _chunk(self, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "id": self.task_id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def _tool_call_index(self, msg_idx: int) -> int:
+        if msg_idx not in self._tool_indexes:
+            self._tool_indexes[msg_idx] = len(self._tool_indexes)
+        return self._tool_indexes[msg_idx]
+
+    def _new_message_delta(self, idx: int, snap: _Snapshot, msg: Any) -> Dict[str, Any]:
+        role, content, reasoning, fc_name, fc_args = snap
+        name = _field(msg, "name")
+        if role == "function":
+            extra = _field(msg, "extra") or {}
+            return {
+                "role": "tool",
+                "tool_call_id": extra.get("function_id"),
+                "name": name,
+                "content": content if isinstance(content, str) else (content or []),
+            }
+
+        delta: Dict[str, Any] = {"role": role}
+        if name:
+            delta["name"] = name
+        if fc_name or fc_args:
+            extra = _field(msg, "extra") or {}
+            delta["tool_calls"] = [{
+                "index": self._tool_call_index(idx),
+                "id": extra.get("function_id"),
+                "type": "function",
+                "function": {"name": fc_name, "arguments": fc_args},
+            }]
+        if reasoning:
+            delta["reasoning_content"] = reasoning
+        if isinstance(content, str):
+            if content:
+                delta["content"] = content
+        elif content:
+            delta["content"] = content
+        return delta
+
+    def _update_delta(self, idx: int, prev: _Snapshot, snap: _Snapshot, msg: Any) -> Dict[str, Any]:
+        _, prev_content, prev_reasoning, prev_name, prev_args = prev
+        _, content, reasoning, fc_name, fc_args = snap
+        if snap == prev:
+            return {}
+        if not (_extends(prev_reasoning, reasoning) and _extends(prev_content, content)
+                and _extends(prev_name, fc_name) and _extends(prev_args, fc_args)):
+            # 任一字段不是前缀增长：客户端整体替换当前消息，因此所有字段都发送完整值
+            delta = self._new_message_delta(idx, snap, msg)
+            delta.pop("role", None)
+            delta.pop("name", None)
+            if "content" not in delta:
+                delta["content"] = content if isinstance(content, str) else (content or [])
+            delta["replace"] = True
+            return delta
+
+        delta: Dict[str, Any] = {}
+        if reasoning != prev_reasoning:
+            delta["reasoning_content"] = reasoning[len(prev_reasoning):]
+        if content != prev_content and content:
+            delta["content"] = content[len(prev_content or ""):]
+        if (fc_name, fc_args) != (prev_name, prev_args):
+            tool_call: Dict[str, Any] = {"index": self._tool_call_index(idx)}
+            if not (prev_name or prev_args):
+                # 以普通文本开始的消息中首次出现工具调用
+                tool_call["id"] = (_field(msg, "extra") or {}).get("function_id")
+                tool_call["type"] = "function"
+            function: Dict[str, str] = {}
+            if fc_name != prev_name:
+                function["name"] = fc_name[len(prev_name):]
+            function["arguments"] = fc_args[len(prev_args):]
+            tool_call["function"] = function
+            delta["tool_calls"] = [tool_call]
+        return delta
+
+
+def _extends(prev: Any, value: Any) -> bool:
+    """value 是否由 prev 追加得到（文本为字符串前缀，富文本为列表前缀）"""
+    if not prev:
+        return True
+    if isinstance(prev, str) and isinstance(value, str):
+        return value.startswith(prev)
+    if isinstance(prev, list) and isinstance(value, list):
+        return value[:len(prev)] == prev
+    return False
@@ -1,21 +1,36 @@
+import asyncio
 import logging
 import json
 import time
 import uuid
-from typing import Any, Dict, Generator, List
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Iterable, List, Optional
 
 from qwen_agent.agents import FnCallAgent
+from qwen_agent.utils.tokenization_qwen import count_tokens
 
-from agents.core.messaging import ChatRequest
+from agents.core.base.async_runner import arun
+from agents.core.base.cancellation import CancellationToken, RequestCancelled, bind_token
+from agents.core.context.builder import AgentContext
+from agents.core.context.tokens import cached_count_tokens
+from agents.core.messaging import ChatCompletion, ChatRequest
+from agents.core.stream.delta_encoder import STREAM_MODE_DELTA, STREAM_MODE_FULL, STREAM_MODES, DeltaEncoder
 from fastapi.encoders import jsonable_encoder
+from server import config
+from server.log import Capped, log_sampled
+from server.metrics import metrics
 
 logger = logging.getLogger(__name__)
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("[%(asctime)s] %(levelname)s %(name)s - %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+
+
+def _message_text(msg: Dict[str, Any]) -> str:
+    """提取消息中参与 token 计数的文本（含工具调用参数）"""
+    content = msg.get("content")
+    if isinstance(content, list):
+        text = "".join(item.get("text", "") for item in content if isinstance(item, dict))
+    else:
+        text = content or ""
+    function_call = msg.get("function_call") or {}
+    return text + (msg.get("reasoning_content") or "") + (function_call.get("arguments") or "")
 
 
 class EventStreamHandler:
@@ -23,19 +38,151 @@ class EventStreamHandler:
     将 Agent 输出转换为 Qwen-Agent 原始协议的 SSE 流
     """
 
-    def __init__(self, request: ChatRequest, bot: FnCallAgent, qa_messages: List[Dict[str, Any]]):
+    def __init__(self, request: ChatRequest, bot: FnCallAgent, qa_messages: List[Dict[str, Any]],
+                 context: Optional[AgentContext] = None,
+                 on_complete: Optional[Callable[[List[Any]], None]] = None):
         self.request = request
         self.bot = bot
         self.qa_messages = qa_messages
+        self.context = context
         self.task_id = request.req_id or str(uuid.uuid4())
         self.model_name = request.model or "unknown-model"
         self._created_ts = int(time.time())
+        mode = (request.stream_mode or config.STREAM_MODE or STREAM_MODE_FULL).lower()
+        self.stream_mode = mode if mode in STREAM_MODES else STREAM_MODE_FULL
+        self._delta_encoder = (DeltaEncoder(self.task_id, self.model_name, self._created_ts)
+                               if self.stream_mode == STREAM_MODE_DELTA else None)
+        self._bytes_sent = 0
+        self._events_sent = 0
+        self._encode_seconds = 0.0
+        self.cancel_token = CancellationToken(self.task_id)
+        self.finished = False
+        # 正常结束时以最后一步累计输出回调（如写回会话存储）
+        self.on_complete = on_complete
+
+    def cancel(self, reason: str = "client_disconnect") -> None:
+        """取消执行：关闭进行中的 LLM 流，跳过后续 LLM/工具调用"""
+        if not self.finished:
+            self.cancel_token.cancel(reason)
+
+    def _bound(self, iterator: Iterable[Any]) -> Generator[Any, None, None]:
+        """
+        逐步驱动同步 Agent 生成器。Starlette 每一步可能在不同的线程中执行，
+        因此每次 next() 之前都重新绑定取消令牌。
+        """
+        iterator = iter(iterator)
+        while not self.cancel_token.cancelled:
+            bind_token(self.cancel_token)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            yield chunk
+
+    def _encode_chunk(self, chunk: Any) -> List[str]:
+        """把一步累计输出编码为 SSE 事件；delta 模式下只发送与上一步的差异"""
+        start = time.perf_counter()
+        if self._delta_encoder is not None:
+            payloads = self._delta_encoder.encode(chunk)
+        else:
+            payloads = [jsonable_encoder(chunk)]
+        events = []
+        for payload in payloads:
+            log_sampled(logger, logging.DEBUG, config.LOG_STREAM_SAMPLE_RATE,
+                        "[stream-output] task_id=%s payload=%s", self.task_id, Capped(payload))
+            events.append(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n")
+        self._record(events, time.perf_counter() - start)
+        return events
+
+    def _encode_done(self) -> List[str]:
+        """结束事件：delta 模式先发送带 finish_reason 的 chunk"""
+        events = []
+        if self._delta_encoder is not None:
+            events.append(f"data: {json.dumps(self._delta_encoder.finish(), ensure_ascii=False)}\n\n")
+        events.append("data: [DONE]\n\n")
+        self._record(events, 0.0)
+        return events
+
+    def _record(self, events: List[str], seconds: float) -> None:
+        self._bytes_sent += sum(len(e.encode("utf-8")) for e in events)
+        self._events_sent += len(events)
+        self._encode_seconds += seconds
+
+    def _finish_cancelled(self) -> None:
+        self.finished = True
+        metrics.observe("cancel.events_sent_before_cancel", self._events_sent)
+        logger.info(f"SSE stream cancelled, task_id: {self.task_id}, reason: {self.cancel_token.reason}")
+
+    def _notify_complete(self, final: Optional[List[Any]]) -> None:
+        if self.on_complete is None or not final:
+            return
+        try:
+            self.on_complete(final)
+        except Exception as e:
+            logger.warning(f"on_complete callback failed, task_id: {self.task_id}, error: {e}")
+
+    def _report_metrics(self) -> None:
+        metrics.observe("stream.bytes", self._bytes_sent, mode=self.stream_mode)
+        metrics.observe("stream.events", self._events_sent, mode=self.stream_mode)
+        metrics.observe("stream.encode_seconds", self._encode_seconds, mode=self.stream_mode)
+
+    def _build_completion(self, final: Optional[List[Any]]) -> Dict[str, Any]:
+        """把最后一步累计输出聚合为 OpenAI chat.completion 响应体"""
+        messages = jsonable_encoder(final or [])
+        # 输入历史在多轮请求中反复出现，使用按文本缓存的计数
+        input_tokens = sum(cached_count_tokens(_message_text(m)) for m in self.qa_messages if isinstance(m, dict))
+        output_tokens = sum(count_tokens(_message_text(m)) for m in messages if m.get("role") == "assistant")
+        completion = ChatCompletion.from_agent_messages(
+            messages,
+            model_name=self.model_name,
+            task_id=self.task_id,
+            created=self._created_ts,
+            usage={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+        return completion.model_dump(exclude_none=True)
+
+    def complete(self) -> Dict[str, Any]:
+        """
+        非流式执行（stream=false）：运行到结束，只保留最后一步的累计结果，
+        不做逐 chunk 的序列化。
+        """
+        logger.info(f"Starting completion, task_id: {self.task_id}")
+        final = None
+        try:
+            for final in self._bound(self.bot.run(messages=self.qa_messages, agent_context=self.context) or []):
+                pass
+        finally:
+            self.finished = True
+        self.cancel_token.raise_if_cancelled()
+        logger.info(f"Completion finished, task_id: {self.task_id}")
+        self._notify_complete(final)
+        return self._build_completion(final)
+
+    async def acomplete(self) -> Dict[str, Any]:
+        """complete 的异步版本（ASYNC_PIPELINE 模式）"""
+        logger.info(f"Starting async completion, task_id: {self.task_id}")
+        final = None
+        bind_token(self.cancel_token)
+        try:
+            async for final in arun(self.bot, self.qa_messages, agent_context=self.context):
+                pass
+        finally:
+            self.finished = True
+        self.cancel_token.raise_if_cancelled()
+        logger.info(f"Async completion finished, task_id: {self.task_id}")
+        # 回写会话存储可能包含 SQLite 提交，不在事件循环上执行
+        await asyncio.to_thread(self._notify_complete, final)
+        return self._build_completion(final)
 
     def generate_stream(self) -> Generator[str, None, None]:
         """
         生成 SSE 事件流（Qwen-Agent 原始协议）
         """
-        logger.info(f"Starting SSE stream generation, task_id: {self.task_id}")
+        logger.info(f"Starting SSE stream generation, task_id: {self.task_id}, mode: {self.stream_mode}")
 
         try:
             roles_preview = [
@@ -44,26 +191,79 @@ class EventStreamHandler:
                 if isinstance(m, dict)
             ]
             logger.info("[stream-input] task_id=%s roles=%s", self.task_id, roles_preview)
-            result = self.bot.run(messages=self.qa_messages)
+            # Agent 图是进程级共享的，请求上下文通过 run kwargs 透传给工具
+            result = self.bot.run(messages=self.qa_messages, agent_context=self.context)
             if result is None:
                 logger.info(f"Agent returned None result, task_id: {self.task_id}")
                 yield "data: [DONE]\n\n"
                 return
 
-            for chunk in result:
+            final = None
+            for chunk in self._bound(result):
+                final = chunk
                 try:
-                    payload = jsonable_encoder(chunk)
-                    logger.warning(f"[stream-output] payload={payload}")
-                    yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                    yield from self._encode_chunk(chunk)
                 except Exception as e:
                     logger.warning(f"Failed to emit chunk: type={type(chunk)}, task_id={self.task_id}, error={e}")
 
-            yield "data: [DONE]\n\n"
+            if not self.cancel_token.cancelled:
+                self._notify_complete(final)
+                yield from self._encode_done()
 
         except Exception as e:
+            if self.cancel_token.cancelled or isinstance(e, RequestCancelled):
+                # 客户端已断开，关闭上游流引发的异常无需回传
+                self._finish_cancelled()
+                return
             logger.error(f"Error in stream generation, task_id: {self.task_id}, error: {str(e)}")
             error_payload = {"error": str(e)}
             yield f"data: {json.dumps(error_payload, ensure_ascii=False)}\n\n"
             yield "data: [DONE]\n\n"
 
+        self.finished = True
+        if self.cancel_token.cancelled:
+            self._finish_cancelled()
+            return
+        self._report_metrics()
         logger.info(f"SSE stream generation completed, task_id: {self.task_id}")
+
+    async def agenerate_stream(self) -> AsyncGenerator[str, None]:
+        """
+        生成 SSE 事件流的异步版本：通过 async_runner 在事件循环上驱动 Agent，
+        并发流的数量不再受 Starlette 线程池大小限制。
+        """
+        logger.info(f"Starting async SSE stream generation, task_id: {self.task_id}, mode: {self.stream_mode}")
+
+        bind_token(self.cancel_token)
+        try:
+            final = None
+            async for chunk in arun(self.bot, self.qa_messages, agent_context=self.context):
+                if self.cancel_token.cancelled:
+                    break
+                final = chunk
+                try:
+                    for event in self._encode_chunk(chunk):
+                        yield event
+                except Exception as e:
+                    logger.warning(f"Failed to emit chunk: type={type(chunk)}, task_id={self.task_id}, error={e}")
+
+            if not self.cancel_token.cancelled:
+                await asyncio.to_thread(self._notify_complete, final)
+                for event in self._encode_done():
+                    yield event
+
+        except Exception as e:
+            if self.cancel_token.cancelled or isinstance(e, RequestCancelled):
+                self._finish_cancelled()
+                return
+            logger.error(f"Error in async stream generation, task_id: {self.task_id}, error: {str(e)}")
+            error_payload = {"error": str(e)}
+            yield f"data: {json.dumps(error_payload, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        self.finished = True
+        if self.cancel_token.cancelled:
+            self._finish_cancelled()
+            return
+        self._report_metrics()
+        logger.info(f"Async SSE stream generation completed, task_id: {self.task_id}")
@@ -4,6 +4,7 @@ from qwen_agent import Agent as QwenAgent
 from qwen_agent.agents import FnCallAgent
 
 from agents.core.base.agent import QwenBaseAgent
+from agents.core.base.tool_executor import ParallelFnCallAgent
 from agents.core.context.builder import AgentContext
 from server import config
 from tools.orchestration.agent_call import AgentCallTool
@@ -96,7 +97,7 @@ class PlanningAgent(QwenBaseAgent):
         llm_config = self.get_llm_config()
         self.log_agent_response(f"Creating {self.__class__.__name__} with sub-agents: {list(sub_agents.keys())}")
 
-        return FnCallAgent(
+        return ParallelFnCallAgent(
             llm=llm_config,
             system_message=self.SYSTEM_PROMPT,
             function_list=[agent_call_tool],
@@ -0,0 +1,76 @@
+"""Process-wide pool of prebuilt agent graphs."""
+
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, List
+
+from qwen_agent.agents import FnCallAgent
+
+logger = logging.getLogger(__name__)
+
+
+class AgentGraphPool:
+    """
+    预构建 Agent 图的进程级池。
+
+    一张“Agent 图”指 QwenAgentRouter + 全部子 Agent + LLM 客户端 + 工具实例。
+    这些对象在运行期只读（请求相关的状态都通过 run(**kwargs) 传入），
+    因此可以在并发请求间共享；池里保留 size 份独立实例，按轮转分发，
+    让不同请求分摊到不同的 LLM 客户端/工具实例上。
+    """
+
+    def __init__(self, factory: Callable[[], FnCallAgent], size: int = 1):
+        """
+        Args:
+            factory: 构建一张完整 Agent 图的工厂函数
+            size: 池中保留的图数量（至少为 1）
+        """
+        self._factory = factory
+        self._size = max(1, int(size))
+        self._graphs: List[FnCallAgent] = []
+        self._lock = threading.Lock()
+        self._cursor = itertools.count()
+        self.generation = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def built(self) -> int:
+        return len(self._graphs)
+
+    def warm_up(self) -> None:
+        """启动时预先填满整个池，避免首个请求承担构建开销"""
+        start = time.perf_counter()
+        with self._lock:
+            while len(self._graphs) < self._size:
+                self._graphs.append(self._factory())
+        logger.info(
+            "Agent graph pool warmed up: %s graph(s) in %.2fs",
+            len(self._graphs),
+            time.perf_counter() - start,
+        )
+
+    def acquire(self) -> FnCallAgent:
+        """
+        取出一张可直接使用的 Agent 图（轮转分发，无需归还）。
+        池未填满时按需补建，保证未预热时也能正常工作。
+        """
+        graphs = self._graphs
+        if len(graphs) < self._size:
+            with self._lock:
+                if len(self._graphs) < self._size:
+                    self._graphs.append(self._factory())
+                graphs = self._graphs
+        return graphs[next(self._cursor) % len(graphs)]
+
+    def rebuild(self) -> None:
+        """重新构建整个池（例如工具注册表变更后），新图构建完成后原子替换"""
+        graphs = [self._factory() for _ in range(self._size)]
+        with self._lock:
+            self._graphs = graphs
+            self.generation += 1
+        logger.info("Agent graph pool rebuilt, generation=%s", self.generation)
@@ -1,12 +1,21 @@
+"""Agent runtime and configuration helpers."""
+
 import logging
-from typing import Any
+from typing import Any, Dict, List, Optional, Tuple
 
+from fastapi.encoders import jsonable_encoder
 from qwen_agent.agents import FnCallAgent
 
 from agents.chat.main_chat_agent import MainChatAgent
+from agents.core.base.cancellation import graph_llms, install_cancellation_hooks
 from agents.core.context.builder import QwenAgentContextBuilder
+from agents.core.context.compaction import context_summarizer, with_summary
+from agents.core.messaging.blob_store import install_blob_resolvers
 from agents.core.messaging.chat_request import ChatRequest
-from agents.core.messaging.request_helper import convert_chat_request_to_messages
+from agents.core.messaging.image_preprocess import image_preprocessor
+from agents.core.messaging.chat_response import ChatCompletionMessage
+from agents.core.messaging.request_helper import InvalidMessages, RequestAnalysis
+from agents.core.messaging.session_store import Session, session_key, session_store
 from agents.core.routing.router import QwenAgentRouter
 # 修改导入，使用简化版的事件流处理器
 from agents.core.stream.event_stream_handler import EventStreamHandler
@@ -14,23 +23,87 @@ from agents.multimodal.image_agent import ImageAgent
 from agents.pim.pim_agent import PIMAgent
 from agents.planning.planning_agent import PlanningAgent
 from agents.public_api.public_api_agent import PublicAPIAgent
+from agents.routers.agent_pool import AgentGraphPool
 from server import config
+from server.log import Capped
 
 logger = logging.getLogger(__name__)
 
+
+def build_agent_graph() -> FnCallAgent:
+    """
+    构建一张完整的 Agent 图（路由器 + 全部子 Agent）。
+
+    图本身与请求无关：子 Agent 在构建时不绑定 AgentContext，
+    请求上下文在运行时通过 run(agent_context=...) 传递给工具。
+
+    Returns:
+        QwenAgentRouter 实例
+    """
+    # 基础对话助手（默认兜底Agent，放在第一位）
+    bot_basic_chat = MainChatAgent().create_agent()
+
+    # 多模态Agent（图片理解、图片生成、图片修改）
+    bot_image = ImageAgent().create_agent()
+
+    # # 文档Agent（文档RAG、文档翻译）
+    # bot_doc = DocAgent().create_agent()
+
+    # 个人信息管理Agent（邮件、日程、出行）
+    bot_pim = PIMAgent().create_agent()
+
+    # 公共API Agent（节假日、图书、行情、论文等）
+    bot_public_api = PublicAPIAgent().create_agent()
+
+    # 任务编排Agent（根据workflow编排子agent）
+    bot_plan = PlanningAgent(bot_basic_chat, bot_image, bot_pim).create_agent()
+
+    # 用qwen3-max做路由模型
+    main_chat_router_llm_config = {
+        "model": config.LLM_ROUTE_MODEL,
+        "model_type": config.LLM_PROVIDER,
+        "model_server": config.LLM_BASE_URL,
+        "api_key": config.LLM_API_KEY,
+    }
+    main_chat_router = QwenAgentRouter(
+        llm=main_chat_router_llm_config,
+        agents=[bot_basic_chat, bot_image, bot_pim, bot_public_api, bot_plan],  # MainChatAgent放在第一位作为默认兜底
+        function_list=[],
+    )
+    # 为图中所有 LLM 挂上取消钩子：客户端断开时可中止上游流
+    install_cancellation_hooks(main_chat_router)
+    # 多模态模型在构建请求时才把 blob:// 引用解析为（缩放后的）图片数据
+    install_blob_resolvers(graph_llms(main_chat_router), preprocess=image_preprocessor.apply)
+    return main_chat_router
+
+
+# 进程级 Agent 图池，由 server 启动时预热
+_agent_pool = AgentGraphPool(build_agent_graph, size=config.AGENT_POOL_SIZE)
+
+
+def get_agent_pool() -> AgentGraphPool:
+    """返回进程级 Agent 图池"""
+    return _agent_pool
+
+
 class AgentRouter:
     """主聊天代理类，负责创建和管理聊天流程"""
 
-    def __init__(self, request: ChatRequest):
+    def __init__(self, request: ChatRequest, analysis: Optional[RequestAnalysis] = None):
         """
         初始化主聊天代理
 
         Args:
             request: 聊天请求对象
+            analysis: 请求的解析结果（server 已解析时传入，避免重复扫描消息）
         """
         self.request = request
+        self.analysis = analysis
         self.qa_messages = None
         self.bot = None
+        self.handler = None
+        # 服务端会话按 (user_id, session_id) 存储，其他用户无法访问同名会话
+        self.session_key = session_key(request.user_id, request.session_id)
 
     def create_event_stream(self) -> Any:
         """
@@ -39,57 +112,99 @@ class AgentRouter:
         Returns:
             事件流生成器
         """
+        # 创建简化版事件流处理器并返回其生成器
+        return self._create_handler().generate_stream
+
+    def create_async_event_stream(self) -> Any:
+        """
+        创建主聊天代理的异步事件流（ASYNC_PIPELINE 模式）
+
+        Returns:
+            异步事件流生成器函数
+        """
+        return self._create_handler().agenerate_stream
+
+    def create_completion(self) -> Any:
+        """
+        创建非流式（stream=false）执行函数
+
+        Returns:
+            返回 chat.completion 字典的函数
+        """
+        return self._create_handler().complete
+
+    def create_async_completion(self) -> Any:
+        """
+        创建非流式执行函数的异步版本（ASYNC_PIPELINE 模式）
+
+        Returns:
+            返回 chat.completion 字典的协程函数
+        """
+        return self._create_handler().acomplete
+
+    def _create_handler(self) -> EventStreamHandler:
         # OneLog.debug(f"Request: {self.request.model_dump_json()}")
 
-        # 解析请求消息
-        self.qa_messages = convert_chat_request_to_messages(self.request)
-        logger.info(f"QA Messages: {self.qa_messages}")
+        # 解析请求消息（带 session_id 时与服务端会话历史合并）
+        if self.analysis is None:
+            self.analysis = RequestAnalysis(self.request)
+        self.qa_messages, session = self._load_messages()
+        logger.debug("QA Messages: %s", Capped(self.qa_messages))
 
-        # 创建智能助手
+        # 从池中取出预构建的智能助手，请求上下文在运行时绑定
         self.bot = self._create_bot()
-
-        # 创建简化版事件流处理器并返回其生成器
-        handler = EventStreamHandler(self.request, self.bot, self.qa_messages)
-        return handler.generate_stream
+        ctx = QwenAgentContextBuilder.buildContext(self.request, self.qa_messages, session, self.analysis)
+        # 图片预处理在后台进行，与路由决策重叠
+        image_preprocessor.prefetch(ctx.images)
+        self.handler = EventStreamHandler(self.request, self.bot, self.qa_messages, context=ctx,
+                                          on_complete=self._record_reply if session is not None else None)
+        return self.handler
+
+    def _load_messages(self) -> Tuple[List[Dict[str, Any]], Optional[Session]]:
+        """
+        解析请求消息：
+        - append=true：只转换本轮新增的消息，追加到会话历史之后（会话不存在时抛出 SessionNotFound）；
+        - 否则按完整历史转换，并用它重建会话，后续请求即可改用追加模式；
+        - 会话已有滚动摘要时，返回“摘要 + 未摘要的消息”。
+        合并后的消息没有以 user 消息结尾时抛出 InvalidMessages。
+        """
+        session_id = self.session_key
+        analysis = self.analysis
+        if not session_store.enabled or not session_id:
+            return analysis.normalized(), None
+        if self.request.append:
+            session = session_store.append(session_id, analysis.converted, analysis.files, analysis.images)
+        else:
+            session = session_store.replace(session_id, analysis.normalized(), analysis.files, analysis.images)
+        if not session.messages or session.messages[-1].get("role") != "user":
+            raise InvalidMessages("chat requires at least one user message")
+        # 已被滚动摘要覆盖的早期历史用摘要代替
+        return with_summary(session.unsummarized(), session.summary), session
+
+    def _record_reply(self, final: List[Any]) -> None:
+        """把本轮最终回复（最后一次工具调用之后的 assistant 文本）写回会话"""
+        reply = ChatCompletionMessage.from_agent_messages(jsonable_encoder(final))
+        message = {"role": "assistant", "content": reply.content}
+        if reply.name:
+            message["name"] = reply.name
+        session_store.record_reply(self.session_key, message, reply.name)
+        # 未摘要的历史过长时在后台更新滚动摘要，供后续请求使用
+        context_summarizer.schedule(self.session_key)
+
+    @property
+    def finished(self) -> bool:
+        return self.handler is None or self.handler.finished
+
+    def cancel(self, reason: str = "client_disconnect") -> None:
+        """取消进行中的执行（客户端断开时由 server 调用）"""
+        if self.handler is not None:
+            self.handler.cancel(reason)
 
     def _create_bot(self) -> FnCallAgent:
         """
-        创建主聊天代理机器人
+        获取主聊天代理机器人（来自进程级 Agent 图池，不再逐请求构建）
 
         Returns:
             FnCallAgent实例
         """
-        # 构建上下文
-        ctx = QwenAgentContextBuilder.buildContext(self.request, self.qa_messages)
-
-        # 基础对话助手（默认兜底Agent，放在第一位）
-        bot_basic_chat = MainChatAgent(ctx).create_agent()
-
-        # 多模态Agent（图片理解、图片生成、图片修改）
-        bot_image = ImageAgent(ctx).create_agent()
-
-        # # 文档Agent（文档RAG、文档翻译）
-        # bot_doc = DocAgent(ctx).create_agent()
-
-        # 个人信息管理Agent（邮件、日程、出行）
-        bot_pim = PIMAgent(ctx).create_agent()
-
-        # 公共API Agent（节假日、图书、行情、论文等）
-        bot_public_api = PublicAPIAgent(ctx).create_agent()
-
-        # 任务编排Agent（根据workflow编排子agent）
-        bot_plan = PlanningAgent(bot_basic_chat, bot_image, bot_pim).create_agent()
-
-        # 用qwen3-max做路由模型
-        main_chat_router_llm_config = {
-            "model": config.LLM_ROUTE_MODEL,
-            "model_type": config.LLM_PROVIDER,
-            "model_server": config.LLM_BASE_URL,
-            "api_key": config.LLM_API_KEY,
-        }
-        main_chat_router = QwenAgentRouter(
-            llm=main_chat_router_llm_config,
-            agents=[bot_basic_chat, bot_image, bot_pim, bot_public_api, bot_plan],  # MainChatAgent放在第一位作为默认兜底
-            function_list=[],
-        )
-        return main_chat_router
+        return get_agent_pool().acquire()
@@ -0,0 +1,87 @@
+"""Concurrent /v1/chat/completions streams: sync threadpool path vs ASYNC_PIPELINE.
+
+Both the Alfred app and a mock OpenAI-compatible LLM run in-process, so the
+numbers only compare the two execution paths against each other.
+
+    python -m benchmarks.bench_async_streams --concurrency 200 --tokens 20 --token-delay 0.02
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.mock_llm import free_port, serve_in_thread, start_mock_llm
+
+
+async def _one_stream(client: httpx.AsyncClient, url: str, idx: int) -> Dict[str, float]:
+    payload = {
+        "model": "bench",
+        "stream": True,
+        "req_id": f"bench-{idx}",
+        "session_id": f"bench-{idx}",
+        "messages": [{"role": "user", "content": f"你好，第 {idx} 个问题"}],
+    }
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", url, json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if line.startswith("data:") and ttft is None:
+                ttft = time.perf_counter() - start
+    return {"ttft": ttft or 0.0, "total": time.perf_counter() - start}
+
+
+async def _run_round(url: str, concurrency: int) -> Dict[str, float]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        start = time.perf_counter()
+        results: List[Dict[str, float]] = await asyncio.gather(
+            *(_one_stream(client, url, i) for i in range(concurrency)))
+        wall = time.perf_counter() - start
+    ttfts = sorted(r["ttft"] for r in results)
+    totals = sorted(r["total"] for r in results)
+    return {
+        "wall_s": wall,
+        "streams_per_s": concurrency / wall,
+        "ttft_p50_s": statistics.median(ttfts),
+        "ttft_p95_s": ttfts[int(len(ttfts) * 0.95) - 1],
+        "total_p50_s": statistics.median(totals),
+        "total_max_s": totals[-1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    # 必须在导入 server.app 之前把 LLM 地址指向模拟服务
+    os.environ["LLM_BASE_URL"] = start_mock_llm(tokens=args.tokens, token_delay=args.token_delay)
+    os.environ["LLM_PROVIDER"] = "oai"
+    logging.disable(logging.CRITICAL)
+
+    from server import config
+    from server.app import app
+
+    port = free_port()
+    serve_in_thread(app, port)
+    url = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    print(f"concurrency={args.concurrency} tokens={args.tokens} token_delay={args.token_delay}s")
+    for mode in (False, True):
+        config.ASYNC_PIPELINE = mode
+        stats = asyncio.run(_run_round(url, args.concurrency))
+        label = "async" if mode else "sync "
+        print(f"[{label}] " + " ".join(f"{k}={v:.3f}" for k, v in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
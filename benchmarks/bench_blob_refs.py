@@ -0,0 +1,74 @@
+"""Request size and parse memory: inline base64 images vs blob references.
+
+Replays an image-heavy conversation the way the SPA sends it (full history per
+turn, one image every few user turns) and measures, per request, the JSON bytes
+on the wire and the peak allocation of parsing it into a ChatRequest and
+converting it for the agents. ``inline`` sends data URIs; ``refs`` sends the
+``blob://`` references returned by ``POST /v1/blobs``.
+
+    python -m benchmarks.bench_blob_refs --turns 40 --image-kb 512
+"""
+
+import argparse
+import base64
+import json
+import os
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from agents.core.messaging.blob_store import blob_store
+from agents.core.messaging.chat_request import ChatRequest
+from agents.core.messaging.request_helper import convert_chat_request_to_messages, extract_images_from_request
+
+
+def _conversation(turns: int, image_every: int, image_kb: int, refs: bool) -> List[Dict[str, Any]]:
+    messages = []
+    for i in range(turns):
+        if image_every and i % image_every == 0:
+            data = os.urandom(image_kb * 1024)
+            image = blob_store.put(data, "image/png") if refs else _data_uri(data)
+            content: Any = [{"text": f"第 {i} 轮：看看这张图"}, {"image": image}]
+        else:
+            content = f"第 {i} 轮问题：" + "内容" * 50
+        messages.append({"role": "user", "content": content})
+        messages.append({"role": "assistant", "content": f"第 {i} 轮回答：" + "回答" * 100, "name": "多模态助手"})
+    return messages
+
+
+def _data_uri(data: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(data).decode()
+
+
+def _handle(body: bytes) -> None:
+    request = ChatRequest(**json.loads(body))
+    convert_chat_request_to_messages(request)
+    extract_images_from_request(request)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--image-every", type=int, default=4)
+    parser.add_argument("--image-kb", type=int, default=512)
+    args = parser.parse_args()
+
+    print(f"turns={args.turns} image every {args.image_every} turns x {args.image_kb} KB, blob store: {blob_store.root}")
+    for mode in ("inline", "refs"):
+        history = _conversation(args.turns, args.image_every, args.image_kb, refs=mode == "refs")
+        sizes, peaks, elapsed = [], [], []
+        for turn in range(1, args.turns + 1):
+            body = json.dumps({"messages": history[:turn * 2 - 1]}).encode()
+            tracemalloc.start()
+            start = time.perf_counter()
+            _handle(body)
+            elapsed.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            sizes.append(len(body))
+        print(f"[{mode:6}] last request {sizes[-1] / 1024:10.1f} KB  total sent {sum(sizes) / 1024 ** 2:9.2f} MB  "
+              f"peak alloc {max(peaks) / 1024 ** 2:8.2f} MB  parse+convert {elapsed[-1] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
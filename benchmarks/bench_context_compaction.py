@@ -0,0 +1,66 @@
+"""Sub-agent input preparation: qwen-agent truncation vs per-agent budgets.
+
+For conversations of growing length, times what happens before every sub-agent
+LLM call and reports the prefill tokens the call carries:
+
+- ``truncate``: the full history through qwen-agent's ``max_input_tokens``
+  truncation (re-tokenizes every message on every call);
+- ``budget``: ``fit_to_budget`` with CONTEXT_MAX_TOKENS (cached per-message
+  counts, measured on a repeat request) followed by the same truncation.
+
+    python -m benchmarks.bench_context_compaction --turns 50 200 800 --budget 24000
+"""
+
+import argparse
+import logging
+import time
+from typing import Callable, List
+
+from qwen_agent.llm.base import _truncate_input_messages_roughly
+from qwen_agent.llm.schema import ASSISTANT, SYSTEM, USER, Message
+
+from agents.core.context.compaction import fit_to_budget
+from agents.core.context.tokens import history_tokens
+from server import config
+
+# MainChatAgent 的 max_input_tokens
+_MAX_INPUT_TOKENS = 60000
+
+
+def _history(turns: int) -> List[Message]:
+    messages = [Message(role=SYSTEM, content="你是千问，默认对话助手。")]
+    for i in range(turns):
+        messages.append(Message(role=USER, content=f"第 {i} 轮问题：" + "细节" * 60))
+        messages.append(Message(role=ASSISTANT, content=f"第 {i} 轮回答：" + "内容" * 240, name="基础对话助手"))
+    messages.append(Message(role=USER, content="总结一下我们刚才聊的内容"))
+    return messages
+
+
+def _measure(fn: Callable[[], List[Message]], repeat: int) -> float:
+    fn()  # 预热（budget 模式下填充 token 计数缓存）
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--budget", type=int, default=config.CONTEXT_MAX_TOKENS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"budget={args.budget} max_input_tokens={_MAX_INPUT_TOKENS}")
+    for turns in args.turns:
+        messages = _history(turns)
+        truncate = lambda: _truncate_input_messages_roughly(messages, _MAX_INPUT_TOKENS)
+        budget = lambda: _truncate_input_messages_roughly(fit_to_budget(messages, args.budget), _MAX_INPUT_TOKENS)
+        for name, fn in (("truncate", truncate), ("budget", budget)):
+            ms = _measure(fn, args.repeat)
+            print(f"turns={turns:4d} [{name:8}] {ms:8.2f} ms/call  prefill tokens {history_tokens(fn()):7d}")
+
+
+if __name__ == "__main__":
+    main()
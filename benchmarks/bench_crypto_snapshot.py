@@ -0,0 +1,156 @@
+"""Crypto tools: per-call ticker downloads vs the shared market snapshot.
+
+Starts a local fake Coinpaprika ``/v1/tickers`` (``--coins`` entries shaped like
+the real payload) and CoinCap ``/v2/assets?search=`` endpoint, then compares:
+
+- legacy: crypto_market downloading and ``resp.json()``-parsing the full list
+  per call, crypto_price doing one CoinCap search per symbol;
+- snapshot: the cold streaming fetch (time and peak traced memory against
+  ``resp.json()``) and warm crypto_price / crypto_market calls from memory.
+
+    python -m benchmarks.bench_crypto_snapshot --coins 8000 --symbols 5
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+from tools.core.http_client import http_client
+from tools.core.utils import safe_get_json
+from tools.public_api import crypto
+
+
+def _tickers(count: int) -> List[Dict[str, Any]]:
+    rng = random.Random(7)
+    tickers = []
+    for rank in range(1, count + 1):
+        symbol = f"C{rank}" if rank > 3 else ("BTC", "ETH", "SOL")[rank - 1]
+        usd = {key: rng.uniform(0, 1e9) for key in (
+            "price", "volume_24h", "volume_24h_change_24h", "market_cap", "market_cap_change_24h", "ath_price")}
+        usd.update({key: rng.uniform(-30, 30) for key in (
+            "percent_change_15m", "percent_change_30m", "percent_change_1h", "percent_change_6h",
+            "percent_change_12h", "percent_change_24h", "percent_change_7d", "percent_change_30d",
+            "percent_change_1y", "percent_from_price_ath")})
+        usd["ath_date"] = "2024-03-14T07:10:36Z"
+        tickers.append({
+            "id": f"{symbol.lower()}-coin-{rank}", "name": f"Coin {rank}", "symbol": symbol, "rank": rank,
+            "total_supply": rng.randint(1, 10 ** 12), "max_supply": 0, "beta_value": rng.random(),
+            "first_data_at": "2018-01-01T00:00:00Z", "last_updated": "2026-10-17T00:00:00Z",
+            "quotes": {"USD": usd},
+        })
+    return tickers
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    tickers_body = b"[]"
+    by_symbol: Dict[str, Dict[str, Any]] = {}
+    latency = 0.05
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        time.sleep(self.latency)
+        if url.path == "/v1/tickers":
+            body = self.tickers_body
+        else:
+            symbol = parse_qs(url.query).get("search", [""])[0]
+            item = self.by_symbol.get(symbol)
+            body = json.dumps({"data": [item] if item else []}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def _peak(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--coins", type=int, default=8000)
+    parser.add_argument("--symbols", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    tickers = _tickers(args.coins)
+    _Handler.tickers_body = json.dumps(tickers).encode()
+    _Handler.by_symbol = {t["symbol"]: {"symbol": t["symbol"], "name": t["name"], "rank": str(t["rank"]),
+                                        "priceUsd": str(t["quotes"]["USD"]["price"])} for t in tickers}
+    _Handler.latency = args.latency_ms / 1000
+    base = _serve()
+    tickers_url = f"{base}/v1/tickers"
+    symbols = ["BTC", "ETH", "SOL"] + [f"C{i}" for i in range(10, 10 + args.symbols)]
+    symbols = symbols[:args.symbols]
+
+    def _legacy_market() -> None:
+        _, payload = safe_get_json(tickers_url)
+        return payload[:5]
+
+    def _legacy_price() -> None:
+        for symbol in symbols:
+            safe_get_json(f"{base}/v2/assets?search={symbol}")
+
+    def _json_parse() -> Any:
+        return http_client.get(tickers_url).json()
+
+    service = crypto.MarketSnapshotService(url=tickers_url)
+    crypto.market_snapshot = service
+    price_tool, market_tool = crypto.CryptoPriceTool(), crypto.CryptoMarketTool()
+    price_call = json.dumps({"symbols": symbols})
+    market_call = json.dumps({"limit": 10, "sort_by": "change_24h"})
+
+    legacy_market = _time(_legacy_market, args.repeat)
+    legacy_price = _time(_legacy_price, args.repeat)
+    cold = _time(service.refresh, args.repeat)
+    json_peak = _peak(_json_parse)
+    stream_peak = _peak(service.refresh)
+    warm_price = _time(lambda: price_tool.call(price_call), args.repeat * 20)
+    warm_market = _time(lambda: market_tool.call(market_call), args.repeat * 20)
+    assert json.loads(price_tool.call(price_call))["count"] == len(symbols)
+
+    print(f"{args.coins} coins ({len(_Handler.tickers_body) / 1e6:.1f} MB), ~{args.latency_ms:.0f} ms/request")
+    print(f"legacy   crypto_market {legacy_market * 1000:8.1f} ms  crypto_price x{len(symbols)} "
+          f"{legacy_price * 1000:8.1f} ms")
+    print(f"snapshot cold fetch    {cold * 1000:8.1f} ms  crypto_price x{len(symbols)} {warm_price * 1000:8.2f} ms  "
+          f"crypto_market sorted {warm_market * 1000:6.2f} ms")
+    print(f"peak traced memory: resp.json() {json_peak / 1e6:6.1f} MB  streaming snapshot {stream_peak / 1e6:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
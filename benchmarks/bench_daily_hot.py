@@ -0,0 +1,112 @@
+"""daily_hot_trends: sequential board fetches vs cached concurrent fan-out.
+
+Starts a local fake DailyHot server with ``--boards`` routes, each answering
+after ``--latency-ms`` (one board in ``--slow-every`` stalls for ``--slow-ms``
+to exercise the deadline). Times one full ``daily_hot_trends`` call the old
+way (``/all`` plus every board one after another), a cold call through the
+shared service and a warm call served from the per-board cache.
+
+    python -m benchmarks.bench_daily_hot --boards 40 --latency-ms 150
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from server import config
+from tools.content import daily_hot
+from tools.content.daily_hot import DailyHotService, DailyHotTrendsTool, _format_hot_board
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    boards = 40
+    latency = 0.15
+    slow_every = 0
+    slow = 0.0
+
+    def do_GET(self):
+        if self.path == "/all":
+            payload = {"code": 200, "routes": [{"name": f"board{i}", "path": f"/board{i}"} for i in range(self.boards)]}
+        else:
+            index = int(self.path.lstrip("/board") or 0)
+            stalled = self.slow_every and index % self.slow_every == self.slow_every - 1
+            time.sleep(self.slow if stalled else self.latency)
+            payload = {
+                "code": 200,
+                "title": self.path,
+                "updateTime": datetime.now(timezone.utc).isoformat(),
+                "data": [{"title": f"item {n}", "hot": n, "url": f"https://example.com/{n}"} for n in range(20)],
+            }
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            # 客户端已超时断开
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _sequential(service: DailyHotService) -> None:
+    # 改造前的流程：每次都拉取 /all，再逐个榜单串行请求
+    _, routes = service._get_json(f"{service.base_url}/all")
+    for cat in routes["routes"]:
+        _, payload = service._get_json(f"{service.base_url}{cat['path']}")
+        _format_hot_board(cat["name"], payload, 5)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--slow-every", type=int, default=0, help="every Nth board stalls (0 = none)")
+    parser.add_argument("--slow-ms", type=float, default=5000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    _Handler.boards = args.boards
+    _Handler.latency = args.latency_ms / 1000
+    _Handler.slow_every = args.slow_every
+    _Handler.slow = args.slow_ms / 1000
+    daily_hot.daily_hot_service = DailyHotService(_serve())
+    tool = DailyHotTrendsTool()
+
+    start = time.perf_counter()
+    _sequential(daily_hot.daily_hot_service)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output = tool.call("{}")
+    cold = time.perf_counter() - start
+    timeouts = output.count("获取超时")
+
+    # 截止时间后仍在进行的榜单请求在后台完成并写入缓存
+    time.sleep(args.slow_ms / 1000 if args.slow_every else 0)
+    start = time.perf_counter()
+    tool.call("{}")
+    warm = time.perf_counter() - start
+
+    print(f"{args.boards} boards x ~{args.latency_ms:.0f} ms (concurrency {config.DAILY_HOT_CONCURRENCY}, "
+          f"deadline {config.DAILY_HOT_DEADLINE:g}s): sequential {sequential * 1000:8.1f} ms  "
+          f"fan-out {cold * 1000:8.1f} ms ({timeouts} timed out)  cached {warm * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Tool HTTP calls: a new connection per request vs the shared pooled client.
+
+Starts a small local HTTP server (or uses ``--url``) and times sequential GETs
+with ``requests.get`` (what the tools used to do), the shared sync client and
+the shared async client, plus a concurrent batch on each pooled client. Against
+a remote HTTPS endpoint the gap also includes DNS and the TLS handshake.
+
+    python -m benchmarks.bench_http_pool --requests 200
+    python -m benchmarks.bench_http_pool --url https://api.ipify.org?format=json --requests 20
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+import requests
+
+from tools.core.http_client import http_client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/json"
+
+
+def _sequential(fn: Callable[[], None], n: int) -> List[float]:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _async_sequential(url: str, n: int) -> List[float]:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        (await http_client.aget(url)).raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _async_batch(url: str, n: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one():
+        async with semaphore:
+            (await http_client.aget(url)).raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one() for _ in range(n)))
+    return time.perf_counter() - start
+
+
+def _report(label: str, samples: List[float]) -> None:
+    print(f"{label:<22} median {statistics.median(samples) * 1000:8.2f} ms  "
+          f"p95 {sorted(samples)[int(len(samples) * 0.95)] * 1000:8.2f} ms  total {sum(samples):7.2f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="", help="endpoint to GET; a local server when omitted")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    url = args.url or _serve()
+
+    _report("requests.get", _sequential(lambda: requests.get(url, timeout=30).raise_for_status(), args.requests))
+    _report("pooled sync", _sequential(lambda: http_client.get(url).raise_for_status(), args.requests))
+
+    async def _async_runs():
+        _report("pooled async", await _async_sequential(url, args.requests))
+        return await _async_batch(url, args.requests, args.concurrency)
+
+    async_batch = asyncio.run(_async_runs())
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: http_client.get(url).raise_for_status(), range(args.requests)))
+        sync_batch = time.perf_counter() - start
+    print(f"concurrent x{args.concurrency}: pooled sync {sync_batch:6.2f} s  pooled async {async_batch:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""VL prefill cost vs image max side.
+
+For each ``--max-sides`` value (0 = the original image) reports preprocessing
+time, encoded size and pixel count of the image the VL model would receive,
+plus an estimate of its visual tokens (one token per 28x28 patch, as in
+Qwen-VL). With ``--live`` it also sends the image to LLM_VL_MODEL and reports
+time to first token, total latency and the server-reported prompt tokens.
+
+    python -m benchmarks.bench_image_preprocess --image photo.jpg --live
+"""
+
+import argparse
+import base64
+import io
+import logging
+import statistics
+import time
+from typing import Dict, Optional
+
+import openai
+from PIL import Image
+
+from agents.core.messaging.image_preprocess import preprocess_image
+from server import config
+
+
+def _synthetic(width: int, height: int) -> bytes:
+    """带细节的合成照片（渐变 + 噪声），JPEG 编码"""
+    base = Image.radial_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 48).convert("RGB")
+    buf = io.BytesIO()
+    Image.blend(base, noise, 0.35).save(buf, "JPEG", quality=92)
+    return buf.getvalue()
+
+
+def _ask(client: openai.OpenAI, data: bytes, mime: str) -> Dict[str, Optional[float]]:
+    uri = f"data:{mime};base64," + base64.b64encode(data).decode()
+    start = time.perf_counter()
+    first = None
+    usage = None
+    stream = client.chat.completions.create(
+        model=config.LLM_VL_MODEL,
+        messages=[{"role": "user", "content": [{"type": "image_url", "image_url": {"url": uri}},
+                                                {"type": "text", "text": "用一句话描述这张图片。"}]}],
+        stream=True,
+        stream_options={"include_usage": True},
+        max_tokens=32,
+    )
+    for chunk in stream:
+        if first is None and chunk.choices and chunk.choices[0].delta.content:
+            first = time.perf_counter() - start
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage.prompt_tokens
+    return {"ttft": first, "total": time.perf_counter() - start, "prompt_tokens": usage}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", default="", help="image file; a synthetic 4000x3000 photo when omitted")
+    parser.add_argument("--max-sides", type=int, nargs="+", default=[0, 2048, 1536, 1280, 1024, 768, 512])
+    parser.add_argument("--format", default=config.IMAGE_FORMAT, choices=["jpeg", "webp"])
+    parser.add_argument("--quality", type=int, default=config.IMAGE_QUALITY)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--live", action="store_true", help="also query LLM_VL_MODEL")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            source = f.read()
+    else:
+        source = _synthetic(4000, 3000)
+    with Image.open(io.BytesIO(source)) as im:
+        source_mime = Image.MIME.get(im.format, "image/jpeg")
+    client = openai.OpenAI(base_url=config.LLM_BASE_URL, api_key=config.LLM_API_KEY) if args.live else None
+
+    for max_side in args.max_sides:
+        timings = []
+        data, mime = source, source_mime
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            processed = preprocess_image(source, max_side, args.format, args.quality) if max_side else None
+            timings.append(time.perf_counter() - start)
+        if processed is not None:
+            data, mime = processed, f"image/{args.format}"
+        with Image.open(io.BytesIO(data)) as im:
+            width, height = im.size
+        line = (f"max_side={max_side or 'orig':>5} {width:5d}x{height:<5d} {len(data) / 1024:8.1f} KB "
+                f"preprocess {statistics.median(timings) * 1000:7.1f} ms  ~{width * height // (28 * 28):6d} visual tokens")
+        if client is not None:
+            runs = [_ask(client, data, mime) for _ in range(args.repeat)]
+            ttft = statistics.median(r["ttft"] or r["total"] for r in runs)
+            total = statistics.median(r["total"] for r in runs)
+            line += f"  ttft {ttft * 1000:8.1f} ms  total {total * 1000:8.1f} ms  prompt_tokens {runs[-1]['prompt_tokens']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
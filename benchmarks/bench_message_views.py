@@ -0,0 +1,86 @@
+"""Router-side message preparation: deepcopy vs copy-on-write views.
+
+Builds a long conversation (default 200 turns, an inline base64 image every few
+user turns) and times what QwenAgentRouter does before the LLM calls: inject
+``Call: name`` into assistant history for the router LLM and forward the history
+without the router system message to the selected agent.
+
+    python -m benchmarks.bench_message_views --turns 200 --image-kb 256
+"""
+
+import argparse
+import base64
+import copy
+import os
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from qwen_agent.llm.schema import ASSISTANT, SYSTEM, USER, ContentItem, Message
+
+from agents.core.messaging.message_view import without_leading_system
+from agents.core.routing.router import QwenAgentRouter
+
+
+def _history(turns: int, image_every: int, image_kb: int) -> List[Message]:
+    image = "data:image/png;base64," + base64.b64encode(os.urandom(image_kb * 768)).decode()
+    messages = [Message(role=SYSTEM, content="router system prompt")]
+    for i in range(turns):
+        if image_every and i % image_every == 0:
+            content = [ContentItem(text=f"第 {i} 轮：看看这张图"), ContentItem(image=image)]
+        else:
+            content = f"第 {i} 轮问题：" + "内容" * 50
+        messages.append(Message(role=USER, content=content))
+        messages.append(Message(role=ASSISTANT, content=f"第 {i} 轮回答：" + "回答" * 100, name="多模态助手"))
+    return messages
+
+
+def _legacy(messages: List[Message]) -> Tuple[List[Message], List[Message]]:
+    """改造前的做法：每条 assistant 消息深拷贝后注入前缀，转发前再深拷贝整段历史"""
+    for_router = []
+    for msg in messages:
+        if msg.role == ASSISTANT and msg.name:
+            msg = copy.deepcopy(msg)
+            msg.content = f"Call: {msg.name}\n{msg.content}"
+        for_router.append(msg)
+    forwarded = copy.deepcopy(messages)
+    if forwarded and forwarded[0].role == SYSTEM:
+        forwarded.pop(0)
+    return for_router, forwarded
+
+
+def _views(messages: List[Message]) -> Tuple[List[Message], List[Message]]:
+    for_router = [QwenAgentRouter.supplement_name_special_token(m) if m.role == ASSISTANT else m for m in messages]
+    return for_router, without_leading_system(messages)
+
+
+def _measure(fn: Callable, messages: List[Message], repeat: int) -> Tuple[float, float]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(messages)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn(messages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--image-every", type=int, default=5, help="attach an image every N user turns (0: none)")
+    parser.add_argument("--image-kb", type=int, default=256, help="base64 size of each image in KB")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = _history(args.turns, args.image_every, args.image_kb)
+    images = (args.turns + args.image_every - 1) // args.image_every if args.image_every else 0
+    print(f"turns={args.turns} messages={len(messages)} images={images} x {args.image_kb} KB")
+    for name, fn in (("deepcopy", _legacy), ("views", _views)):
+        ms, peak_mb = _measure(fn, messages, args.repeat)
+        print(f"[{name:8}] {ms:8.2f} ms/request  peak alloc {peak_mb:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
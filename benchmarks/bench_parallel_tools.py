@@ -0,0 +1,89 @@
+"""Multi-tool agent steps: serial vs batched parallel tool execution.
+
+Simulates one LLM turn that emits several tool calls (e.g. weather for three
+cities plus crypto_price), each a side-effect-free tool with ``--latency-ms``
+of network wait, optionally followed by a serial tool (send_email-like). Reports
+the wall-clock time of the step with the old one-by-one loop and with
+``run_tool_calls`` / ``arun_tool_calls``, and checks results keep call order.
+
+    python -m benchmarks.bench_parallel_tools --calls 4 --latency-ms 300
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List
+
+from qwen_agent.agents import FnCallAgent
+
+from agents.core.base.async_runner import arun_tool_calls
+from agents.core.base.tool_executor import run_tool_calls
+from tools.core.base import QwenAgentBaseTool
+
+
+class _RemoteLookup(QwenAgentBaseTool):
+    name = "bench_remote_lookup"
+    description = "bench"
+    side_effect_free = True
+    parameters = {"type": "object", "properties": {"key": {"type": "string"}}, "required": ["key"]}
+    latency = 0.3
+
+    def _execute_tool(self, params: Dict[str, Any], **_: Any) -> str:
+        args = self._verify_json_format_args(params)
+        # 抖动模拟不同 API 的响应时间
+        time.sleep(self.latency * random.uniform(0.5, 1.0))
+        return json.dumps({"key": args["key"]})
+
+
+class _Notify(_RemoteLookup):
+    name = "bench_notify"
+    side_effect_free = False
+
+
+def _serial(agent: FnCallAgent, calls: List) -> List[Any]:
+    return [agent._call_tool(name, args) for name, args in calls]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--with-serial", action="store_true", help="append a serial (side-effecting) call")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    _RemoteLookup.latency = args.latency_ms / 1000
+    # 不会调用模型，只用到 Agent 的工具表
+    agent = FnCallAgent(function_list=[_RemoteLookup(), _Notify()],
+                        llm={"model": "bench", "model_server": "http://127.0.0.1:1/v1", "api_key": "EMPTY"})
+    calls = [("bench_remote_lookup", json.dumps({"key": f"city-{i}"})) for i in range(args.calls)]
+    if args.with_serial:
+        calls.append(("bench_notify", json.dumps({"key": "email"})))
+    expected = [json.loads(a)["key"] for _, a in calls]
+
+    start = time.perf_counter()
+    _serial(agent, calls)
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [r for _, r in sorted(run_tool_calls(agent, calls))]
+    parallel = time.perf_counter() - start
+    assert [json.loads(r)["key"] for r in results] == expected
+
+    async def _async() -> List[Any]:
+        return [r async for _, r in arun_tool_calls(agent, calls)]
+
+    start = time.perf_counter()
+    async_results = asyncio.run(_async())
+    async_parallel = time.perf_counter() - start
+    assert [json.loads(r)["key"] for r in async_results] == expected
+
+    print(f"{len(calls)} calls x ~{args.latency_ms:.0f} ms: serial {serial * 1000:7.1f} ms  "
+          f"parallel {parallel * 1000:7.1f} ms  async parallel {async_parallel * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
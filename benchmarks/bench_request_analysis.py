@@ -0,0 +1,125 @@
+"""Request parsing: repeated message scans vs one RequestAnalysis pass.
+
+Builds a long multimodal history (images and file attachments every few user
+turns, plus ``parameters.files``) and times what a chat request used to go
+through before reaching the router: the logging preview scan, message
+conversion + role normalization, file extraction with the linear-search merge
+and image extraction. ``single`` builds one RequestAnalysis instead. Also
+times the router's pre-LLM scans (heuristic + route turn) on the result.
+
+    python -m benchmarks.bench_request_analysis --turns 400 --files 200
+"""
+
+import argparse
+import logging
+import statistics
+import time
+from typing import Any, Dict, List
+
+from agents.core.messaging.chat_request import ChatRequest
+from agents.core.messaging.request_helper import RequestAnalysis, append_normalized, convert_messages
+from agents.core.routing.route_cache import extract_route_turn
+from agents.core.routing.router import QwenAgentRouter
+
+
+def _body(turns: int, attach_every: int, param_files: int) -> Dict[str, Any]:
+    messages: List[Dict[str, Any]] = [{"role": "system", "content": "client system prompt"}]
+    for i in range(turns):
+        if attach_every and i % attach_every == 0:
+            content: Any = [{"type": "text", "text": f"第 {i} 轮：看看这张图和文件"},
+                            {"image": f"https://img.example.com/{i}.png"},
+                            {"image_url": f"https://img.example.com/{i % 7}.png"},
+                            {"file": f"https://files.example.com/{i}.pdf", "file_id": f"f{i}"}]
+        else:
+            content = f"第 {i} 轮问题：" + "内容" * 50
+        messages.append({"role": "user", "content": content})
+        messages.append({"role": "assistant", "content": f"第 {i} 轮回答：" + "回答" * 100, "name": "多模态助手"})
+    messages.append({"role": "user", "content": "继续"})
+    files = [f"https://files.example.com/{i}.pdf" for i in range(param_files)]
+    return {"messages": messages, "parameters": {"files": files}, "session_id": "bench"}
+
+
+def _legacy_preview(body: Dict[str, Any]) -> str:
+    for msg in reversed(body["messages"]):
+        if msg.get("role") == "user":
+            content = msg.get("content")
+            if isinstance(content, str):
+                return content[:200]
+            return " | ".join(p.get("text", "") for p in content if p.get("type") == "text")[:200]
+    return ""
+
+
+def _legacy_files(request: ChatRequest) -> List[Dict[str, str]]:
+    files_list = [{"file": f, "file_id": ""} for f in request.parameters.get("files", [])]
+    for m in request.messages:
+        if isinstance(m.content, list):
+            for item in m.content:
+                if isinstance(item, dict) and "file" in item:
+                    # 改造前的合并：对已有列表线性查找，O(n²)
+                    for existing in files_list:
+                        if existing["file"] == item["file"]:
+                            if not existing["file_id"] and item.get("file_id"):
+                                existing["file_id"] = item["file_id"]
+                            break
+                    else:
+                        files_list.append({"file": item["file"], "file_id": item.get("file_id", "")})
+    return files_list
+
+
+def _legacy_images(request: ChatRequest) -> List[str]:
+    images = []
+    for m in request.messages:
+        if isinstance(m.content, list):
+            for item in m.content:
+                if isinstance(item, dict):
+                    images.extend(item[k] for k in ("image", "image_url") if isinstance(item.get(k), str))
+    return list(dict.fromkeys(images))
+
+
+def _legacy(body: Dict[str, Any]) -> None:
+    _legacy_preview(body)
+    request = ChatRequest(**body)
+    append_normalized([], convert_messages(request.messages))
+    # 会话模式下文件/图片先提取一次写入会话，无会话时 buildContext 再提取一次
+    _legacy_files(request)
+    _legacy_images(request)
+    _legacy_files(request)
+    _legacy_images(request)
+
+
+def _single(body: Dict[str, Any]) -> None:
+    RequestAnalysis(ChatRequest(**body))
+
+
+def _time(fn, *args, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[100, 400, 1600])
+    parser.add_argument("--attach-every", type=int, default=2)
+    parser.add_argument("--files", type=int, default=200, help="parameters.files entries")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    for turns in args.turns:
+        body = _body(turns, args.attach_every, args.files)
+        legacy = _time(_legacy, body, repeat=args.repeat)
+        single = _time(_single, body, repeat=args.repeat)
+        analysis = RequestAnalysis(ChatRequest(**body))
+        route = _time(lambda m: QwenAgentRouter._pick_agent_by_heuristic(extract_route_turn(m)),
+                      analysis.messages, repeat=args.repeat)
+        print(f"turns={turns:5d} files={len(analysis.files):5d} images={len(analysis.images):5d}  "
+              f"legacy {legacy * 1000:8.2f} ms  single {single * 1000:8.2f} ms  ({legacy / single:5.1f}x)  "
+              f"router scans {route * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Router prefill tokens and routing decisions: full history vs windowed history.
+
+Replays conversations through QwenAgentRouter._build_router_messages with the
+full history and with the configured ROUTER_HISTORY_* policy, reporting the
+prefill tokens the router LLM would receive. With ``--live`` it also asks the
+router LLM (LLM_ROUTE_MODEL) under both policies and reports decision agreement
+and, when the replay set carries an ``agent`` label, accuracy.
+
+Replay set: JSONL, one ``{"messages": [...], "agent": "..."}`` per line (OpenAI
+style messages, the last one from the user). Without ``--data`` a synthetic
+set of long conversations with inline images is used.
+
+    python -m benchmarks.bench_router_context --data replay.jsonl --live
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from qwen_agent.agents import FnCallAgent
+from qwen_agent.llm.schema import SYSTEM, Message
+
+from agents.core.context.tokens import history_tokens
+from agents.core.routing.router import QwenAgentRouter
+from agents.core.routing.router_context import RouterContextPolicy, default_policy
+
+_FULL = RouterContextPolicy(0, 0)
+
+
+def _synthetic(count: int, turns: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    agents = ["基础对话助手", "多模态助手", "个人信息管理助手", "公共API助手"]
+    image = "data:image/png;base64," + "A" * 200_000
+    samples = []
+    for _ in range(count):
+        messages = []
+        for i in range(rng.randint(turns // 2, turns)):
+            if rng.random() < 0.2:
+                messages.append({"role": "user", "content": [{"text": f"第 {i} 轮看看这张图"}, {"image": image}]})
+            else:
+                messages.append({"role": "user", "content": f"第 {i} 轮的问题：" + "细节" * rng.randint(10, 80)})
+            messages.append({"role": "assistant", "name": rng.choice(agents),
+                             "content": f"第 {i} 轮回答：" + "内容" * rng.randint(50, 300)})
+        messages.append({"role": "user", "content": rng.choice(["明天杭州天气怎么样", "帮我画一只猫", "继续", "讲个笑话"])})
+        samples.append({"messages": messages})
+    return samples
+
+
+def _load(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _router_messages(router: QwenAgentRouter, sample: Dict[str, Any], policy: RouterContextPolicy) -> List[Message]:
+    messages = [Message(role=SYSTEM, content=router.system_message)] + [Message(**m) for m in sample["messages"]]
+    return router._build_router_messages(messages, policy)
+
+
+def _route(router: QwenAgentRouter, messages: List[Message]) -> Tuple[Optional[str], float]:
+    start = time.perf_counter()
+    outputs = list(FnCallAgent._run(router, messages, lang="zh"))
+    elapsed = time.perf_counter() - start
+    content = outputs[-1][-1].content if outputs and outputs[-1] else ""
+    return router._parse_call_from_content(content if isinstance(content, str) else ""), elapsed
+
+
+def _pct(values: List[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="", help="replay JSONL; synthetic conversations when omitted")
+    parser.add_argument("--samples", type=int, default=50, help="synthetic conversation count")
+    parser.add_argument("--turns", type=int, default=40, help="max turns per synthetic conversation")
+    parser.add_argument("--live", action="store_true", help="also query the router LLM under both policies")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    from agents.routers.agent_router import build_agent_graph
+    router = build_agent_graph()
+    samples = _load(args.data) if args.data else _synthetic(args.samples, args.turns)
+    policy = default_policy()
+    print(f"samples={len(samples)} policy={policy._asdict()}")
+
+    tokens: Dict[str, List[int]] = {"full": [], "window": []}
+    latency: Dict[str, List[float]] = {"full": [], "window": []}
+    agree = correct_full = correct_window = labelled = 0
+    for sample in samples:
+        views = {"full": _router_messages(router, sample, _FULL), "window": _router_messages(router, sample, policy)}
+        for name, messages in views.items():
+            tokens[name].append(history_tokens(messages))
+        if not args.live:
+            continue
+        decisions = {}
+        for name, messages in views.items():
+            decisions[name], elapsed = _route(router, messages)
+            latency[name].append(elapsed)
+        agree += decisions["full"] == decisions["window"]
+        if sample.get("agent"):
+            labelled += 1
+            correct_full += decisions["full"] == sample["agent"]
+            correct_window += decisions["window"] == sample["agent"]
+
+    for name in ("full", "window"):
+        values = tokens[name]
+        line = f"[{name:6}] prefill tokens avg={statistics.mean(values):8.1f} p95={_pct(values, 0.95):7d}"
+        if latency[name]:
+            line += f"  router latency avg={statistics.mean(latency[name]) * 1000:7.1f} ms"
+        print(line)
+    if args.live:
+        print(f"decision agreement: {agree}/{len(samples)} ({agree / len(samples):.1%})")
+        if labelled:
+            print(f"accuracy full={correct_full / labelled:.1%} window={correct_window / labelled:.1%} (n={labelled})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""SSE encoding cost: full cumulative payloads vs delta chunks.
+
+Replays a synthetic cumulative response (optional tool call + tool result +
+long answer) through EventStreamHandler's encoder and reports bytes on the wire
+and CPU time for each STREAM_MODE.
+
+    python -m benchmarks.bench_stream_encoding --tokens 2000
+"""
+
+import argparse
+import logging
+import time
+from typing import Any, Dict, List
+
+from qwen_agent.llm.schema import ASSISTANT, FUNCTION, FunctionCall, Message
+
+from agents.core.messaging import ChatRequest
+from agents.core.stream.delta_encoder import STREAM_MODES
+from agents.core.stream.event_stream_handler import EventStreamHandler
+
+
+def _cumulative_steps(tokens: int, with_tool: bool) -> List[List[Dict[str, Any]]]:
+    """模拟 bot.run 的输出：每个 token 产生一步累计消息列表（与 Agent.run 一样为 dict）"""
+    prefix: List[Message] = []
+    steps: List[List[Dict[str, Any]]] = []
+    if with_tool:
+        call = Message(role=ASSISTANT, content="", name="bench",
+                       function_call=FunctionCall(name="weather", arguments='{"city": "杭州"}'),
+                       extra={"function_id": "call_1"})
+        result = Message(role=FUNCTION, name="weather", content='{"temp": 23, "desc": "晴"}' * 20,
+                         extra={"function_id": "call_1"})
+        prefix = [call, result]
+        steps.append([call.model_dump()])
+        steps.append([m.model_dump() for m in prefix])
+    text = ""
+    for i in range(tokens):
+        text += "字" if i % 3 else "token "
+        steps.append([m.model_dump() for m in prefix]
+                     + [Message(role=ASSISTANT, content=text, name="bench").model_dump()])
+    return steps
+
+
+def _run(mode: str, steps: List[List[Dict[str, Any]]]) -> Dict[str, float]:
+    handler = EventStreamHandler(ChatRequest(model="bench", stream_mode=mode), bot=None, qa_messages=[])
+    start = time.process_time()
+    for step in steps:
+        handler._encode_chunk(step)
+    handler._encode_done()
+    cpu = time.process_time() - start
+    return {"bytes": handler._bytes_sent, "events": handler._events_sent, "cpu_ms": cpu * 1000}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--no-tool", action="store_true")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    steps = _cumulative_steps(args.tokens, with_tool=not args.no_tool)
+    print(f"tokens={args.tokens} steps={len(steps)} tool={not args.no_tool}")
+    for mode in STREAM_MODES:
+        stats = _run(mode, steps)
+        print(f"[{mode:5}] bytes={stats['bytes']} events={stats['events']} cpu_ms={stats['cpu_ms']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""weather tool: per-city geocode + forecast round trips vs cached, batched lookups.
+
+Starts a local fake open-meteo server (geocoding and forecast endpoints, each
+answering after ``--latency-ms``; the forecast accepts comma-separated
+coordinates like the real API) and times a ``--cities`` lookup the old way (two
+serial requests per city) against the ``weather`` tool cold, after the forecast
+cache expired (geocode cache only) and fully warm.
+
+    python -m benchmarks.bench_weather --cities 5 --latency-ms 80
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from tools.core.utils import safe_get_json
+from tools.utility import weather
+
+_CITIES = ["Beijing", "Shanghai", "Tokyo", "Paris", "London", "Berlin", "Sydney", "Toronto", "Cairo", "Lima"]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.08
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        time.sleep(self.latency)
+        if url.path == "/geocode":
+            seed = zlib.crc32(query["name"].encode())
+            payload = {"results": [{"name": query["name"], "latitude": seed % 180 - 90 + 0.123456,
+                                    "longitude": seed % 360 - 180 + 0.654321}]}
+        else:
+            # 模拟旧参数带来的 hourly 数组（一周逐小时数据）
+            hourly = {"hourly": {"temperature_2m": [20.5] * 168, "relativehumidity_2m": [60] * 168,
+                                 "weathercode": [3] * 168}} if "hourly" in query else {}
+            items = [{"latitude": float(lat), "longitude": float(lon), **hourly,
+                      "current_weather": {"temperature": 21.3, "windspeed": 9.4, "weathercode": 3}}
+                     for lat, lon in zip(query["latitude"].split(","), query["longitude"].split(","))]
+            payload = items[0] if len(items) == 1 else items
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _legacy(cities) -> None:
+    # 改造前：每个城市先地理编码、再请求带 hourly 数组的预报，全部串行
+    for city in cities:
+        _, geo = safe_get_json(f"{weather.GEOCODE_API}?name={city}&count=1&language=zh&format=json")
+        item = geo["results"][0]
+        safe_get_json(f"{weather.FORECAST_API}?latitude={item['latitude']}&longitude={item['longitude']}"
+                      f"&current_weather=true&hourly=temperature_2m,relativehumidity_2m,weathercode")
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cities", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    _Handler.latency = args.latency_ms / 1000
+    base = _serve()
+    weather.GEOCODE_API = f"{base}/geocode"
+    weather.FORECAST_API = f"{base}/forecast"
+    cities = _CITIES[:args.cities]
+    tool = weather.WeatherTool()
+    call = json.dumps({"cities": cities})
+
+    legacy = _timed(lambda: _legacy(cities))
+    cold = _timed(lambda: tool.call(call))
+    weather._forecast_cache.clear()
+    geocoded = _timed(lambda: tool.call(call))
+    warm = _timed(lambda: tool.call(call))
+    output = tool.call(call)
+    assert all(f"{city} 当前天气" in output for city in cities), output
+
+    single = urlencode({"latitude": "39.9", "longitude": "116.4"})
+    _, old = safe_get_json(f"{weather.FORECAST_API}?{single}&current_weather=true&hourly=temperature_2m,"
+                           f"relativehumidity_2m,weathercode")
+    _, new = safe_get_json(f"{weather.FORECAST_API}?{single}&current_weather=true")
+    print(f"{len(cities)} cities x ~{args.latency_ms:.0f} ms/request: legacy {legacy * 1000:7.1f} ms  "
+          f"cold {cold * 1000:7.1f} ms  geocode cached {geocoded * 1000:7.1f} ms  warm {warm * 1000:6.2f} ms  "
+          f"forecast payload {len(json.dumps(old))} -> {len(json.dumps(new))} bytes")
+
+
+if __name__ == "__main__":
+    main()
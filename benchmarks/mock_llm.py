@@ -0,0 +1,82 @@
+"""A tiny OpenAI-compatible streaming LLM used by the benchmarks."""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ROUTER_MARKER = "任务路由器"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_mock_llm(tokens: int = 20, token_delay: float = 0.02, route_to: str = "基础对话助手") -> FastAPI:
+    """
+    返回一个模拟 /v1/chat/completions 的 FastAPI 应用：
+    路由器请求（system prompt 含“任务路由器”）回复一行 ``Call: <route_to>``，
+    其余请求以 token_delay 间隔流式返回 tokens 个 token。
+    """
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.cancelled = 0
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        messages = body.get("messages") or []
+        system = str(messages[0].get("content")) if messages else ""
+        pieces = [f"Call: {route_to}"] if ROUTER_MARKER in system else [f"tok{i} " for i in range(tokens)]
+
+        async def gen():
+            try:
+                for piece in pieces:
+                    await asyncio.sleep(token_delay)
+                    chunk = {
+                        "id": "mock",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "mock"),
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece},
+                                     "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                yield "data: [DONE]\n\n"
+            except asyncio.CancelledError:
+                app.state.cancelled += 1
+                raise
+
+        return StreamingResponse(gen(), media_type="text/event-stream")
+
+    return app
+
+
+def serve_in_thread(app: FastAPI, port: int, ready_timeout: float = 20.0) -> uvicorn.Server:
+    """在后台线程中启动 uvicorn，并等待其就绪"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error",
+                                           limit_concurrency=None, backlog=4096))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + ready_timeout
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError(f"server on port {port} did not start")
+        time.sleep(0.05)
+    return server
+
+
+def start_mock_llm(port: Optional[int] = None, **kwargs) -> str:
+    """启动模拟 LLM 并返回其 OpenAI 兼容 base_url"""
+    port = port or free_port()
+    serve_in_thread(build_mock_llm(**kwargs), port)
+    return f"http://127.0.0.1:{port}/v1"
@@ -0,0 +1,210 @@
+"""Admission control with per-user weighted round-robin fair queueing."""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳：status_code 为 429（单用户排队超限）或 503（整体过载/排队超时）"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """一次准入许可，请求结束时必须 release（幂等）"""
+
+    __slots__ = ("_controller", "_released", "_start")
+
+    def __init__(self, controller: Optional["AdmissionController"]):
+        self._controller = controller
+        self._released = controller is None
+        self._start = time.monotonic()
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(time.monotonic() - self._start)
+
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """解析 "alice=4,bob=2" 形式的权重配置"""
+    weights: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        key, sep, value = item.strip().partition("=")
+        if sep and key and value.strip().isdigit():
+            weights[key.strip()] = max(1, int(value))
+    return weights
+
+
+class AdmissionController:
+    """
+    /v1/chat/completions 前的准入控制器（仅在事件循环内使用，无需加锁）。
+
+    - 全局并发上限 ``max_concurrency``，超出的请求按 user_id/session_id 分队列等待；
+    - 有空位时按加权轮询（每个 key 连续获得 weight 个名额后轮转）从各队列出队，
+      单个用户的突发请求只会排在自己的队列里；
+    - 排队总数或单 key 排队数超限时立即拒绝（503 / 429），
+      排队超过 ``queue_timeout`` 秒返回 503，均附带 Retry-After。
+    """
+
+    def __init__(self,
+                 max_concurrency: int,
+                 max_queue: int,
+                 max_queue_per_key: int,
+                 queue_timeout: float,
+                 weights: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self.queue_timeout = queue_timeout
+        self.weights = weights or {}
+        self._active = 0
+        self._queued = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        self._ring: Deque[str] = deque()
+        self._credits: Dict[str, int] = {}
+        # 平均占用时长（EWMA），用于估算 Retry-After
+        self._avg_service = 5.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    async def acquire(self, key: str,
+                      is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Ticket:
+        """申请一个执行名额，必要时排队等待；失败时抛出 AdmissionRejected"""
+        if not self.enabled:
+            return Ticket(None)
+        if self._active < self.max_concurrency and not self._queued:
+            return self._admit(key, 0.0)
+
+        queue = self._queues.get(key)
+        if self._queued >= self.max_queue:
+            raise self._reject(503, "queue_full")
+        if queue is not None and len(queue) >= self.max_queue_per_key:
+            raise self._reject(429, "user_queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ring.append(key)
+            self._credits[key] = self.weights.get(key, 1)
+        queue.append(waiter)
+        self._queued += 1
+        self._report_depth()
+
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._reject(503, "queue_timeout")
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), timeout=min(remaining, config.DISCONNECT_POLL_INTERVAL))
+                    return self._admit(key, time.monotonic() - start, queued=True)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        raise self._reject(503, "client_disconnect")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已分配但请求放弃了，归还给下一个等待者
+                self._active -= 1
+                self._dispatch()
+            else:
+                waiter.cancel()
+                self._drop_waiter(key, waiter)
+            raise
+
+    def retry_after(self) -> int:
+        """按当前排队长度与平均占用时长估算客户端重试等待秒数"""
+        backlog = (self._queued + 1) / max(1, self.max_concurrency)
+        return max(1, math.ceil(backlog * self._avg_service))
+
+    # ----------------- 内部方法 -----------------
+
+    def _admit(self, key: str, waited: float, queued: bool = False) -> Ticket:
+        if not queued:
+            self._active += 1
+        metrics.inc("admission.admitted")
+        metrics.observe("admission.wait_seconds", waited)
+        self._report_depth()
+        return Ticket(self)
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        metrics.inc("admission.rejected", reason=reason)
+        logger.warning("Admission rejected: reason=%s active=%s queued=%s", reason, self._active, self._queued)
+        return AdmissionRejected(status_code, reason, self.retry_after())
+
+    def _release(self, held: float) -> None:
+        self._avg_service = 0.9 * self._avg_service + 0.1 * held
+        self._active -= 1
+        self._dispatch()
+        self._report_depth()
+
+    def _dispatch(self) -> None:
+        """按加权轮询把空出的名额分配给各 key 队首的等待者"""
+        while self._active < self.max_concurrency and self._ring:
+            key = self._ring[0]
+            queue = self._queues[key]
+            waiter = queue.popleft()
+            self._queued -= 1
+            if not waiter.done():
+                self._active += 1
+                waiter.set_result(None)
+                self._credits[key] -= 1
+            if not queue:
+                self._ring.popleft()
+                del self._queues[key]
+                del self._credits[key]
+            elif self._credits[key] <= 0:
+                self._credits[key] = self.weights.get(key, 1)
+                self._ring.rotate(-1)
+
+    def _drop_waiter(self, key: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(key)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            self._ring.remove(key)
+            del self._queues[key]
+            del self._credits[key]
+        self._report_depth()
+
+    def _report_depth(self) -> None:
+        metrics.set_gauge("admission.active", self._active)
+        metrics.set_gauge("admission.queue_depth", self._queued)
+        metrics.set_gauge("admission.queued_keys", len(self._queues))
+
+
+admission = AdmissionController(
+    max_concurrency=config.ADMISSION_MAX_CONCURRENCY,
+    max_queue=config.ADMISSION_MAX_QUEUE,
+    max_queue_per_key=config.ADMISSION_MAX_QUEUE_PER_KEY,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+    weights=parse_weights(config.ADMISSION_USER_WEIGHTS),
+)
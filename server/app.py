@@ -1,26 +1,50 @@
+import asyncio
 import json
 import logging
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import AsyncIterator
 
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import iterate_in_threadpool
 
+from agents.core.base.cancellation import RequestCancelled
+from agents.core.messaging.blob_store import (RASTER_IMAGE_TYPES, UnsupportedMediaType, blob_id, blob_store,
+                                               normalize_mime_type)
 from agents.core.messaging.chat_request import ChatRequest
+from agents.core.messaging.request_helper import InvalidMessages, RequestAnalysis
+from agents.core.messaging.session_store import SessionNotFound, session_key, session_store
 # 添加必要的导入
-from agents.routers.agent_router import AgentRouter
+from agents.routers.agent_router import AgentRouter, get_agent_pool
 from server import config
+from server.admission import AdmissionRejected, Ticket, admission
+from server.metadata import AgentMetadataRegistry
+from server.log import Capped, setup_logging, stop_logging
+from server.metrics import metrics
 
+setup_logging()
 logger = logging.getLogger("server.app")
-if not logger.handlers:
-    logging.basicConfig(level=logging.INFO)
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATIC_DIR = BASE_DIR / "static"
 
-app = FastAPI()
+metadata_registry = AgentMetadataRegistry(get_agent_pool())
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """启动时预热 Agent 图池并预计算元数据，把构建开销挪出请求路径"""
+    if config.AGENT_POOL_WARMUP:
+        await asyncio.to_thread(get_agent_pool().warm_up)
+    await asyncio.to_thread(metadata_registry.refresh)
+    yield
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
@@ -33,171 +57,94 @@ async def serve_frontend():
 
 
 @app.get("/api/agents")
-async def list_agents():
-    metadata = get_agent_metadata()
-    return JSONResponse(metadata["agents"])
+async def list_agents(request: Request):
+    return _metadata_response(request, "agents")
 
 
 @app.get("/api/tools")
-async def list_tools():
-    metadata = get_agent_metadata()
-    return JSONResponse(metadata["tools"])
+async def list_tools(request: Request):
+    return _metadata_response(request, "tools")
 
-def _tool_meta(tool: Any, agent_name: str) -> Dict[str, Any]:
-    """
-    提取工具元数据信息
 
-    Args:
-        tool: 工具对象
-        agent_name: 所属agent名称
+@app.get("/api/metrics")
+async def get_metrics():
+    """进程内运行指标（流编码字节数、耗时等）"""
+    return JSONResponse(metrics.snapshot())
+
 
-    Returns:
-        Dict[str, Any]: 工具元数据字典
+@app.post("/v1/blobs")
+async def upload_blob(request: Request):
+    """
+    上传图片/文件：请求体为原始字节，Content-Type 为其 MIME 类型（不在白名单内时返回 415）。
+    返回 ``blob://<sha256>`` 引用，消息中用 {"image": ref} / {"file": ref} 代替 inline base64。
     """
+    if not blob_store.enabled:
+        return JSONResponse({"error": "blob store disabled"}, status_code=404)
+    limit = config.BLOB_MAX_UPLOAD_MB * 1024 * 1024
+    if int(request.headers.get("content-length") or 0) > limit:
+        return JSONResponse({"error": "blob too large"}, status_code=413)
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            return JSONResponse({"error": "blob too large"}, status_code=413)
+        chunks.append(chunk)
+    if not size:
+        return JSONResponse({"error": "empty body"}, status_code=400)
     try:
-        if isinstance(tool, str):
-            return {
-                "name": tool,
-                "description": "",
-                "parameters": {},
-                "agent": agent_name,
-            }
-        if isinstance(tool, dict):
-            return {
-                "name": tool.get("name", "tool"),
-                "description": (tool.get("description") or "").strip(),
-                "parameters": tool.get("parameters", {}) or {},
-                "agent": tool.get("agent", agent_name),
-            }
-
-        # 获取工具名称
-        name = getattr(tool, 'name', str(tool.__class__.__name__))
-
-        # 获取工具描述
-        description = getattr(tool, 'description', '')
-        if not description and hasattr(tool, '__doc__'):
-            description = tool.__doc__ or ''
-
-        # 获取工具参数
-        parameters = getattr(tool, 'parameters', {})
-        if not parameters and hasattr(tool, 'function'):
-            # 尝试从 function 属性获取参数信息
-            function_info = tool.function
-            if isinstance(function_info, dict):
-                parameters = function_info.get('parameters', {})
-
-        return {
-            "name": name,
-            "description": description.strip() if description else "",
-            "parameters": parameters,
-            "agent": agent_name
-        }
-    except Exception as e:
-        logger.warning(f"Failed to extract metadata for tool {tool}: {e}")
-        return {
-            "name": str(tool.__class__.__name__),
-            "description": "",
-            "parameters": {},
-            "agent": agent_name
-        }
-
-def get_agent_metadata() -> Dict[str, Any]:
-    """Return metadata about available agents and tools (with per-agent mapping)."""
-    # 创建一个临时的ChatRequest用于初始化router
-    from agents.core.messaging.chat_request import ChatRequest
-    import uuid
-
-    temp_request = ChatRequest(
-        req_id=str(uuid.uuid4()),
-        session_id=f"metadata_{uuid.uuid4()}",
-        messages=[],
-    )
-
-    router = AgentRouter(temp_request)
-    # 创建bot实例
-    router.bot = router._create_bot()
+        mime_type = normalize_mime_type(request.headers.get("content-type"))
+    except UnsupportedMediaType as e:
+        return JSONResponse({"error": f"unsupported media type: {e}"}, status_code=415)
+    ref = await asyncio.to_thread(blob_store.put, b"".join(chunks), mime_type)
+    return JSONResponse({"id": blob_id(ref), "ref": ref, "bytes": size, "mime_type": blob_store.info(ref)[1]})
 
-    agents_data: List[Dict[str, Any]] = []
-    tools_data: List[Dict[str, Any]] = []
 
-    # 获取router中的agents
-    if hasattr(router, 'bot') and hasattr(router.bot, 'agents'):
-        agent_list = router.bot.agents
-    else:
-        # 如果没有agents属性，返回空数据
-        agent_list = []
-
-    for agent in agent_list:
-
-        tool_list = []
-        if hasattr(agent, "function_list"):
-            tool_list = agent.function_list
-        elif hasattr(agent, "function_map"):
-            tool_list = list(agent.function_map.values())
-        else:
-            tool_list = (
-                    getattr(agent, "function", None)
-                    or getattr(agent, "tools", None)
-                    or []
-            )
-        agent_tools = []
-        for tool in tool_list:
-            meta = _tool_meta(tool, agent.name)
-            agent_tools.append(meta)
-            tools_data.append(meta)
-
-        agents_data.append(
-            {
-                "name": getattr(agent, "name", "agent"),
-                "description": getattr(agent, "description", ""),
-                "tools": agent_tools,
-            }
-        )
-
-    for tool in getattr(router, "attached_tools", []):
-        tools_data.append(_tool_meta(tool, "router"))
-
-    return {
-        "agents": agents_data,
-        "tools": tools_data,
+@app.get("/v1/blobs/{digest}")
+async def get_blob(digest: str):
+    """
+    按哈希读取已上传的内容（内容寻址，可长期缓存）。
+    禁止浏览器嗅探类型；位图图片以外的内容一律作为附件下载，不在本站源下渲染。
+    """
+    info = blob_store.info(digest)
+    path = blob_store.path(digest) if info else None
+    if path is None:
+        return JSONResponse({"error": "blob not found"}, status_code=404)
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{digest}"',
+        "X-Content-Type-Options": "nosniff",
+    }
+    if info[1] not in RASTER_IMAGE_TYPES:
+        headers["Content-Disposition"] = f'attachment; filename="{digest}"'
+    return FileResponse(path, media_type=info[1], headers=headers)
+
+
+def _metadata_response(request: Request, key: str) -> Response:
+    """返回预计算的元数据；命中 If-None-Match/If-Modified-Since 时直接 304"""
+    doc = metadata_registry.get(key)
+    headers = {
+        "ETag": doc.etag,
+        "Last-Modified": doc.last_modified,
+        "Cache-Control": "no-cache",
     }
+    if doc.is_not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=doc.body, media_type="application/json", headers=headers)
 
-def _find_latest_user(messages: List[Dict[str, Any]]) -> Tuple[int, Dict[str, Any] | None]:
-    for idx in range(len(messages) - 1, -1, -1):
-        msg = messages[idx]
-        if isinstance(msg, dict) and msg.get("role") == "user":
-            return idx, msg
-    return -1, None
-
-
-def _log_request_summary(body: Dict[str, Any]) -> None:
-    messages = body.get("messages") or []
-    files = body.get("files") or []
-    images = body.get("images") or []
-    _, user_msg = _find_latest_user(messages)
-    preview = ""
-    if isinstance(user_msg, dict):
-        content = user_msg.get("content")
-        if isinstance(content, str):
-            preview = content[:200]
-        elif isinstance(content, list):
-            texts = [
-                part.get("text", "")
-                for part in content
-                if isinstance(part, dict) and part.get("type") == "text"
-            ]
-            preview = " | ".join(t for t in texts if t)[:200]
+
+def _log_request_summary(chat_request: ChatRequest, analysis: RequestAnalysis) -> None:
     logger.info(
-        "chat request: stream=%s messages=%s files=%s images=%s preview=%s",
-        body.get("stream", False),
-        messages,
-        len(files),
-        len(images),
-        preview,
+        "chat request: req_id=%s stream=%s messages=%s files=%s images=%s preview=%s",
+        chat_request.req_id,
+        chat_request.stream,
+        analysis.message_count,
+        len(analysis.files),
+        len(analysis.images),
+        analysis.preview,
     )
-    if files or images:
-        logger.info("raw files payload: %s", files)
-        logger.info("raw images payload: %s", images)
+    if analysis.files or analysis.images:
+        logger.debug("files: %s", Capped(analysis.files))
+        logger.debug("images: %s", Capped(analysis.images))
 
 
 @app.post("/v1/chat/completions")
@@ -216,24 +163,92 @@ async def chat_completions(request: Request):
     # 先读取原始请求体用于调试
     try:
         body = await request.json()
-        logger.info(f"Received request body: {body}")
+        logger.debug("Received request body: %s", Capped(body))
 
-        _log_request_summary(body if isinstance(body, dict) else {})
         chat_request = ChatRequest(**body)
 
         if not chat_request.messages:
             return JSONResponse({"error": "No messages provided"}, status_code=400)
+        # 一次遍历解析消息、附件与最近的 user 文本，后续日志/路由/上下文构建共用；
+        # inline 图片/文件在解析时解码、计算哈希并写盘，放到线程中执行，不阻塞事件循环
+        analysis = await asyncio.to_thread(RequestAnalysis, chat_request)
+        _log_request_summary(chat_request, analysis)
     except Exception as e:
         logger.error(f"Failed to parse ChatRequest: {e}")
-        logger.error(f"Request body was: {body}")
+        logger.error("Request body was: %s", Capped(body))
         return JSONResponse(
             {"error": f"Invalid request format: {str(e)}"},
             status_code=422
         )
 
+    if chat_request.append and chat_request.session_id and session_store.enabled and not await asyncio.to_thread(
+            session_store.exists, session_key(chat_request.user_id, chat_request.session_id)):
+        return _session_not_found()
+
+    # 准入控制：全局并发上限 + 按用户公平排队
+    admission_key = chat_request.user_id or chat_request.session_id or (
+        request.client.host if request.client else "anonymous")
+    try:
+        ticket = await admission.acquire(admission_key, request.is_disconnected)
+    except AdmissionRejected as e:
+        return JSONResponse({"error": f"Server busy: {e.reason}"},
+                            status_code=e.status_code,
+                            headers={"Retry-After": str(e.retry_after)})
+
+    try:
+        if chat_request.stream is False:
+            return await _complete(request, AgentRouter(chat_request, analysis), ticket)
+        return await _stream_response(request, chat_request, analysis, ticket)
+    except SessionNotFound:
+        ticket.release()
+        return _session_not_found()
+    except InvalidMessages as e:
+        ticket.release()
+        return _invalid_messages(e)
+    except Exception:
+        ticket.release()
+        raise
+
+
+def _session_not_found() -> JSONResponse:
+    """append 请求的会话不存在（过期/被淘汰/服务重启），客户端需改为发送完整历史"""
+    return JSONResponse({"error": "session_not_found"}, status_code=409)
+
+
+def _invalid_messages(e: InvalidMessages) -> JSONResponse:
+    """消息（含合并后的会话历史）不可对话，例如没有以 user 消息结尾；与请求格式错误一样返回 422"""
+    return JSONResponse({"error": f"Invalid request format: {e}"}, status_code=422)
+
+
+class _TicketedStreamingResponse(StreamingResponse):
+    """
+    响应结束时总会释放准入名额：客户端在首个 body 发送前断开时，Starlette 不会开始迭代事件流，
+    事件流自身的 finally 不会执行，名额只能在这里归还（release 是幂等的）。
+    """
+
+    def __init__(self, content: AsyncIterator[str], ticket: Ticket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+async def _stream_response(request: Request, chat_request: ChatRequest, analysis: RequestAnalysis,
+                           ticket: Ticket) -> StreamingResponse:
+    """创建 SSE 流式响应；名额在事件流结束时释放"""
     # 使用 AgentRouter 创建事件流
-    router = AgentRouter(chat_request)
-    event_stream = router.create_event_stream()
+    router = AgentRouter(chat_request, analysis)
+    if config.ASYNC_PIPELINE:
+        # 异步路径：事件流交给事件循环驱动，不占用线程池；
+        # 读写会话存储（可能包含 SQLite 提交）的准备步骤放到线程中执行
+        events = (await asyncio.to_thread(router.create_async_event_stream))()
+        return _TicketedStreamingResponse(_cancel_on_disconnect(request, router, events, ticket), ticket,
+                                          media_type="text/event-stream")
+    event_stream = await asyncio.to_thread(router.create_event_stream)
 
     def event_generator():
         for event in event_stream():
@@ -245,7 +260,64 @@ async def chat_completions(request: Request):
                 logger.info("[SSE] sending chunk: <unserializable>")
             yield event
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    events = iterate_in_threadpool(event_generator())
+    return _TicketedStreamingResponse(_cancel_on_disconnect(request, router, events, ticket), ticket,
+                                      media_type="text/event-stream")
+
+
+async def _watch_disconnect(request: Request, router: AgentRouter) -> None:
+    """轮询客户端连接状态，断开后取消 Agent 执行（中止 LLM 流、跳过后续工具）"""
+    while not router.finished:
+        if await request.is_disconnected():
+            router.cancel("client_disconnect")
+            return
+        await asyncio.sleep(config.DISCONNECT_POLL_INTERVAL)
+
+
+async def _cancel_on_disconnect(request: Request, router: AgentRouter,
+                                events: AsyncIterator[str], ticket: Ticket) -> AsyncIterator[str]:
+    """
+    包装 SSE 事件流：检测到客户端断开，或 StreamingResponse 因断开而停止消费时，
+    把取消传递给正在执行的 Agent；结束时释放准入名额。
+    """
+    watcher = asyncio.create_task(_watch_disconnect(request, router))
+    try:
+        async for event in events:
+            yield event
+    finally:
+        watcher.cancel()
+        router.cancel("client_disconnect")
+        ticket.release()
+
+
+async def _complete(request: Request, router: AgentRouter, ticket: Ticket) -> Response:
+    """stream=false：运行到结束后返回一个紧凑的 chat.completion JSON"""
+    watcher = None
+    try:
+        if config.ASYNC_PIPELINE:
+            run = await asyncio.to_thread(router.create_async_completion)
+            watcher = asyncio.create_task(_watch_disconnect(request, router))
+            completion = await run()
+        else:
+            run = await asyncio.to_thread(router.create_completion)
+            watcher = asyncio.create_task(_watch_disconnect(request, router))
+            completion = await asyncio.to_thread(run)
+    except RequestCancelled:
+        # 客户端已断开，响应不会被接收
+        return Response(status_code=499)
+    except SessionNotFound:
+        return _session_not_found()
+    except InvalidMessages as e:
+        return _invalid_messages(e)
+    except Exception as e:
+        logger.error(f"Error in completion: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        ticket.release()
+    body = json.dumps(completion, ensure_ascii=False, separators=(",", ":"))
+    return Response(content=body, media_type="application/json")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+"""Thread-safe LRU + TTL cache with optional SQLite persistence."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    进程内 LRU + TTL 缓存。
+
+    - 超过 ``maxsize`` 时淘汰最久未使用的条目，过期条目在读取时惰性删除；
+    - 传入 ``persist_path`` 时写穿到 SQLite（值需可 JSON 序列化），
+      内存未命中时回查磁盘，进程重启后仍可命中；
+    - 命中/未命中/淘汰次数记录到 ``cache.*{cache=name}`` 指标。
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, persist_path: Optional[str] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if persist_path:
+            self._open(persist_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._lookup(key)
+        if value is _MISSING:
+            self._misses += 1
+            metrics.inc("cache.misses", cache=self.name)
+            return default
+        self._hits += 1
+        metrics.inc("cache.hits", cache=self.name)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                metrics.inc("cache.evictions", cache=self.name)
+            if self._db is not None:
+                self._persist(key, expires, value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._hits + self._misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / total, 4) if total else 0.0,
+        }
+
+    # ----------------- 内部方法 -----------------
+
+    def _lookup(self, key: str) -> Any:
+        if not self.enabled:
+            return _MISSING
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None and self._db is not None:
+                item = self._load(key)
+                if item is not None:
+                    self._data[key] = item
+            if item is None:
+                return _MISSING
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def _open(self, path: str) -> None:
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+            self._db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Cache %s: failed to open %s, persistence disabled: %s", self.name, path, e)
+            self._db = None
+
+    def _load(self, key: str) -> Optional[Tuple[float, Any]]:
+        try:
+            row = self._db.execute("SELECT expires, value FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Cache %s: read failed: %s", self.name, e)
+            return None
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _persist(self, key: str, expires: float, value: Any) -> None:
+        try:
+            self._db.execute("INSERT OR REPLACE INTO cache (key, expires, value) VALUES (?, ?, ?)",
+                             (key, expires, json.dumps(value, ensure_ascii=False)))
+            self._db.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning("Cache %s: write failed: %s", self.name, e)
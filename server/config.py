@@ -23,5 +23,159 @@ WEB_SUMMARY_API = os.getenv("WEB_SUMMARY_API", "http://127.0.0.1:8001/summarize"
 # —— API Server ——
 API_SERVER_PORT = int(os.getenv("API_SERVER_PORT", 11435))
 
+# —— Agent graph pool ——
+# 进程内预构建的 Agent 图数量；启动时预热，避免逐请求构建路由器/子 Agent/工具
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "1"))
+AGENT_POOL_WARMUP = os.getenv("AGENT_POOL_WARMUP", "true").lower() == "true"
+
+# —— Async pipeline ——
+# 开启后 /v1/chat/completions 走 asyncio 执行路径（AsyncOpenAI 原生工具调用），并发流不再占用线程池
+ASYNC_PIPELINE = os.getenv("ASYNC_PIPELINE", "false").lower() == "true"
+# 异步路径下同步工具的执行线程数
+ASYNC_TOOL_WORKERS = int(os.getenv("ASYNC_TOOL_WORKERS", "32"))
+
+# —— Logging ——
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# 日志经后台线程写出（QueueHandler/QueueListener）
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+# 单个字段（如消息内容、base64 图片）与整条日志中结构化参数的最大字符数
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "200"))
+LOG_TOTAL_MAX_CHARS = int(os.getenv("LOG_TOTAL_MAX_CHARS", "2000"))
+# 逐 chunk 输出日志（DEBUG 级别）的采样率，0 表示关闭
+LOG_STREAM_SAMPLE_RATE = float(os.getenv("LOG_STREAM_SAMPLE_RATE", "0.01"))
+
+# —— Client disconnect ——
+# 检测客户端断开的轮询间隔（秒），断开后取消进行中的 LLM 流与工具调用
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+# —— Admission control ——
+# 同时执行的对话请求上限（0 表示不限制），超出的请求按 user_id/session_id 公平排队
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+# 全局 / 单个用户的最大排队数，超出分别返回 503 / 429
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+ADMISSION_MAX_QUEUE_PER_KEY = int(os.getenv("ADMISSION_MAX_QUEUE_PER_KEY", "8"))
+# 排队等待的时间预算（秒），超时返回 503
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# 加权轮询的用户权重，如 "alice=4,bob=2"，未配置的用户权重为 1
+ADMISSION_USER_WEIGHTS = os.getenv("ADMISSION_USER_WEIGHTS", "")
+
+# —— Routing cache ——
+# 路由决策缓存条目数（0 表示关闭）、有效期（秒）与可选的 SQLite 持久化路径
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "4096"))
+ROUTE_CACHE_TTL = float(os.getenv("ROUTE_CACHE_TTL", "3600"))
+ROUTE_CACHE_PATH = os.getenv("ROUTE_CACHE_PATH", "")
+
+# —— Local pre-router ——
+# 关键词/正则规则表与 n-gram 分类器模型（JSON），留空则不启用；置信度达到阈值时跳过 Router LLM
+PRE_ROUTER_RULES = os.getenv("PRE_ROUTER_RULES", "")
+PRE_ROUTER_MODEL = os.getenv("PRE_ROUTER_MODEL", "")
+PRE_ROUTER_THRESHOLD = float(os.getenv("PRE_ROUTER_THRESHOLD", "0.9"))
+# Router LLM 决策日志（JSONL），用于离线训练分类器；留空不记录
+ROUTE_DECISION_LOG = os.getenv("ROUTE_DECISION_LOG", "")
+
+# —— Session store ——
+# 服务端会话历史（按 user_id + session_id）：最多保留的会话数（0 表示关闭）、空闲过期时间（秒）、
+# 单个会话最多保留的消息数（超出时按整轮裁剪最早的历史）与可选的 SQLite 持久化路径
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "400"))
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "")
+
+# —— Blob store ——
+# 请求中的 inline 图片/文件按内容哈希落盘，消息中只保留 blob:// 引用；目录留空时使用系统临时目录，
+# 容量上限（MB，0 表示关闭、保留 inline 数据）超出时淘汰最久未用的内容；单次上传大小上限（MB）
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "")
+BLOB_STORE_MAX_MB = int(os.getenv("BLOB_STORE_MAX_MB", "1024"))
+BLOB_MAX_UPLOAD_MB = int(os.getenv("BLOB_MAX_UPLOAD_MB", "20"))
+
+# —— Image preprocessing ——
+# 发给 VL 模型前按长边缩放图片（像素，0 表示不处理）、重新编码的格式（jpeg/webp）与质量，并去除 EXIF；
+# 预处理线程数与结果缓存条目数（按源图哈希）
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg")
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "4"))
+IMAGE_PREPROCESS_CACHE_SIZE = int(os.getenv("IMAGE_PREPROCESS_CACHE_SIZE", "4096"))
+
+# —— Tool HTTP client ——
+# 工具共用的 HTTP 连接池：缓存连接池的主机数、每个主机保持的连接数（同步）、异步客户端的总连接数上限；
+# 连接错误与 429/5xx 的重试次数（仅幂等请求）及指数退避基数（秒）
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "32"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.3"))
+# 遵循 Retry-After 时单次等待的上限（秒），避免第三方接口返回很长的 Retry-After 时长时间占用工具线程
+HTTP_RETRY_MAX_DELAY = float(os.getenv("HTTP_RETRY_MAX_DELAY", "10"))
+
+# —— Tool cache ——
+# 工具结果缓存（工具类上声明 cache_ttl 才启用）：条目数（0 表示关闭）、可选的 SQLite 持久化路径、
+# 过期结果后台刷新的线程数
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "2048"))
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", "")
+TOOL_CACHE_REFRESH_WORKERS = int(os.getenv("TOOL_CACHE_REFRESH_WORKERS", "2"))
+
+# —— Tool execution ——
+# 同一轮中多个无副作用工具调用的并行线程数（1 表示全部串行）与一批并行调用的超时（秒，从整批提交时算起，0 表示不限）
+TOOL_PARALLEL_WORKERS = int(os.getenv("TOOL_PARALLEL_WORKERS", "16"))
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "60"))
+
+# —— Daily hot ——
+# daily_hot_trends 全量抓取时的并发数与整体截止时间（秒，超时的榜单先返回提示）；
+# 榜单缓存有效期（秒，从上游 updateTime 起算）与路由目录缓存有效期（秒）
+DAILY_HOT_CONCURRENCY = int(os.getenv("DAILY_HOT_CONCURRENCY", "8"))
+DAILY_HOT_DEADLINE = float(os.getenv("DAILY_HOT_DEADLINE", "12"))
+DAILY_HOT_BOARD_TTL = float(os.getenv("DAILY_HOT_BOARD_TTL", "600"))
+DAILY_HOT_ROUTES_TTL = float(os.getenv("DAILY_HOT_ROUTES_TTL", "3600"))
+
+# —— Weather ——
+# 城市坐标缓存：条目数（0 表示关闭）、有效期（秒）与可选的 SQLite 持久化路径；
+# 当前天气按坐标缓存的有效期（秒）
+WEATHER_GEOCODE_CACHE_SIZE = int(os.getenv("WEATHER_GEOCODE_CACHE_SIZE", "4096"))
+WEATHER_GEOCODE_TTL = float(os.getenv("WEATHER_GEOCODE_TTL", "2592000"))
+WEATHER_GEOCODE_CACHE_PATH = os.getenv("WEATHER_GEOCODE_CACHE_PATH", "")
+WEATHER_FORECAST_TTL = float(os.getenv("WEATHER_FORECAST_TTL", "600"))
+
+# —— FX rates ——
+# fx_rate 只拉取并缓存一张以该货币为基准的汇率表，其他货币对交叉换算；
+# 接口未给出下次更新时间时的缓存有效期（秒）与可选的 SQLite 持久化路径
+FX_TABLE_BASE = os.getenv("FX_TABLE_BASE", "USD").upper()
+FX_TABLE_TTL = float(os.getenv("FX_TABLE_TTL", "3600"))
+FX_CACHE_PATH = os.getenv("FX_CACHE_PATH", "")
+
+# —— Crypto market snapshot ——
+# crypto_price / crypto_market 共用的行情快照：后台刷新间隔（秒），超过该时长（秒，0 表示不限）无人查询时暂停刷新
+CRYPTO_SNAPSHOT_INTERVAL = float(os.getenv("CRYPTO_SNAPSHOT_INTERVAL", "60"))
+CRYPTO_SNAPSHOT_IDLE = float(os.getenv("CRYPTO_SNAPSHOT_IDLE", "600"))
+
+# —— Context compaction ——
+# 子 Agent 的输入 token 预算（按整轮丢弃最早的历史，0 表示不限制），可按 Agent 名称覆盖，如 "多模态助手=8000"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "24000"))
+CONTEXT_AGENT_TOKENS = os.getenv("CONTEXT_AGENT_TOKENS", "")
+# 会话中未摘要的历史超过该 token 数时，在回复完成后异步生成滚动摘要（0 表示关闭），摘要之后保留最近 N 轮原文
+CONTEXT_SUMMARY_TRIGGER_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TRIGGER_TOKENS", "8000"))
+CONTEXT_SUMMARY_KEEP_TURNS = int(os.getenv("CONTEXT_SUMMARY_KEEP_TURNS", "4"))
+# 生成摘要使用的模型（默认与主模型一致）、摘要的最大输出 token 数与后台线程数
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", LLM_MODEL)
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "512"))
+CONTEXT_SUMMARY_WORKERS = int(os.getenv("CONTEXT_SUMMARY_WORKERS", "2"))
+
+# —— Router context ——
+# Router LLM 只看最近 N 轮对话，且不超过给定 token 预算（0 表示不限制）；图片/文件替换为占位符
+ROUTER_HISTORY_TURNS = int(os.getenv("ROUTER_HISTORY_TURNS", "6"))
+ROUTER_HISTORY_TOKENS = int(os.getenv("ROUTER_HISTORY_TOKENS", "1024"))
+# 按内容哈希缓存 token 计数的条目数（只保存摘要与计数，0 表示不缓存）
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "65536"))
+
+# —— Router speculation ——
+# Router LLM 决策期间推测执行预测的子 Agent（输出先缓存，猜中后放出），以额外 token 换取更低的 TTFT
+ROUTER_SPECULATION = os.getenv("ROUTER_SPECULATION", "false").lower() == "true"
+# 同步路径下执行推测 Agent 的线程数；线程都被占用时新请求不做推测
+ROUTER_SPECULATION_WORKERS = int(os.getenv("ROUTER_SPECULATION_WORKERS", "16"))
+
+# —— SSE encoding ——
+# full：每个事件携带完整累计消息列表（默认，兼容现有前端）；delta：OpenAI chat.completion.chunk 增量
+STREAM_MODE = os.getenv("STREAM_MODE", "full").lower()
+
 SERPER_API_KEY = os.getenv('SERPER_API_KEY', '')
 SERPER_URL = os.getenv('SERPER_URL', 'https://google.serper.dev/search')
\ No newline at end of file
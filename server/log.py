@@ -0,0 +1,118 @@
+"""Non-blocking logging setup and helpers for hot-path log statements.
+
+- 所有日志经 QueueHandler 投递到后台 QueueListener 线程写出，请求线程不做 I/O；
+- ``Capped`` 包装大对象：只在日志级别生效时才格式化，且按字段/总长度截断，
+  格式化成本与上限成正比而不是与对象大小成正比；
+- ``log_sampled`` 对逐 chunk 等高频日志按比例采样。
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+from typing import Any, List, Optional
+
+from server import config
+
+_FORMAT = "[%(asctime)s] %(levelname)s %(name)s - %(message)s"
+_MAX_ITEMS = 20
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """为根 logger 安装 QueueHandler + 后台 QueueListener（幂等）"""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel((level or config.LOG_LEVEL).upper())
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(_FORMAT))
+    if not config.LOG_ASYNC:
+        root.handlers = [stream_handler]
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """停止后台写线程并刷出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class Capped:
+    """
+    延迟格式化的截断包装：``logger.info("body=%s", Capped(body))``。
+
+    字符串字段超过 ``field_chars`` 截断（base64 图片等），列表/字典最多展开
+    ``_MAX_ITEMS`` 项，整体超过 ``total_chars`` 后停止展开。
+    """
+
+    __slots__ = ("value", "field_chars", "total_chars")
+
+    def __init__(self, value: Any, field_chars: Optional[int] = None, total_chars: Optional[int] = None):
+        self.value = value
+        self.field_chars = field_chars or config.LOG_FIELD_MAX_CHARS
+        self.total_chars = total_chars or config.LOG_TOTAL_MAX_CHARS
+
+    def __str__(self) -> str:
+        parts: List[str] = []
+        self._render(self.value, parts, [self.total_chars])
+        return "".join(parts)
+
+    __repr__ = __str__
+
+    def _render(self, value: Any, parts: List[str], budget: List[int]) -> None:
+        if budget[0] <= 0:
+            return
+        if hasattr(value, "model_dump"):
+            value = value.model_dump(exclude_none=True)
+
+        if isinstance(value, dict):
+            self._emit("{", parts, budget)
+            for idx, (key, item) in enumerate(value.items()):
+                if budget[0] <= 0 or idx >= _MAX_ITEMS:
+                    self._emit(f"...(+{len(value) - idx} keys)", parts, budget, force=True)
+                    break
+                self._emit(f"{', ' if idx else ''}{key!s}: ", parts, budget)
+                self._render(item, parts, budget)
+            self._emit("}", parts, budget, force=True)
+        elif isinstance(value, (list, tuple)):
+            self._emit("[", parts, budget)
+            for idx, item in enumerate(value):
+                if budget[0] <= 0 or idx >= _MAX_ITEMS:
+                    self._emit(f"...(+{len(value) - idx} items)", parts, budget, force=True)
+                    break
+                if idx:
+                    self._emit(", ", parts, budget)
+                self._render(item, parts, budget)
+            self._emit("]", parts, budget, force=True)
+        else:
+            text = value if isinstance(value, str) else repr(value)
+            if len(text) > self.field_chars:
+                text = f"{text[:self.field_chars]}...(+{len(text) - self.field_chars} chars)"
+            self._emit(text, parts, budget)
+
+    @staticmethod
+    def _emit(text: str, parts: List[str], budget: List[int], force: bool = False) -> None:
+        if budget[0] > 0 or force:
+            parts.append(text)
+            budget[0] -= len(text)
+
+
+def log_sampled(logger: logging.Logger, level: int, rate: float, msg: str, *args: Any) -> None:
+    """按 rate 采样记录日志；级别未开启时不做任何格式化"""
+    if rate <= 0 or not logger.isEnabledFor(level):
+        return
+    if rate >= 1 or random.random() < rate:
+        logger.log(level, msg, *args)
@@ -0,0 +1,192 @@
+"""Precomputed agent/tool metadata served by /api/agents and /api/tools."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from qwen_agent.tools import TOOL_REGISTRY
+
+from agents.routers.agent_pool import AgentGraphPool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MetadataDocument:
+    """一个已序列化好的元数据响应体及其缓存校验信息"""
+    body: bytes
+    etag: str
+    last_modified: str
+    last_modified_ts: int
+
+    def is_not_modified(self, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """按 HTTP 条件请求语义判断是否可以直接返回 304"""
+        if if_none_match:
+            candidates = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in candidates or self.etag in candidates or f"W/{self.etag}" in candidates
+        if if_modified_since:
+            try:
+                since = int(parsedate_to_datetime(if_modified_since).timestamp())
+            except (TypeError, ValueError):
+                return False
+            return self.last_modified_ts <= since
+        return False
+
+
+def _tool_meta(tool: Any, agent_name: str) -> Dict[str, Any]:
+    """
+    提取工具元数据信息
+
+    Args:
+        tool: 工具对象
+        agent_name: 所属agent名称
+
+    Returns:
+        Dict[str, Any]: 工具元数据字典
+    """
+    try:
+        if isinstance(tool, str):
+            return {
+                "name": tool,
+                "description": "",
+                "parameters": {},
+                "agent": agent_name,
+            }
+        if isinstance(tool, dict):
+            return {
+                "name": tool.get("name", "tool"),
+                "description": (tool.get("description") or "").strip(),
+                "parameters": tool.get("parameters", {}) or {},
+                "agent": tool.get("agent", agent_name),
+            }
+
+        # 获取工具名称
+        name = getattr(tool, 'name', str(tool.__class__.__name__))
+
+        # 获取工具描述
+        description = getattr(tool, 'description', '')
+        if not description and hasattr(tool, '__doc__'):
+            description = tool.__doc__ or ''
+
+        # 获取工具参数
+        parameters = getattr(tool, 'parameters', {})
+        if not parameters and hasattr(tool, 'function'):
+            # 尝试从 function 属性获取参数信息
+            function_info = tool.function
+            if isinstance(function_info, dict):
+                parameters = function_info.get('parameters', {})
+
+        return {
+            "name": name,
+            "description": description.strip() if description else "",
+            "parameters": parameters,
+            "agent": agent_name
+        }
+    except Exception as e:
+        logger.warning(f"Failed to extract metadata for tool {tool}: {e}")
+        return {
+            "name": str(tool.__class__.__name__),
+            "description": "",
+            "parameters": {},
+            "agent": agent_name
+        }
+
+
+def build_agent_metadata(bot: Any) -> Dict[str, Any]:
+    """Return metadata about available agents and tools (with per-agent mapping)."""
+    agents_data: List[Dict[str, Any]] = []
+    tools_data: List[Dict[str, Any]] = []
+
+    # 获取router中的agents
+    agent_list = getattr(bot, 'agents', None) or []
+
+    for agent in agent_list:
+
+        tool_list = []
+        if hasattr(agent, "function_list"):
+            tool_list = agent.function_list
+        elif hasattr(agent, "function_map"):
+            tool_list = list(agent.function_map.values())
+        else:
+            tool_list = (
+                    getattr(agent, "function", None)
+                    or getattr(agent, "tools", None)
+                    or []
+            )
+        agent_tools = []
+        for tool in tool_list:
+            meta = _tool_meta(tool, agent.name)
+            agent_tools.append(meta)
+            tools_data.append(meta)
+
+        agents_data.append(
+            {
+                "name": getattr(agent, "name", "agent"),
+                "description": getattr(agent, "description", ""),
+                "tools": agent_tools,
+            }
+        )
+
+    for tool in getattr(bot, "attached_tools", []):
+        tools_data.append(_tool_meta(tool, "router"))
+
+    return {
+        "agents": agents_data,
+        "tools": tools_data,
+    }
+
+
+def _make_document(payload: Any, modified_ts: int) -> MetadataDocument:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    return MetadataDocument(
+        body=body,
+        etag=etag,
+        last_modified=formatdate(modified_ts, usegmt=True),
+        last_modified_ts=modified_ts,
+    )
+
+
+class AgentMetadataRegistry:
+    """
+    Agent/工具元数据的内存注册表。
+
+    元数据只在启动时或工具注册表/Agent 图池变化时计算一次，并预先序列化为
+    响应体和 ETag/Last-Modified 校验值；轮询请求只做一次指纹比较。
+    """
+
+    def __init__(self, pool: AgentGraphPool):
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[Tuple[int, int]] = None
+        self._documents: Dict[str, MetadataDocument] = {}
+
+    def _current_fingerprint(self) -> Tuple[int, int]:
+        return self._pool.generation, len(TOOL_REGISTRY)
+
+    def refresh(self) -> None:
+        """重新计算元数据；内容未变化时保留原有 ETag/Last-Modified"""
+        fingerprint = self._current_fingerprint()
+        metadata = build_agent_metadata(self._pool.acquire())
+        now = int(time.time())
+        with self._lock:
+            documents = {}
+            for key in ("agents", "tools"):
+                doc = _make_document(metadata[key], now)
+                previous = self._documents.get(key)
+                documents[key] = previous if previous and previous.etag == doc.etag else doc
+            self._documents = documents
+            self._fingerprint = fingerprint
+        logger.info("Agent metadata refreshed: %s agents, %s tools",
+                    len(metadata["agents"]), len(metadata["tools"]))
+
+    def get(self, key: str) -> MetadataDocument:
+        """获取 agents/tools 对应的预序列化文档，注册表变化时自动重算"""
+        if self._fingerprint != self._current_fingerprint():
+            self.refresh()
+        return self._documents[key]
@@ -0,0 +1,98 @@
+"""In-process metrics registry exposed via /api/metrics."""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+_RESERVOIR_SIZE = 1024
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Summary:
+    """计数/求和/最大值 + 最近样本窗口（用于估算分位数）"""
+
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=_RESERVOIR_SIZE)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+
+        def _pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "avg": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": round(_pct(0.50), 6),
+            "p95": round(_pct(0.95), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """线程安全的轻量指标注册表：counter / gauge / summary"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[LabelKey, float] = {}
+        self._gauges: Dict[LabelKey, float] = {}
+        self._summaries: Dict[LabelKey, _Summary] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def add_gauge(self, name: str, delta: float, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary()
+            summary.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出为 {类型: {指标名: [{labels, value}]}} 结构，供 /api/metrics 返回"""
+
+        def _group(items, render):
+            grouped: Dict[str, list] = {}
+            for (name, labels), value in items:
+                grouped.setdefault(name, []).append({"labels": dict(labels), "value": render(value)})
+            return grouped
+
+        with self._lock:
+            return {
+                "counters": _group(self._counters.items(), lambda v: v),
+                "gauges": _group(self._gauges.items(), lambda v: v),
+                "summaries": _group(self._summaries.items(), lambda v: v.snapshot()),
+            }
+
+
+metrics = MetricsRegistry()
@@ -224,6 +224,37 @@ function handleFileSelect(event) {
   updateAttachmentBar();
 }
 
+async function uploadBlob(file) {
+  try {
+    const res = await fetch("/v1/blobs", {
+      method: "POST",
+      headers: { "Content-Type": file.type || "application/octet-stream" },
+      body: file,
+    });
+    if (!res.ok) return "";
+    const data = await res.json();
+    return data.ref || "";
+  } catch (err) {
+    return "";
+  }
+}
+
+function readAsDataURL(file) {
+  return new Promise((resolve, reject) => {
+    const reader = new FileReader();
+    reader.onload = () => resolve(reader.result);
+    reader.onerror = reject;
+    reader.readAsDataURL(file);
+  });
+}
+
+function blobUrl(url) {
+  // blob://<sha256> 引用通过 /v1/blobs/<sha256> 展示
+  return typeof url === "string" && url.startsWith("blob://")
+    ? `/v1/blobs/${url.slice("blob://".length)}`
+    : url;
+}
+
 function attachmentNote(attachments) {
   if (!attachments.length) return "";
   const lines = attachments.map(
@@ -272,7 +303,7 @@ function normalizeContentFragments(content) {
       content.image ||
       (content.type === "image_url" ? content.url : "");
     if (imageUrl) {
-      parts.push({ type: "image", url: imageUrl });
+      parts.push({ type: "image", url: blobUrl(imageUrl) });
     }
 
     const fileValue =
@@ -281,7 +312,7 @@ function normalizeContentFragments(content) {
     if (fileValue) {
       parts.push({
         type: "file",
-        url: typeof fileValue === "string" ? fileValue : "",
+        url: typeof fileValue === "string" ? blobUrl(fileValue) : "",
         name: (content.file && content.file.name) || content.name,
       });
     }
@@ -363,20 +394,16 @@ async function sendMessage() {
     // 处理附件
     for (const att of files) {
       if (att.file) {
-        const base64 = await new Promise((resolve, reject) => {
-          const reader = new FileReader();
-          reader.onload = () => resolve(reader.result);
-          reader.onerror = reject;
-          reader.readAsDataURL(att.file);
-        });
+        // 先上传到服务端 blob 存储，消息中只携带 blob:// 引用；上传不可用时回退为 inline base64
+        const ref = (await uploadBlob(att.file)) || (await readAsDataURL(att.file));
 
         if (att.type.startsWith("image/")) {
           contentParts.push({
-            image: base64
+            image: ref
           });
         } else {
           contentParts.push({
-            file: base64,
+            file: ref,
             name: att.name
           });
         }
@@ -414,25 +441,32 @@ async function sendMessage() {
 
   setSending(true);
   try {
-    // 构建最新协议的请求体
-    const payload = {
+    // 构建最新协议的请求体：服务端已有该会话时只发送本轮新增的消息
+    const toWire = ({ role, content, name, metadata }) => {
+      const msg = { role, content };
+      if (name) msg.name = name;
+      if (metadata) msg.metadata = metadata;
+      return msg;
+    };
+    const buildPayload = (append) => ({
       model: "alfred-router",
       stream: true,
       req_id: generateReqId(),
       session_id: thread.id,
       user_id: "user",
-      messages: thread.messages.map(({ role, content, name, metadata }) => {
-        const msg = { role, content };
-        if (name) msg.name = name;
-        if (metadata) msg.metadata = metadata;
-        return msg;
-      })
-    };
-    const res = await fetch("/v1/chat/completions", {
+      append,
+      messages: append ? [toWire(userMsg)] : thread.messages.map(toWire)
+    });
+    const post = (append) => fetch("/v1/chat/completions", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload),
+      body: JSON.stringify(buildPayload(append)),
     });
+    let res = await post(Boolean(thread.serverSession));
+    if (res.status === 409) {
+      // 服务端会话已过期或被淘汰，回退为发送完整历史
+      res = await post(false);
+    }
     if (!res.ok || !res.body) {
       throw new Error(`HTTP ${res.status}`);
     }
@@ -591,6 +625,7 @@ async function sendMessage() {
       raw_content_parts: assistantContentParts
     };
     
+    thread.serverSession = true;
     if (assistantText || currentToolCalls.length > 0) {
       thread.messages.push({
         role: "assistant",
@@ -2,55 +2,148 @@
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import requests
 from qwen_agent.tools.base import register_tool
 from tools.core.base import QwenAgentBaseTool
 
 from server import config
+from server.cache import TTLCache
+from server.metrics import metrics
+from tools.core.http_client import http_client
 from tools.core.utils import HTTP_TIMEOUT, dump, normalize_base
 
 DAILY_HOT_API_BASE = normalize_base(config.DAILY_HOT_API_BASE)
+# 榜单缓存的最短有效期（秒）：上游 updateTime 已接近过期时也至少缓存这么久，避免反复回源
+_MIN_BOARD_TTL = 30
+
+_executor = ThreadPoolExecutor(max_workers=max(1, config.DAILY_HOT_CONCURRENCY), thread_name_prefix="daily-hot")
 
 
 class DailyHotService:
-    """Lightweight client for the DailyHot service."""
+    """
+    Lightweight client for the DailyHot service.
+
+    路由目录与各榜单结果都在进程内缓存：榜单按 ``updateTime`` 计算剩余有效期
+    （上游数据生成于 updateTime，``DAILY_HOT_BOARD_TTL`` 秒后视为过期），
+    全量抓取时按 ``DAILY_HOT_CONCURRENCY`` 并发回源，并在 ``DAILY_HOT_DEADLINE`` 内返回已完成的部分。
+    同一榜单同时只有一个回源请求，并发的调用共享进行中的 Future。
+    """
 
-    def __init__(self, base_url: str = DAILY_HOT_API_BASE):
+    def __init__(self, base_url: str = DAILY_HOT_API_BASE, board_ttl: float = config.DAILY_HOT_BOARD_TTL,
+                 routes_ttl: float = config.DAILY_HOT_ROUTES_TTL):
         self.base_url = base_url.rstrip("/")
-        self.session = requests.Session()
-        self.session.headers.update({"Accept": "application/json"})
+        self.board_ttl = board_ttl
+        self.routes_ttl = routes_ttl
+        self._cache = TTLCache(name="daily_hot", maxsize=512, ttl=board_ttl)
+        self._lock = threading.Lock()
+        # 榜单路径 -> 进行中的回源请求
+        self._inflight: Dict[str, "Future[Tuple[str, Dict[str, Any]]]"] = {}
 
     def list_categories(self) -> Tuple[str, List[Dict[str, str]]]:
+        routes = self._cache.get("/all")
+        if routes is not None:
+            return "ok", routes
         status, data = self._get_json(f"{self.base_url}/all")
         if status == "error":
             return status, data
         if data.get("code") != 200:
             return "error", {"error": f"unexpected response code: {data.get('code')}"}
-        return "ok", data.get("routes") or []
+        routes = data.get("routes") or []
+        self._cache.set("/all", routes, ttl=self.routes_ttl)
+        return "ok", routes
 
     def fetch_hot_list(self, path: str) -> Tuple[str, Dict[str, Any]]:
+        result = self._submit(path)
+        return result if isinstance(result, tuple) else result.result()
+
+    def fetch_hot_lists(self, paths: List[str], deadline: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        并发抓取多个榜单，按输入顺序返回 (status, payload)；
+        ``deadline`` 秒内未完成的榜单返回 ("timeout", ...)，其请求仍在后台完成并写入缓存。
+        """
+        start = time.monotonic()
+        # 单个请求仍使用常规超时：截止时间后返回的榜单会写入缓存，下一次调用直接命中；
+        # 期间再次抓取同一榜单会等待同一个 Future，不会重复占用线程池
+        submitted = [self._submit(path) for path in paths]
+        done, _ = wait([item for item in submitted if isinstance(item, Future)], timeout=deadline)
+        results: List[Tuple[str, Dict[str, Any]]] = []
+        for path, item in zip(paths, submitted):
+            if isinstance(item, tuple):
+                results.append(item)
+            elif item in done:
+                results.append(item.result())
+            else:
+                results.append(("timeout", {"error": f"超过 {deadline:g}s 未返回", "path": path}))
+        timeouts = sum(1 for status, _ in results if status == "timeout")
+        if timeouts:
+            metrics.inc("daily_hot.board_timeouts", timeouts)
+        metrics.observe("daily_hot.fanout_seconds", time.monotonic() - start)
+        return results
+
+    def _submit(self, path: str) -> Union[Tuple[str, Dict[str, Any]], "Future[Tuple[str, Dict[str, Any]]]"]:
+        """返回已缓存的榜单 ("ok", payload) 或进行中的 Future"""
         normalized_path = path if path.startswith("/") else f"/{path}"
-        status, data = self._get_json(f"{self.base_url}{normalized_path}")
-        if status == "error":
-            return status, data
-        if data.get("code") != 200:
-            return "error", {"error": f"unexpected response code: {data.get('code')}", "path": normalized_path}
-        return "ok", data
+        with self._lock:
+            cached = self._cache.get(normalized_path)
+            if cached is not None:
+                return "ok", cached
+            future = self._inflight.get(normalized_path)
+            if future is not None:
+                metrics.inc("daily_hot.inflight_joins")
+                return future
+            future = _executor.submit(self._fetch, normalized_path)
+            self._inflight[normalized_path] = future
+            return future
+
+    def _fetch(self, normalized_path: str) -> Tuple[str, Dict[str, Any]]:
+        try:
+            status, data = self._get_json(f"{self.base_url}{normalized_path}")
+            if status == "error":
+                return status, data
+            if data.get("code") != 200:
+                return "error", {"error": f"unexpected response code: {data.get('code')}", "path": normalized_path}
+            self._cache.set(normalized_path, data, ttl=self._board_ttl(data))
+            return "ok", data
+        finally:
+            with self._lock:
+                self._inflight.pop(normalized_path, None)
+
+    def _board_ttl(self, payload: Dict[str, Any]) -> float:
+        """榜单的剩余有效期：上游 updateTime + DAILY_HOT_BOARD_TTL - 当前时间（无法解析时使用完整 TTL）"""
+        update_time = payload.get("updateTime")
+        if not isinstance(update_time, str):
+            return self.board_ttl
+        try:
+            updated = datetime.fromisoformat(update_time.replace("Z", "+00:00"))
+        except ValueError:
+            return self.board_ttl
+        if updated.tzinfo is None:
+            updated = updated.replace(tzinfo=timezone.utc)
+        age = (datetime.now(timezone.utc) - updated).total_seconds()
+        return min(self.board_ttl, max(_MIN_BOARD_TTL, self.board_ttl - max(0.0, age)))
 
     def _get_json(self, url: str) -> Tuple[str, Dict[str, Any]]:
         try:
-            resp = self.session.get(url, timeout=HTTP_TIMEOUT)
+            resp = http_client.get(url, headers={"Accept": "application/json"}, timeout=HTTP_TIMEOUT)
             resp.raise_for_status()
             return "ok", resp.json()
         except requests.RequestException as exc:
             return "error", {"error": str(exc), "endpoint": url}
 
 
+daily_hot_service = DailyHotService()
+
+
 @register_tool("daily_hot_trends")
 class DailyHotTrendsTool(QwenAgentBaseTool):
     description = "抓取 Daily Hot 服务的热点榜单，用于灵感/热点洞察。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -73,7 +166,7 @@ class DailyHotTrendsTool(QwenAgentBaseTool):
         args = self._verify_json_format_args(params or {})
         category = (args.get("category") or "").strip()
         limit = _normalize_limit(args.get("limit", 5))
-        service = DailyHotService()
+        service = daily_hot_service
 
         status, categories = service.list_categories()
         if status == "error":
@@ -93,17 +186,18 @@ class DailyHotTrendsTool(QwenAgentBaseTool):
                 return dump({"task": "daily_hot", "status": "error", "error": payload.get("error")})
             return _format_hot_board(target.get("name") or category, payload, limit)
 
+        routes = [cat for cat in categories if cat.get("path")]
+        results = service.fetch_hot_lists([cat["path"] for cat in routes], config.DAILY_HOT_DEADLINE)
         boards: List[str] = [f"来源：{service.base_url}"]
-        for cat in categories:
-            name = cat.get("name") or cat.get("path")
-            path = cat.get("path")
-            if not path:
+        for cat, (fetch_status, payload) in zip(routes, results):
+            name = cat.get("name") or cat["path"]
+            if fetch_status == "timeout":
+                boards.append(f"\n# {name}\n- 获取超时，稍后重试")
                 continue
-            fetch_status, payload = service.fetch_hot_list(path)
             if fetch_status == "error":
-                boards.append(f"\n# {name or path}\n- 获取失败: {payload.get('error')}")
+                boards.append(f"\n# {name}\n- 获取失败: {payload.get('error')}")
                 continue
-            boards.append(_format_hot_board(name or path, payload, limit))
+            boards.append(_format_hot_board(name, payload, limit))
         return "\n\n".join([b for b in boards if b.strip()])
 
 
@@ -33,6 +33,7 @@ def website_summary(url: str) -> Dict[str, Any]:
 @register_tool("web_summary")
 class WebSummaryTool(QwenAgentBaseTool):
     description = "根据链接获取文章内容并且生成摘要和标签"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -1,6 +1,9 @@
 """Core utilities for tools."""
 
 from tools.core.base import QwenAgentBaseTool
-from tools.core.utils import HTTP_TIMEOUT, dump, normalize_base, safe_get_json, safe_post_json
+from tools.core.http_client import HttpClient, http_client
+from tools.core.utils import (HTTP_TIMEOUT, dump, iter_json_array, normalize_base, safe_aget_json, safe_apost_json,
+                              safe_get_json, safe_post_json)
 
-__all__ = ["QwenAgentBaseTool", "HTTP_TIMEOUT", "dump", "normalize_base", "safe_get_json", "safe_post_json"]
+__all__ = ["QwenAgentBaseTool", "HTTP_TIMEOUT", "HttpClient", "dump", "http_client", "iter_json_array",
+           "normalize_base", "safe_aget_json", "safe_apost_json", "safe_get_json", "safe_post_json"]
@@ -3,26 +3,28 @@ from __future__ import annotations
 import json
 import logging
 import time
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
+import json5
 from qwen_agent.tools import BaseTool
 
-# 配置日志
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+from agents.core.base.cancellation import RequestCancelled, current_token
+from server.log import Capped
+from server.metrics import metrics
+from tools.core.response_cache import is_cacheable, tool_cache
 
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+logger = logging.getLogger(__name__)
 
 
 class QwenAgentBaseTool(BaseTool):
     """Base tool class for Qwen Agent with logging capabilities."""
-    
+
+    # 结果缓存时长（秒，0 表示不缓存）；过期后仍可先返回旧结果并后台刷新的时长（None 表示与 cache_ttl 相同）
+    cache_ttl: float = 0
+    cache_stale: Optional[float] = None
+    # 无副作用、可与同一轮的其他调用并行执行（见 agents.core.base.tool_executor）；默认串行，只读工具显式声明为 True
+    side_effect_free: bool = False
+
     def __init__(self):
         super().__init__()
         self.tool_name = self.__class__.__name__
@@ -30,26 +32,64 @@ class QwenAgentBaseTool(BaseTool):
     def call(self, params: Dict[str, Any], **kwargs: Any) -> str:
         """Override the call method to add logging."""
         start_time = time.time()
-        
+
+        # 请求已取消（客户端断开）时跳过尚未开始的工具调用
+        token = current_token()
+        if token is not None:
+            # 推测执行中的工具调用等路由确认后再执行
+            try:
+                token.wait_confirmed()
+            except RequestCancelled:
+                metrics.inc("cancel.tools_skipped", tool=self.tool_name)
+                logger.info("Tool %s skipped: request cancelled", self.tool_name)
+                return '{"error": "request cancelled"}'
+
         # 记录工具调用开始
-        logger.info(f"Tool {self.tool_name} called with params: {json.dumps(params, ensure_ascii=False)}")
+        logger.info("Tool %s called with params: %s", self.tool_name, Capped(params))
         
         try:
-            # 执行实际的工具逻辑
-            result = self._execute_tool(params, **kwargs)
+            # 执行实际的工具逻辑（声明了 cache_ttl 的工具先查结果缓存）
+            if self.cache_ttl > 0 and tool_cache.enabled:
+                result = self._execute_cached(params, **kwargs)
+            else:
+                result = self._execute_tool(params, **kwargs)
             
             # 记录成功执行
             execution_time = time.time() - start_time
-            logger.info(f"Tool {self.tool_name} executed successfully in {execution_time:.2f}s")
-            logger.info(f"Tool {self.tool_name} returned: {result}")
+            logger.info("Tool %s executed successfully in %.2fs, result_chars=%s",
+                        self.tool_name, execution_time, len(result) if isinstance(result, str) else -1)
+            logger.debug("Tool %s returned: %s", self.tool_name, Capped(result))
             return result
             
         except Exception as e:
             # 记录执行错误
             execution_time = time.time() - start_time
-            logger.error(f"Tool {self.tool_name} failed after {execution_time:.2f}s with error: {str(e)}")
+            logger.error("Tool %s failed after %.2fs with error: %s", self.tool_name, execution_time, e)
             raise
     
+    def _execute_cached(self, params: Dict[str, Any], **kwargs: Any) -> str:
+        # 缓存键只需解析参数；jsonschema 校验较慢，留给未命中时工具自身执行
+        args = params
+        if isinstance(params, str):
+            try:
+                args = json.loads(params)
+            except ValueError:
+                try:
+                    args = json5.loads(params)
+                except ValueError:
+                    args = None
+        if not isinstance(args, dict):
+            # 参数无法解析时不缓存，交给工具自身报错
+            return self._execute_tool(params, **kwargs)
+        stale = self.cache_ttl if self.cache_stale is None else self.cache_stale
+        key = tool_cache.key(self.name, args, self.parameters)
+        return tool_cache.call(self.name, key, self.cache_ttl, stale,
+                               lambda: self._execute_tool(params, **kwargs), self._is_cacheable)
+
+    def _is_cacheable(self, result: Any) -> bool:
+        """结果是否可以缓存，默认排除错误结果；子类可按需覆盖"""
+        return is_cacheable(result)
+
     def _execute_tool(self, params: Dict[str, Any], **kwargs: Any) -> str:
         """
         Subclasses should implement this method with their actual tool logic.
@@ -0,0 +1,220 @@
+"""Shared pooled HTTP client for tools.
+
+所有工具共用一个进程级 HTTP 客户端，避免每次调用都重新做 DNS + TCP + TLS 握手：
+
+- 同步接口基于 ``requests.Session``，按主机维护 keep-alive 连接池
+  （``HTTP_POOL_HOSTS`` 个主机、每个主机 ``HTTP_POOL_MAXSIZE`` 个连接）；
+- 异步接口基于 ``httpx.AsyncClient``（每个事件循环一个），总连接数上限 ``HTTP_MAX_CONNECTIONS``；
+- 幂等请求（GET/HEAD）遇到连接错误或 429/5xx 时按指数退避重试 ``HTTP_RETRIES`` 次，
+  并遵循 Retry-After（等待时间不超过 ``HTTP_RETRY_MAX_DELAY`` 秒）；
+- 不保存 Cookie：客户端由所有用户与工具共用，不能让一个请求的 Cookie 带到另一个请求；
+- 按主机记录请求数、重试次数与耗时（``http.*`` 指标）。
+
+同步接口抛出 ``requests.RequestException``，异步接口抛出 ``httpx.HTTPError``。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from server import config
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class _CappedRetry(Retry):
+    """Retry-After 超过 ``max_retry_after`` 秒时按上限等待（兼容没有 ``retry_after_max`` 参数的 urllib3）"""
+
+    def __init__(self, *args: Any, max_retry_after: Optional[float] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs: Any) -> "_CappedRetry":
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_retry_after(self, response: Any) -> Optional[float]:
+        seconds = super().get_retry_after(response)
+        if seconds is None or self.max_retry_after is None:
+            return seconds
+        return min(seconds, self.max_retry_after)
+
+
+def _no_cookies() -> DefaultCookiePolicy:
+    """不接受任何 Cookie 的策略"""
+    return DefaultCookiePolicy(allowed_domains=[])
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).hostname or "unknown"
+
+
+def _outcome(status: Optional[int]) -> str:
+    return f"{status // 100}xx" if status else "error"
+
+
+class HttpClient:
+    """进程级 HTTP 客户端（线程安全），同步与异步接口共用连接池配置、重试策略与指标"""
+
+    def __init__(self, pool_hosts: int, pool_maxsize: int, max_connections: int,
+                 retries: int, backoff: float, max_retry_delay: float = 10, timeout: float = 30):
+        self.pool_hosts = pool_hosts
+        self.pool_maxsize = pool_maxsize
+        self.max_connections = max_connections
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_retry_delay = max(0.0, max_retry_delay)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+            weakref.WeakKeyDictionary()
+
+    # ----------------- 同步接口 -----------------
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """发送请求并返回响应（不检查状态码）；重试用尽后的 429/5xx 也原样返回"""
+        kwargs.setdefault("timeout", self.timeout)
+        host = _host(url)
+        start = time.perf_counter()
+        status = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = response.status_code
+            history = getattr(getattr(response.raw, "retries", None), "history", ())
+            if history:
+                metrics.inc("http.retries", len(history), host=host)
+            return response
+        finally:
+            metrics.observe("http.request_seconds", time.perf_counter() - start, host=host)
+            metrics.inc("http.requests", host=host, outcome=_outcome(status))
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    # ----------------- 异步接口 -----------------
+
+    def async_client(self) -> httpx.AsyncClient:
+        """当前事件循环的 AsyncClient（连接与事件循环绑定，不能跨循环共用）"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.pool_hosts * 2),
+                follow_redirects=True,
+            )
+            client.cookies.jar.set_policy(_no_cookies())
+            self._async_clients[loop] = client
+        return client
+
+    async def arequest(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """``request`` 的异步版本；幂等请求的重试与退避在这里实现"""
+        host = _host(url)
+        client = self.async_client()
+        attempts = self.retries + 1 if method.upper() in _IDEMPOTENT else 1
+        start = time.perf_counter()
+        status = None
+        try:
+            for attempt in range(attempts):
+                last = attempt + 1 == attempts
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    if last:
+                        raise
+                    delay = self._delay(attempt)
+                else:
+                    status = response.status_code
+                    if status not in _RETRY_STATUSES or last:
+                        return response
+                    delay = self._retry_after(response) or self._delay(attempt)
+                    await response.aclose()
+                metrics.inc("http.retries", host=host)
+                await asyncio.sleep(delay)
+        finally:
+            metrics.observe("http.request_seconds", time.perf_counter() - start, host=host)
+            metrics.inc("http.requests", host=host, outcome=_outcome(status))
+
+    async def aget(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+    def close(self) -> None:
+        """关闭同步连接池（异步客户端随事件循环结束释放，或调用 ``aclose``）"""
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    async def aclose(self) -> None:
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    # ----------------- 内部方法 -----------------
+
+    def _build_session(self) -> requests.Session:
+        retry = _CappedRetry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=_RETRY_STATUSES,
+            allowed_methods=_IDEMPOTENT,
+            raise_on_status=False,
+            max_retry_after=self.max_retry_delay,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_hosts, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.cookies.set_policy(_no_cookies())
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt)
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        """Retry-After 的秒数，按 ``max_retry_delay`` 截断"""
+        try:
+            return min(max(0.0, float(response.headers.get("retry-after", ""))), self.max_retry_delay)
+        except ValueError:
+            return None
+
+
+http_client = HttpClient(
+    pool_hosts=config.HTTP_POOL_HOSTS,
+    pool_maxsize=config.HTTP_POOL_MAXSIZE,
+    max_connections=config.HTTP_MAX_CONNECTIONS,
+    retries=config.HTTP_RETRIES,
+    backoff=config.HTTP_RETRY_BACKOFF,
+    max_retry_delay=config.HTTP_RETRY_MAX_DELAY,
+)
@@ -0,0 +1,141 @@
+"""Declarative per-tool response cache with stale-while-revalidate.
+
+工具在类上声明 ``cache_ttl``（秒）即启用结果缓存（见 ``QwenAgentBaseTool.call``）：
+
+- 缓存键由工具名与归一化后的参数构成：补全 schema 中的默认值、去掉空值、
+  字符串去首尾空白、按键排序，``{"q": " x "}`` 与 ``{"q": "x", "limit": 5}`` 命中同一条目；
+- 条目在 ``cache_ttl`` 内直接返回；过期后 ``cache_stale`` 秒内仍先返回旧结果，
+  同时在后台刷新（stale-while-revalidate）；
+- 只缓存成功的结果（返回 ``"status": "error"`` / ``"error"`` 的结果与异常不缓存）；
+- 存储为进程内 LRU，可选写穿到 SQLite（``TOOL_CACHE_PATH``），命中情况记录到
+  ``tool_cache.requests{tool,outcome}`` 指标。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from server import config
+from server.cache import TTLCache
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_args(args: Dict[str, Any], schema: Any = None) -> str:
+    """参数的规范化 JSON（补全默认值、去掉空值与字符串首尾空白、按键排序）"""
+    properties = schema.get("properties", {}) if isinstance(schema, dict) else {}
+    merged = {name: spec["default"] for name, spec in properties.items()
+              if isinstance(spec, dict) and "default" in spec}
+    for key, value in (args or {}).items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        merged[key] = value
+    return json.dumps(merged, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def is_cacheable(result: Any) -> bool:
+    """默认的可缓存判断：字符串结果，且不是错误结果"""
+    if not isinstance(result, str):
+        return False
+    try:
+        payload = json.loads(result)
+    except ValueError:
+        return True
+    if isinstance(payload, dict):
+        return payload.get("status") != "error" and "error" not in payload
+    return True
+
+
+class ToolResponseCache:
+    """工具结果缓存（所有工具共用一个 LRU，按工具声明的 TTL 过期）"""
+
+    def __init__(self, maxsize: int, persist_path: Optional[str] = None, refresh_workers: int = 2):
+        self._cache = TTLCache(name="tool", maxsize=maxsize, ttl=0, persist_path=persist_path)
+        self._workers = max(1, refresh_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache.enabled
+
+    @staticmethod
+    def key(tool: str, args: Dict[str, Any], schema: Any = None) -> str:
+        raw = f"{tool}\x1f{normalize_args(args, schema)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Tuple[Optional[str], bool]:
+        """返回 (结果, 是否仍新鲜)；不存在或已超过 stale 窗口时返回 (None, False)"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None, False
+        fresh_until, result = entry
+        return result, time.time() < fresh_until
+
+    def set(self, key: str, result: str, ttl: float, stale: float) -> None:
+        self._cache.set(key, (time.time() + ttl, result), ttl=ttl + stale)
+
+    def call(self, tool: str, key: str, ttl: float, stale: float, compute: Callable[[], Any],
+             cacheable: Callable[[Any], bool] = is_cacheable) -> Any:
+        """读缓存；未命中时执行 ``compute`` 并写入，过期（stale）时返回旧结果并在后台刷新"""
+        result, fresh = self.get(key)
+        if result is not None:
+            metrics.inc("tool_cache.requests", tool=tool, outcome="hit" if fresh else "stale")
+            if not fresh:
+                self._revalidate(tool, key, ttl, stale, compute, cacheable)
+            return result
+        metrics.inc("tool_cache.requests", tool=tool, outcome="miss")
+        result = compute()
+        if cacheable(result):
+            self.set(key, result, ttl, stale)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    # ----------------- 内部方法 -----------------
+
+    def _revalidate(self, tool: str, key: str, ttl: float, stale: float, compute: Callable[[], Any],
+                    cacheable: Callable[[Any], bool]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="tool-cache")
+        self._executor.submit(self._refresh, tool, key, ttl, stale, compute, cacheable)
+
+    def _refresh(self, tool: str, key: str, ttl: float, stale: float, compute: Callable[[], Any],
+                 cacheable: Callable[[Any], bool]) -> None:
+        try:
+            result = compute()
+            if cacheable(result):
+                self.set(key, result, ttl, stale)
+                metrics.inc("tool_cache.refreshes", tool=tool, outcome="ok")
+            else:
+                # 刷新失败时保留旧结果，直到 stale 窗口结束
+                metrics.inc("tool_cache.refreshes", tool=tool, outcome="error")
+        except Exception as e:
+            metrics.inc("tool_cache.refreshes", tool=tool, outcome="error")
+            logger.warning("Tool cache: refresh of %s failed: %s", tool, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+tool_cache = ToolResponseCache(
+    maxsize=config.TOOL_CACHE_SIZE,
+    persist_path=config.TOOL_CACHE_PATH or None,
+    refresh_workers=config.TOOL_CACHE_REFRESH_WORKERS,
+)
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import codecs
 import json
-from typing import Dict, Tuple
+import re
+from typing import Any, Dict, Iterable, Iterator, Tuple
 
+import httpx
 import requests
 
+from tools.core.http_client import http_client
+
 HTTP_TIMEOUT = 30
 
+_JSON_SPACE = re.compile(r"\s*")
+_JSON_SKIP = re.compile(r"[\s,]*")
+
 
 def normalize_base(url: str) -> str:
     if url.startswith("http://") or url.startswith("https://"):
@@ -16,7 +24,7 @@ def normalize_base(url: str) -> str:
 
 def safe_get_json(url: str, timeout: int = HTTP_TIMEOUT) -> Tuple[str, Dict]:
     try:
-        resp = requests.get(url, timeout=timeout)
+        resp = http_client.get(url, timeout=timeout)
         resp.raise_for_status()
         return "ok", resp.json()
     except requests.RequestException as exc:
@@ -25,12 +33,84 @@ def safe_get_json(url: str, timeout: int = HTTP_TIMEOUT) -> Tuple[str, Dict]:
 
 def safe_post_json(url: str, payload: Dict, timeout: int = HTTP_TIMEOUT) -> Tuple[str, Dict]:
     try:
-        resp = requests.post(url, json=payload, timeout=timeout)
+        resp = http_client.post(url, json=payload, timeout=timeout)
         resp.raise_for_status()
         return "ok", resp.json()
     except requests.RequestException as exc:
         return "error", {"error": str(exc)}
 
 
+async def safe_aget_json(url: str, timeout: int = HTTP_TIMEOUT) -> Tuple[str, Dict]:
+    try:
+        resp = await http_client.aget(url, timeout=timeout)
+        resp.raise_for_status()
+        return "ok", resp.json()
+    except (httpx.HTTPError, ValueError) as exc:
+        return "error", {"error": str(exc)}
+
+
+async def safe_apost_json(url: str, payload: Dict, timeout: int = HTTP_TIMEOUT) -> Tuple[str, Dict]:
+    try:
+        resp = await http_client.apost(url, json=payload, timeout=timeout)
+        resp.raise_for_status()
+        return "ok", resp.json()
+    except (httpx.HTTPError, ValueError) as exc:
+        return "error", {"error": str(exc)}
+
+
 def dump(obj: Dict) -> str:
     return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    增量解析顶层为数组的 JSON 字节流（如 ``resp.iter_content()``），逐个产出数组元素。
+
+    每次只解码当前元素，不构建整个数组的对象树，也不需要先拿到完整响应体。
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf, pos = "", 0
+
+    def _more() -> bool:
+        nonlocal buf, pos
+        for chunk in chunks:
+            if chunk:
+                buf, pos = buf[pos:] + utf8.decode(chunk), 0
+                return True
+        return False
+
+    while True:
+        pos = _JSON_SPACE.match(buf, pos).end()
+        if pos < len(buf):
+            break
+        if not _more():
+            raise ValueError("empty JSON document")
+    if buf[pos] != "[":
+        raise ValueError("JSON document is not an array")
+    pos += 1
+
+    while True:
+        pos = _JSON_SKIP.match(buf, pos).end()
+        if pos >= len(buf):
+            if not _more():
+                raise ValueError("unterminated JSON array")
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # 元素跨越了分块边界，读入更多数据后重试
+            if not _more():
+                raise
+            continue
+        after = _JSON_SPACE.match(buf, end).end()
+        if after >= len(buf) or buf[after] not in ",]":
+            # 元素后面必须紧跟 "," 或 "]"，否则可能是被分块截断的数字（"12" | "3.5"），补齐后重新解析
+            if not _more():
+                raise ValueError(f"unexpected data after array element at {after}")
+            continue
+        yield item
+        pos = after
@@ -1,47 +1,126 @@
-"""Foreign exchange rate tool using exchangerate-api.com."""
+"""Foreign exchange rate tool using exchangerate-api.com.
+
+只拉取一张以 ``FX_TABLE_BASE`` 为基准的 conversion_rates 汇率表并在本地缓存，
+有效期与接口返回的 ``time_next_update_unix`` 对齐；任意货币对由同一张表交叉换算
+（base -> quote = table[quote] / table[base]），表过期前的调用不再访问网络。
+"""
 
 from __future__ import annotations
 
 import os
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from qwen_agent.tools.base import register_tool
 from tools.core.base import QwenAgentBaseTool
 from tools.core.utils import dump, safe_get_json
 
+from server import config
+from server.cache import TTLCache
+from server.metrics import metrics
+
 API_BASE = "https://v6.exchangerate-api.com/v6"
 API_KEY = os.getenv("EXCHANGE_RATE_API_KEY")
+# 接口给出的下次更新时间已过或即将到来时，至少缓存这么久（秒），避免反复回源
+_MIN_TABLE_TTL = 60
+_MAX_QUOTES = 20
+
+_rate_tables = TTLCache(name="fx", maxsize=4, ttl=config.FX_TABLE_TTL, persist_path=config.FX_CACHE_PATH or None)
+# 表过期时只让一个调用回源，其余调用等待后直接读缓存
+_fetch_lock = threading.Lock()
+
 
 @register_tool("fx_rate")
 class ForexRateTool(QwenAgentBaseTool):
-    description = "查询两种货币的实时汇率。"
+    description = "查询货币汇率，可一次查询一种基准货币到多种目标货币的汇率。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
             "base": {"type": "string", "description": "基准货币，默认 USD"},
             "quote": {"type": "string", "description": "目标货币，默认 CNY"},
+            "quotes": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": f"可选，一次查询多种目标货币（最多 {_MAX_QUOTES} 种），如 [\"CNY\", \"EUR\", \"JPY\"]",
+            },
         },
         "required": [],
     }
 
     def _execute_tool(self, params: Dict[str, Any], **_: Any) -> str:
         args = self._verify_json_format_args(params or {})
-        base = (args.get("base") or "USD").upper()
-        quote = (args.get("quote") or "CNY").upper()
+        base = (args.get("base") or "USD").strip().upper()
+        quotes = _requested_quotes(args)
+        if len(quotes) > _MAX_QUOTES:
+            return dump({"task": "fx_rate", "status": "error", "error": f"一次最多查询 {_MAX_QUOTES} 种货币"})
         if not API_KEY:
             return dump({"task": "fx_rate", "status": "error", "error": "缺少 EXCHANGE_RATE_API_KEY"})
-        status, payload = safe_get_json(f"{API_BASE}/{API_KEY}/latest/{base}")
+
+        status, table = _rate_table()
         if status == "error":
-            return dump({"task": "fx_rate", "status": status, "error": payload.get("error")})
+            return dump({"task": "fx_rate", "status": status, "error": table})
+
+        rates = [(quote, cross_rate(table["rates"], base, quote)) for quote in quotes]
+        if len(rates) == 1:
+            quote, rate = rates[0]
+            if rate is None:
+                return dump({"task": "fx_rate", "status": "error", "error": f"无法获取 {base}->{quote} 汇率"})
+            return f"{base} -> {quote} 汇率: {rate}"
+        lines = [f"{base} -> {quote} 汇率: {rate}" if rate is not None else f"无法获取 {base}->{quote} 汇率"
+                 for quote, rate in rates]
+        if table.get("updated"):
+            lines.append(f"(数据更新时间: {table['updated']})")
+        return "\n".join(lines)
+
+
+def cross_rate(rates: Dict[str, float], base: str, quote: str) -> Optional[float]:
+    """用同一张汇率表换算 base -> quote；表的基准货币对应的汇率为 1"""
+    base_rate = rates.get(base)
+    quote_rate = rates.get(quote)
+    if not base_rate or quote_rate is None:
+        return None
+    if base_rate == 1:
+        return quote_rate
+    # 交叉换算的结果保留 6 位有效数字，与接口给出的精度相当
+    return float(f"{quote_rate / base_rate:.6g}")
+
+
+def _requested_quotes(args: Dict[str, Any]) -> List[str]:
+    names = list(args.get("quotes") or [])
+    if args.get("quote") or not names:
+        names.insert(0, args.get("quote") or "CNY")
+    return list(dict.fromkeys(name.strip().upper() for name in names if isinstance(name, str) and name.strip()))
+
+
+def _rate_table() -> Tuple[str, Any]:
+    """返回 ("ok", {"rates": ..., "updated": ...})，过期前直接使用本地缓存的汇率表"""
+    cache_key = f"latest/{config.FX_TABLE_BASE}"
+    table = _rate_tables.get(cache_key)
+    if table is not None:
+        return "ok", table
+    with _fetch_lock:
+        table = _rate_tables.get(cache_key)
+        if table is not None:
+            return "ok", table
+        metrics.inc("fx.table_fetches")
+        status, payload = safe_get_json(f"{API_BASE}/{API_KEY}/latest/{config.FX_TABLE_BASE}")
+        if status == "error":
+            return status, payload.get("error")
         if payload.get("result") != "success":
-            return dump(
-                {
-                    "task": "fx_rate",
-                    "status": "error",
-                    "error": payload.get("error-type") or payload.get("error") or "汇率接口返回失败",
-                }
-            )
-        rate = (payload.get("conversion_rates") or {}).get(quote)
-        if rate is None:
-            return dump({"task": "fx_rate", "status": "error", "error": f"无法获取 {base}->{quote} 汇率"})
-        return f"{base} -> {quote} 汇率: {rate}"
+            return "error", payload.get("error-type") or payload.get("error") or "汇率接口返回失败"
+        table = {
+            "rates": payload.get("conversion_rates") or {},
+            "updated": payload.get("time_last_update_utc"),
+        }
+        _rate_tables.set(cache_key, table, ttl=_table_ttl(payload))
+        return "ok", table
+
+
+def _table_ttl(payload: Dict[str, Any]) -> float:
+    """汇率表的有效期：到接口给出的下次更新时间为止（缺失时使用 FX_TABLE_TTL）"""
+    next_update = payload.get("time_next_update_unix")
+    if not isinstance(next_update, (int, float)):
+        return config.FX_TABLE_TTL
+    return max(_MIN_TABLE_TTL, next_update - time.time())
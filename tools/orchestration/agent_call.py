@@ -22,6 +22,9 @@ class AgentCallTool(QwenAgentBaseTool):
     返回：子Agent的完整回复文本（包含其工具调用结果的最终自然语言输出）。
     """
 
+    # 子 Agent 可能调用有副作用的工具（如发送邮件），按串行执行
+    side_effect_free = False
+
     def __init__(self, agents: Dict[str, Agent]):
         super().__init__()
         # 这里用 dict 存所有子 agent，key 用 agent.name
@@ -23,6 +23,8 @@ def _normalize_limit(raw: Any, default: int = 5, max_value: int = 20) -> int:
 @register_tool("art_search")
 class ArtSearchTool(QwenAgentBaseTool):
     description = "在芝加哥艺术学院（AIC）数据库中检索艺术品。"
+    cache_ttl = 86400
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -24,6 +24,8 @@ def _normalize_limit(raw: Any, default: int = 5, max_value: int = 20) -> int:
 @register_tool("book_search")
 class BookSearchTool(QwenAgentBaseTool):
     description = "在 Open Library 中搜索图书与作者信息。"
+    cache_ttl = 86400
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -80,6 +82,8 @@ class BookSearchTool(QwenAgentBaseTool):
 @register_tool("gutenberg_search")
 class GutenbergSearchTool(QwenAgentBaseTool):
     description = "搜索古登堡公共领域书库（Gutendex）。"
+    cache_ttl = 86400
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
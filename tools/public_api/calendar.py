@@ -16,6 +16,9 @@ NAMEDAY_BASE = "https://nameday.abalin.net/api/V1"
 @register_tool("public_holidays")
 class PublicHolidaysTool(QwenAgentBaseTool):
     description = "查询指定国家/年份的公共节假日列表（Nager.Date）。"
+    # 节假日按国家/年份固定，结果缓存 7 天
+    cache_ttl = 7 * 86400
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -69,6 +72,9 @@ class PublicHolidaysTool(QwenAgentBaseTool):
 @register_tool("nameday_lookup")
 class NamedayLookupTool(QwenAgentBaseTool):
     description = "查询指定日期的姓名节（Namedays Calendar）。"
+    # 命名日按日期固定，结果缓存 30 天
+    cache_ttl = 30 * 86400
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
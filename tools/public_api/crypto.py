@@ -1,16 +1,43 @@
-"""Cryptocurrency public APIs: CoinCap and Coinpaprika."""
+"""Cryptocurrency market tools backed by a shared Coinpaprika snapshot.
+
+``crypto_price`` 与 ``crypto_market`` 都从同一份内存中的行情快照作答：快照来自 Coinpaprika
+``/v1/tickers``（数千个币种），按列存储（字符串列用 list，数值列用 ``array``），并建有
+符号/ID/名称到行号的索引；首次使用后由后台线程每 ``CRYPTO_SNAPSHOT_INTERVAL`` 秒刷新一次，
+超过 ``CRYPTO_SNAPSHOT_IDLE`` 秒无人查询时暂停刷新。回源时流式解析响应，不构建整个 JSON 对象树。
+"""
 
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import heapq
+import logging
+import math
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import requests
 from qwen_agent.tools.base import register_tool
 
+from server import config
+from server.metrics import metrics
 from tools.core.base import QwenAgentBaseTool
-from tools.core.utils import dump, safe_get_json
+from tools.core.http_client import http_client
+from tools.core.utils import HTTP_TIMEOUT, dump, iter_json_array
+
+logger = logging.getLogger(__name__)
 
-COINCAP_ASSET = "https://api.coincap.io/v2/assets"
 COINPAPRIKA_TICKER = "https://api.coinpaprika.com/v1/tickers"
+_MAX_SYMBOLS = 20
+# 可排序的数值列
+SORT_FIELDS = ("rank", "price_usd", "volume_24h", "market_cap", "change_24h")
+# 数值列对应的 tickers.quotes.USD 字段
+_USD_FIELDS = {
+    "price_usd": "price",
+    "volume_24h": "volume_24h",
+    "market_cap": "market_cap",
+    "change_24h": "percent_change_24h",
+}
 
 
 def _normalize_limit(raw: Any, default: int = 5, max_value: int = 20) -> int:
@@ -21,9 +48,163 @@ def _normalize_limit(raw: Any, default: int = 5, max_value: int = 20) -> int:
     return max(1, min(value, max_value))
 
 
+class MarketSnapshot:
+    """一次 tickers 拉取结果的列式存储；行按 rank 升序排列，缺失的数值与未上榜（rank ≤ 0）的排名为 NaN"""
+
+    __slots__ = ("fetched_at", "ids", "symbols", "names", "columns", "_index")
+
+    def __init__(self, tickers: Iterable[Dict[str, Any]]):
+        self.fetched_at = time.time()
+        self.ids: List[str] = []
+        self.symbols: List[str] = []
+        self.names: List[str] = []
+        self.columns: Dict[str, array] = {field: array("d") for field in SORT_FIELDS}
+        for item in tickers:
+            usd = (item.get("quotes") or {}).get("USD") or {}
+            self.ids.append(item.get("id") or "")
+            self.symbols.append(item.get("symbol") or "")
+            self.names.append(item.get("name") or "")
+            rank = _number(item.get("rank"))
+            self.columns["rank"].append(rank if rank > 0 else math.nan)
+            for field, key in _USD_FIELDS.items():
+                self.columns[field].append(_number(usd.get(key)))
+        self._sort_by_rank()
+        # 同一符号可能对应多个币种，保留排名最靠前的一个（行已按 rank 排序，先到先得）
+        self._index: Dict[str, int] = {}
+        for row in range(len(self.ids)):
+            for key in (self.symbols[row].upper(), self.ids[row].lower(), self.names[row].lower()):
+                if key:
+                    self._index.setdefault(key, row)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def find(self, query: str) -> Optional[int]:
+        """按符号（BTC）、Coinpaprika ID（btc-bitcoin）或名称（Bitcoin）查找行号"""
+        query = query.strip()
+        row = self._index.get(query.upper())
+        return row if row is not None else self._index.get(query.lower())
+
+    def top(self, limit: int, sort_by: str = "rank", descending: Optional[bool] = None) -> List[int]:
+        """按任意数值列排序取前 ``limit`` 行（rank 默认升序，其余默认降序），跳过缺失值"""
+        column = self.columns[sort_by]
+        if descending is None:
+            descending = sort_by != "rank"
+        if sort_by == "rank" and not descending:
+            # 行已按 rank 升序排列、未上榜的在最后：直接取前 limit 行
+            return [row for row in range(min(limit, len(column))) if not math.isnan(column[row])]
+        rows = (row for row in range(len(column)) if not math.isnan(column[row]))
+        pick = heapq.nlargest if descending else heapq.nsmallest
+        return pick(limit, rows, key=column.__getitem__)
+
+    def row(self, row: int) -> Dict[str, Any]:
+        values = {field: self.columns[field][row] for field in SORT_FIELDS}
+        result = {
+            "id": self.ids[row],
+            "symbol": self.symbols[row],
+            "name": self.names[row],
+            "rank": None if math.isnan(values["rank"]) else int(values["rank"]),
+        }
+        for field in _USD_FIELDS:
+            result[field] = None if math.isnan(values[field]) else values[field]
+        return result
+
+    def _sort_by_rank(self) -> None:
+        ranks = self.columns["rank"]
+        # 接口已按 rank 返回时无需重排；未上榜（rank 为 NaN）的按原顺序排在最后
+        order = sorted(range(len(ranks)), key=lambda row: (not ranks[row] > 0, ranks[row] if ranks[row] > 0 else 0.0))
+        if order == list(range(len(ranks))):
+            return
+        self.ids = [self.ids[row] for row in order]
+        self.symbols = [self.symbols[row] for row in order]
+        self.names = [self.names[row] for row in order]
+        self.columns = {field: array("d", (column[row] for row in order)) for field, column in self.columns.items()}
+
+
+class MarketSnapshotService:
+    """
+    Shared, background-refreshed market snapshot.
+
+    首次查询时同步拉取并启动后台刷新线程；快照超过两个刷新周期未更新（如刷新暂停或失败）时，
+    下一次查询同步回源。回源失败时继续使用旧快照。
+    """
+
+    def __init__(self, url: str = COINPAPRIKA_TICKER, interval: float = config.CRYPTO_SNAPSHOT_INTERVAL,
+                 idle: float = config.CRYPTO_SNAPSHOT_IDLE):
+        self.url = url
+        self.interval = max(1.0, interval)
+        self.idle = idle
+        self._snapshot: Optional[MarketSnapshot] = None
+        self._last_access = 0.0
+        self._refresh_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> Tuple[str, Any]:
+        """返回 ("ok", MarketSnapshot) 或 ("error", 错误信息)"""
+        self._last_access = time.time()
+        snapshot = self._snapshot
+        if snapshot is None or time.time() - snapshot.fetched_at > 2 * self.interval:
+            snapshot, error = self._refresh(previous=snapshot)
+            if snapshot is None:
+                return "error", error
+        self._ensure_refresher()
+        return "ok", snapshot
+
+    def refresh(self) -> MarketSnapshot:
+        """回源并替换快照（流式解析 tickers 数组）；失败时抛出 requests.RequestException / ValueError"""
+        start = time.perf_counter()
+        with http_client.get(self.url, headers={"Accept": "application/json"}, timeout=HTTP_TIMEOUT,
+                             stream=True) as resp:
+            resp.raise_for_status()
+            snapshot = MarketSnapshot(iter_json_array(resp.iter_content(chunk_size=64 * 1024)))
+        if not len(snapshot):
+            raise ValueError("empty tickers response")
+        self._snapshot = snapshot
+        metrics.observe("crypto.snapshot_seconds", time.perf_counter() - start)
+        metrics.set_gauge("crypto.snapshot_rows", len(snapshot))
+        return snapshot
+
+    # ----------------- 内部方法 -----------------
+
+    def _refresh(self, previous: Optional[MarketSnapshot]) -> Tuple[Optional[MarketSnapshot], Optional[str]]:
+        with self._refresh_lock:
+            # 等锁期间其他调用可能已经刷新
+            if self._snapshot is not previous:
+                return self._snapshot, None
+            try:
+                snapshot = self.refresh()
+                metrics.inc("crypto.snapshot_refreshes", outcome="ok")
+                return snapshot, None
+            except (requests.RequestException, ValueError) as exc:
+                metrics.inc("crypto.snapshot_refreshes", outcome="error")
+                logger.warning("Crypto snapshot refresh failed: %s", exc)
+                return previous, str(exc)
+
+    def _ensure_refresher(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refresh_loop, name="crypto-snapshot", daemon=True)
+                self._thread.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if self.idle and time.time() - self._last_access > self.idle:
+                # 长时间无人查询：结束线程，下一次查询时重新启动
+                return
+            self._refresh(previous=self._snapshot)
+
+
+market_snapshot = MarketSnapshotService()
+
+
 @register_tool("crypto_price")
 class CryptoPriceTool(QwenAgentBaseTool):
-    description = "查询加密货币价格（CoinCap）。"
+    description = "查询加密货币价格（Coinpaprika），可一次查询多个币种。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -31,48 +212,49 @@ class CryptoPriceTool(QwenAgentBaseTool):
                 "type": "string",
                 "description": "币种符号，如 BTC、ETH",
             },
+            "symbols": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": f"可选，一次查询多个币种（最多 {_MAX_SYMBOLS} 个），如 [\"BTC\", \"ETH\", \"SOL\"]",
+            },
         },
-        "required": ["symbol"],
+        "required": [],
     }
 
     def _execute_tool(self, params: Dict[str, Any], **_: Any) -> str:
         args = self._verify_json_format_args(params)
-        symbol = (args.get("symbol") or "").strip().upper()
-        if not symbol:
+        symbols = _requested_symbols(args)
+        if not symbols:
             return dump({"task": "crypto_price", "status": "error", "error": "symbol 不能为空"})
+        if len(symbols) > _MAX_SYMBOLS:
+            return dump({"task": "crypto_price", "status": "error", "error": f"一次最多查询 {_MAX_SYMBOLS} 个币种"})
 
-        status, payload = safe_get_json(f"{COINCAP_ASSET}?search={symbol}")
+        status, snapshot = market_snapshot.snapshot()
         if status == "error":
-            return dump({"task": "crypto_price", "status": status, "error": payload.get("error")})
-
-        data = payload.get("data") or []
-        match = None
-        for item in data:
-            if (item.get("symbol") or "").upper() == symbol:
-                match = item
-                break
-        if not match:
-            match = data[0] if data else None
-        if not match:
-            return dump({"task": "crypto_price", "status": "error", "error": f"未找到币种 {symbol}"})
+            return dump({"task": "crypto_price", "status": status, "error": snapshot})
 
-        return dump(
-            {
-                "task": "crypto_price",
-                "status": "ok",
-                "symbol": match.get("symbol"),
-                "name": match.get("name"),
-                "price_usd": match.get("priceUsd"),
-                "change_24h": match.get("changePercent24Hr"),
-                "market_cap": match.get("marketCapUsd"),
-                "rank": match.get("rank"),
-            }
-        )
+        results = []
+        missing = []
+        for symbol in symbols:
+            row = snapshot.find(symbol)
+            if row is None:
+                missing.append(symbol)
+            else:
+                results.append(_price_item(snapshot.row(row)))
+        if len(symbols) == 1:
+            if not results:
+                return dump({"task": "crypto_price", "status": "error", "error": f"未找到币种 {symbols[0]}"})
+            return dump({"task": "crypto_price", "status": "ok", **results[0]})
+        payload = {"task": "crypto_price", "status": "ok", "count": len(results), "results": results}
+        if missing:
+            payload["missing"] = missing
+        return dump(payload)
 
 
 @register_tool("crypto_market")
 class CryptoMarketTool(QwenAgentBaseTool):
-    description = "获取加密货币市场概览（Coinpaprika）。"
+    description = "获取加密货币市场概览（Coinpaprika），可按市值、价格、成交量、24 小时涨跌幅等排序。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -83,6 +265,17 @@ class CryptoMarketTool(QwenAgentBaseTool):
                 "default": 5,
                 "description": "返回结果条数，默认 5，最大 20",
             },
+            "sort_by": {
+                "type": "string",
+                "enum": list(SORT_FIELDS),
+                "default": "rank",
+                "description": "排序字段：rank（排名）、price_usd、volume_24h、market_cap、change_24h（24 小时涨跌幅）",
+            },
+            "order": {
+                "type": "string",
+                "enum": ["asc", "desc"],
+                "description": "排序方向，默认 rank 升序、其他字段降序（如 change_24h 升序即跌幅榜）",
+            },
         },
         "required": [],
     }
@@ -90,31 +283,48 @@ class CryptoMarketTool(QwenAgentBaseTool):
     def _execute_tool(self, params: Dict[str, Any], **_: Any) -> str:
         args = self._verify_json_format_args(params or {})
         limit = _normalize_limit(args.get("limit"))
-        status, payload = safe_get_json(COINPAPRIKA_TICKER)
+        sort_by = args.get("sort_by") or "rank"
+        if sort_by not in SORT_FIELDS:
+            return dump({"task": "crypto_market", "status": "error", "error": f"不支持的排序字段: {sort_by}"})
+        order = args.get("order")
+        descending = None if order not in ("asc", "desc") else order == "desc"
+
+        status, snapshot = market_snapshot.snapshot()
         if status == "error":
-            return dump({"task": "crypto_market", "status": status, "error": payload.get("error")})
-
-        items: List[Dict[str, Any]] = []
-        for item in (payload or [])[:limit]:
-            quotes = item.get("quotes") or {}
-            usd = quotes.get("USD") or {}
-            items.append(
-                {
-                    "id": item.get("id"),
-                    "symbol": item.get("symbol"),
-                    "name": item.get("name"),
-                    "rank": item.get("rank"),
-                    "price_usd": usd.get("price"),
-                    "volume_24h": usd.get("volume_24h"),
-                    "market_cap": usd.get("market_cap"),
-                }
-            )
+            return dump({"task": "crypto_market", "status": status, "error": snapshot})
 
+        items = [snapshot.row(row) for row in snapshot.top(limit, sort_by, descending)]
         return dump(
             {
                 "task": "crypto_market",
                 "status": "ok",
+                "sort_by": sort_by,
                 "count": len(items),
                 "results": items,
             }
         )
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _requested_symbols(args: Dict[str, Any]) -> List[str]:
+    names = list(args.get("symbols") or [])
+    if args.get("symbol"):
+        names.insert(0, args["symbol"])
+    return list(dict.fromkeys(name.strip().upper() for name in names if isinstance(name, str) and name.strip()))
+
+
+def _price_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "symbol": row["symbol"],
+        "name": row["name"],
+        "price_usd": row["price_usd"],
+        "change_24h": row["change_24h"],
+        "market_cap": row["market_cap"],
+        "rank": row["rank"],
+    }
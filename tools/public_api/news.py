@@ -23,6 +23,7 @@ def _normalize_limit(raw: Any, default: int = 5, max_value: int = 20) -> int:
 @register_tool("spaceflight_news")
 class SpaceflightNewsTool(QwenAgentBaseTool):
     description = "获取航天新闻（Spaceflight News）。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -23,6 +23,8 @@ def _normalize_limit(raw: Any, default: int = 5, max_value: int = 20) -> int:
 @register_tool("poetry_search")
 class PoetrySearchTool(QwenAgentBaseTool):
     description = "从 PoetryDB 搜索诗歌（按作者或标题）。"
+    cache_ttl = 7 * 86400
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
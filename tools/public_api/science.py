@@ -10,6 +10,7 @@ import requests
 from qwen_agent.tools.base import register_tool
 
 from tools.core.base import QwenAgentBaseTool
+from tools.core.http_client import http_client
 from tools.core.utils import dump, HTTP_TIMEOUT
 
 ARXIV_API = "http://export.arxiv.org/api/query"
@@ -26,7 +27,7 @@ def _normalize_limit(raw: Any, default: int = 5, max_value: int = 20) -> int:
 
 def _safe_get_text(url: str) -> Dict[str, Any]:
     try:
-        resp = requests.get(url, timeout=HTTP_TIMEOUT)
+        resp = http_client.get(url, timeout=HTTP_TIMEOUT)
         resp.raise_for_status()
         return {"status": "ok", "text": resp.text}
     except requests.RequestException as exc:
@@ -36,6 +37,9 @@ def _safe_get_text(url: str) -> Dict[str, Any]:
 @register_tool("arxiv_search")
 class ArxivSearchTool(QwenAgentBaseTool):
     description = "在 arXiv 中检索论文（Atom feed）。"
+    # arXiv 每天更新，检索结果缓存 1 小时
+    cache_ttl = 3600
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -128,6 +132,7 @@ class ArxivSearchTool(QwenAgentBaseTool):
 @register_tool("launches")
 class LaunchLibraryTool(QwenAgentBaseTool):
     description = "获取航天发射任务列表（Launch Library 2）。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -16,6 +16,7 @@ BORED_API = "https://www.boredapi.com/api/activity"
 @register_tool("get_public_ip")
 class PublicIPTool(QwenAgentBaseTool):
     description = "获取公网 IP（IPify）。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {},
@@ -34,6 +35,7 @@ class PublicIPTool(QwenAgentBaseTool):
 @register_tool("random_activity")
 class RandomActivityTool(QwenAgentBaseTool):
     description = "随机推荐活动（Bored API）。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -38,6 +38,7 @@ class DuckDuckGoSearch(QwenAgentBaseTool):
 
     name = "duckduckgo_search"
     description = "使用 DuckDuckGo 搜索公开网页，返回标题、摘要与链接。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
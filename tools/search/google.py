@@ -15,17 +15,19 @@
 import os
 from typing import Any, List, Union
 
-import requests
 from qwen_agent.tools.base import register_tool
 
 from server import config
 from tools.core.base import QwenAgentBaseTool
+from tools.core.http_client import http_client
+from tools.core.utils import HTTP_TIMEOUT
 
 
 @register_tool('google_web_search', allow_overwrite=True)
 class GoogleWebSearch(QwenAgentBaseTool):
     name = 'google_web_search'
     description = 'Search for information from the internet.'
+    side_effect_free = True
     parameters = {
         'type': 'object',
         'properties': {
@@ -52,7 +54,7 @@ class GoogleWebSearch(QwenAgentBaseTool):
             )
         headers = {'Content-Type': 'application/json', 'X-API-KEY': config.SERPER_API_KEY}
         payload = {'q': query}
-        response = requests.post(config.SERPER_URL, json=payload, headers=headers)
+        response = http_client.post(config.SERPER_URL, json=payload, headers=headers, timeout=HTTP_TIMEOUT)
         response.raise_for_status()
 
         return response.json()['organic']
@@ -16,6 +16,8 @@ from tools.core.utils import dump
 @register_tool("send_email")
 class SendEmailTool(QwenAgentBaseTool):
     description = "发送电子邮件，支持HTML和纯文本格式。需要配置SMTP服务器信息。"
+    # 发送邮件有副作用：不与其他工具调用并行，也不会因超时被放弃
+    side_effect_free = False
     parameters = {
         "type": "object",
         "properties": {
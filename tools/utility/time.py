@@ -14,6 +14,7 @@ DEFAULT_TZ = "Asia/Shanghai"
 @register_tool("current_time")
 class CurrentTimeTool(QwenAgentBaseTool):
     description = "获取当前时间，支持指定时区，返回 ISO8601 与格式化时间。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
@@ -1,70 +1,165 @@
-"""Weather lookup using open-meteo without API key."""
+"""Weather lookup using open-meteo without API key.
+
+城市坐标缓存在 ``geocode`` 缓存中（LRU，可选 SQLite 持久化），重复查询的城市不再请求地理编码接口；
+多个城市的预报合并为一次 open-meteo 请求（逗号分隔的经纬度），当前天气按保留两位小数的坐标
+（约 1 km）短期缓存。请求只要求渲染用到的 ``current_weather`` 字段。
+"""
 
 from __future__ import annotations
 
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlencode
 
 from qwen_agent.tools.base import register_tool
 from tools.core.base import QwenAgentBaseTool
 from tools.core.utils import dump, safe_get_json
 
+from server import config
+from server.cache import TTLCache
+
 GEOCODE_API = "https://geocoding-api.open-meteo.com/v1/search"
 FORECAST_API = "https://api.open-meteo.com/v1/forecast"
+# 预报缓存键的坐标精度（小数位），两位约 1 km
+_COORD_PRECISION = 2
+_MAX_CITIES = 10
+
+_geocode_cache = TTLCache(
+    name="geocode",
+    maxsize=config.WEATHER_GEOCODE_CACHE_SIZE,
+    ttl=config.WEATHER_GEOCODE_TTL,
+    persist_path=config.WEATHER_GEOCODE_CACHE_PATH or None,
+)
+_forecast_cache = TTLCache(name="forecast", maxsize=1024, ttl=config.WEATHER_FORECAST_TTL)
+_geocode_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="geocode")
+
 
 @register_tool("weather")
 class WeatherTool(QwenAgentBaseTool):
-    description = "查询城市当前天气与预报（使用 open-meteo 公共接口）。"
+    description = "查询城市当前天气与预报（使用 open-meteo 公共接口），可一次查询多个城市。"
+    side_effect_free = True
     parameters = {
         "type": "object",
         "properties": {
             "city": {
                 "type": "string",
-                "description": "城市名称，必填，如 Beijing、Shanghai、San Francisco"
+                "description": "城市名称，如 Beijing、Shanghai、San Francisco"
+            },
+            "cities": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": f"可选，一次查询多个城市（最多 {_MAX_CITIES} 个），如 [\"Beijing\", \"Tokyo\"]"
             }
         },
-        "required": ["city"],
+        "required": [],
     }
 
     def _execute_tool(self, params: Dict[str, Any], **_: Any) -> str:
         args = self._verify_json_format_args(params)
-        city = args["city"]
-        geo = _geocode_city(city)
-        if geo.get("status") == "error":
-            return dump(geo)
-
-        lat = geo["lat"]
-        lon = geo["lon"]
-        status, forecast = safe_get_json(
-            f"{FORECAST_API}?latitude={lat}&longitude={lon}&current_weather=true&hourly=temperature_2m,relativehumidity_2m,weathercode"
-        )
+        cities = _requested_cities(args)
+        if not cities:
+            return dump({"task": "weather", "status": "error", "error": "请提供 city 或 cities"})
+        if len(cities) > _MAX_CITIES:
+            return dump({"task": "weather", "status": "error", "error": f"一次最多查询 {_MAX_CITIES} 个城市"})
+
+        if len(cities) == 1:
+            geos = [_geocode_city(cities[0])]
+        else:
+            geos = list(_geocode_executor.map(_geocode_city, cities))
+        located = [geo for geo in geos if geo.get("status") == "ok"]
+        if not located:
+            return dump(geos[0] if len(geos) == 1 else {
+                "task": "weather", "status": "error", "error": "; ".join(geo["error"] for geo in geos)
+            })
+
+        status, forecasts = _current_weather([(geo["lat"], geo["lon"]) for geo in located])
         if status == "error":
-            return dump({"task": "weather", "status": status, "error": forecast.get("error")})
+            return dump({"task": "weather", "status": status, "error": forecasts})
+
+        blocks = []
+        current_iter = iter(forecasts)
+        for geo in geos:
+            if geo.get("status") != "ok":
+                blocks.append(f"{geo.get('city')}: {geo.get('error')}")
+                continue
+            blocks.append(_format_current(geo, next(current_iter)))
+        return "\n\n".join(blocks)
+
 
-        current = forecast.get("current_weather") or {}
-        temp = current.get("temperature")
-        wind = current.get("windspeed")
-        code = current.get("weathercode")
-        return (
-            f"{geo['name']} 当前天气\n"
-            f"- 温度: {temp}°C\n"
-            f"- 风速: {wind} km/h\n"
-            f"- 天气代码: {code}\n"
-            f"(lat={lat}, lon={lon})"
-        )
+def _requested_cities(args: Dict[str, Any]) -> List[str]:
+    names = list(args.get("cities") or [])
+    if args.get("city"):
+        names.insert(0, args["city"])
+    # 按小写去重并保持顺序
+    unique: Dict[str, str] = {}
+    for name in names:
+        if isinstance(name, str) and name.strip():
+            unique.setdefault(name.strip().lower(), name.strip())
+    return list(unique.values())
+
+
+def _format_current(geo: Dict[str, Any], current: Dict[str, Any]) -> str:
+    return (
+        f"{geo['name']} 当前天气\n"
+        f"- 温度: {current.get('temperature')}°C\n"
+        f"- 风速: {current.get('windspeed')} km/h\n"
+        f"- 天气代码: {current.get('weathercode')}\n"
+        f"(lat={geo['lat']}, lon={geo['lon']})"
+    )
+
+
+def _coord_key(lat: float, lon: float) -> str:
+    return f"{round(lat, _COORD_PRECISION)},{round(lon, _COORD_PRECISION)}"
+
+
+def _current_weather(coords: List[Tuple[float, float]]) -> Tuple[str, Any]:
+    """按坐标返回各地的 current_weather（与输入顺序一致）；未缓存的坐标合并为一次请求"""
+    keys = [_coord_key(lat, lon) for lat, lon in coords]
+    results: Dict[str, Dict[str, Any]] = {}
+    for key in keys:
+        cached = _forecast_cache.get(key)
+        if cached is not None:
+            results[key] = cached
+    missing = [key for key in dict.fromkeys(keys) if key not in results]
+    if missing:
+        query = urlencode({
+            "latitude": ",".join(key.split(",")[0] for key in missing),
+            "longitude": ",".join(key.split(",")[1] for key in missing),
+            "current_weather": "true",
+        })
+        status, payload = safe_get_json(f"{FORECAST_API}?{query}")
+        if status == "error":
+            return status, payload.get("error")
+        # 单个坐标时返回对象，多个坐标时返回同序的列表
+        items = payload if isinstance(payload, list) else [payload]
+        if len(items) != len(missing):
+            return "error", f"unexpected forecast response for {len(missing)} locations"
+        for key, item in zip(missing, items):
+            current = item.get("current_weather") or {}
+            results[key] = current
+            if current:
+                _forecast_cache.set(key, current)
+    return "ok", [results[key] for key in keys]
 
 
 def _geocode_city(city: str) -> Dict:
-    status, payload = safe_get_json(f"{GEOCODE_API}?name={city}&count=1&language=zh&format=json")
+    cache_key = city.strip().lower()
+    cached = _geocode_cache.get(cache_key)
+    if cached is not None:
+        return {"task": "weather", "status": "ok", "city": city, **cached}
+
+    query = urlencode({"name": city, "count": 1, "language": "zh", "format": "json"})
+    status, payload = safe_get_json(f"{GEOCODE_API}?{query}")
     if status == "error":
-        return {"task": "weather", "status": status, "error": payload.get("error")}
+        return {"task": "weather", "status": status, "city": city, "error": payload.get("error")}
     results = payload.get("results") or []
     if not results:
-        return {"task": "weather", "status": "error", "error": f"未找到城市: {city}"}
+        return {"task": "weather", "status": "error", "city": city, "error": f"未找到城市: {city}"}
     item = results[0]
-    return {
-        "task": "weather",
-        "status": "ok",
+    location = {
         "name": item.get("name") or city,
         "lat": item.get("latitude"),
         "lon": item.get("longitude"),
     }
+    _geocode_cache.set(cache_key, location)
+    return {"task": "weather", "status": "ok", "city": city, **location}